@@ -0,0 +1,150 @@
+"""
+bench/chrome_coldstart.py
+Chrome cold-start microbenchmark: launch-to-first-navigation time of one
+fresh browser, the cost chrome-runner pays every CHROME_MAX_NAVIGATIONS
+probes per pooled browser, per autoscale resize and per supervisor restart.
+
+Each iteration starts one browser per variant (round-robin, so drift on the
+host hits every variant alike) and navigates it once to the farm's tls13
+endpoint (bench/tls_farm.py on loopback):
+  fresh    the runner's launch flags before the profile snapshot: a new
+           empty profile, background services on
+  quiet    + chrome_profile.BACKGROUND_FLAGS / DISABLED_FEATURES
+  baked    + --user-data-dir cloned from a template baked once up front
+           (what chrome-runner does now)
+
+Reported per variant, p50 / p90 over --iterations:
+  launch_ms   webdriver.Chrome() until the session is up
+  nav_ms      the first driver.get()
+  total_ms    the two together, launch to first navigation
+  clone_ms    copying the template (baked only; included in launch_ms)
+
+  python3 bench/chrome_coldstart.py --iterations 20
+  python3 bench/chrome_coldstart.py --variants fresh,baked --json coldstart.json
+"""
+
+import argparse, json, os, shutil, sys, tempfile, time
+from types import SimpleNamespace
+
+from run_bench import RUNNERS_DIR, make_cert, percentile, start_farm
+from tls_farm import ENDPOINT_OFFSETS
+
+sys.path.insert(0, os.path.join(RUNNERS_DIR, "chrome-runner"))
+import chrome_profile                                  # noqa: E402
+
+from selenium import webdriver                         # noqa: E402
+from selenium.webdriver.chrome.options import Options  # noqa: E402
+from selenium.webdriver.chrome.service import Service  # noqa: E402
+
+VARIANTS = ("fresh", "quiet", "baked")
+HOST     = "coldstart.bench.test"
+
+
+def options(variant: str, profile: str) -> Options:
+    opts = Options()
+    for flag in ("--headless=new", "--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu",
+                 "--disable-extensions", "--window-size=1280,720", "--remote-debugging-port=0",
+                 f"--host-resolver-rules=MAP {HOST} 127.0.0.1", "--ignore-certificate-errors"):
+        opts.add_argument(flag)
+    disabled = ["DnsOverHttps", "UseDnsHttpsSvcb"]
+    if variant != "fresh":
+        for flag in chrome_profile.BACKGROUND_FLAGS:
+            opts.add_argument(flag)
+        disabled += chrome_profile.DISABLED_FEATURES
+    opts.add_argument(f"--disable-features={','.join(disabled)}")
+    if profile:
+        opts.add_argument(f"--user-data-dir={profile}")
+    return opts
+
+
+def cold_start(variant: str, template: str, url: str, args) -> dict:
+    t0      = time.monotonic()
+    profile = chrome_profile.clone(template) if variant == "baked" else ""
+    cloned  = time.monotonic()
+    drv     = webdriver.Chrome(service=Service(executable_path=args.chromedriver, log_path="/dev/null"),
+                               options=options(variant, profile))
+    try:
+        launched = time.monotonic()
+        drv.get(url)
+        navigated = time.monotonic()
+    finally:
+        drv.quit()
+        if profile:
+            chrome_profile.discard(profile)
+    return {"launch_ms": (launched - t0) * 1000, "nav_ms": (navigated - launched) * 1000,
+            "total_ms": (navigated - t0) * 1000, "clone_ms": (cloned - t0) * 1000}
+
+
+def summarize(variant: str, samples: list) -> dict:
+    out = {"variant": variant, "runs": len(samples)}
+    for name in ("launch_ms", "nav_ms", "total_ms", "clone_ms"):
+        values = [s[name] for s in samples]
+        out[f"{name[:-3]}_p50_ms"] = round(percentile(values, 0.50), 1)
+        out[f"{name[:-3]}_p90_ms"] = round(percentile(values, 0.90), 1)
+    return out
+
+
+def print_report(results: list):
+    cols = [("variant", 8), ("runs", 5), ("launch_p50_ms", 13), ("launch_p90_ms", 13), ("nav_p50_ms", 10),
+            ("nav_p90_ms", 10), ("total_p50_ms", 12), ("total_p90_ms", 12), ("clone_p50_ms", 12)]
+    print("\n" + "  ".join(name.rjust(w) for name, w in cols))
+    for res in results:
+        print("  ".join(str(res[name]).rjust(w) for name, w in cols))
+    base = next((r for r in results if r["variant"] == "fresh"), None)
+    for res in results:
+        if base and res is not base and base["total_p50_ms"]:
+            delta = res["total_p50_ms"] - base["total_p50_ms"]
+            print(f"  {res['variant']}: {delta:+.0f} ms p50 launch-to-first-navigation vs fresh "
+                  f"({delta / base['total_p50_ms']:+.0%})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=10, help="browsers started per variant")
+    ap.add_argument("--variants", default=",".join(VARIANTS), help=f"comma list of {', '.join(VARIANTS)}")
+    ap.add_argument("--warmup", type=int, default=1, help="untimed rounds first (page cache, binaries)")
+    ap.add_argument("--chrome", default="google-chrome", help="binary used to bake the template")
+    ap.add_argument("--chromedriver", default="/usr/local/bin/chromedriver")
+    ap.add_argument("--port-base", type=int, default=14400)
+    ap.add_argument("--json", default="", help="also write the report here")
+    args = ap.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    for v in variants:
+        if v not in VARIANTS:
+            sys.exit(f"ERROR: unknown variant {v!r}")
+    if not shutil.which("openssl"):
+        sys.exit("ERROR: openssl CLI is needed to make the farm certificate")
+
+    workdir  = tempfile.mkdtemp(prefix="chrome-coldstart-")
+    template = os.path.join(workdir, "template")
+    cert, key = make_cert(workdir)
+    farm = start_farm(cert, key, SimpleNamespace(port_base=args.port_base, slow_ms=0, farm_workers=1))
+    url  = f"https://{HOST}:{args.port_base + ENDPOINT_OFFSETS['tls13']}/"
+    try:
+        if "baked" in variants:
+            t0 = time.monotonic()
+            chrome_profile.bake(template, args.chrome)
+            print(f"[coldstart] template baked in {(time.monotonic() - t0) * 1000:.0f} ms "
+                  f"({sum(len(files) for _, _, files in os.walk(template))} files)", flush=True)
+        samples = {v: [] for v in variants}
+        for i in range(args.warmup + args.iterations):
+            for v in variants:
+                s = cold_start(v, template, url, args)
+                if i >= args.warmup:
+                    samples[v].append(s)
+            print(f"[coldstart] round {i + 1}/{args.warmup + args.iterations}", flush=True)
+    finally:
+        farm.terminate()
+        farm.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = [summarize(v, samples[v]) for v in variants]
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
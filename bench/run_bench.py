@@ -0,0 +1,203 @@
+"""
+bench/run_bench.py
+Probe-throughput benchmark. Starts bench/tls_farm.py on loopback, builds a
+synthetic target list across its endpoints and runs each runner / engine
+against it with no Azure credentials (results go to RESULTS_DIR only).
+
+Reported per case:
+  probes/s   records written ÷ wall time of the runner process
+  p50 / p99  DurationMs of the probes to the TLS endpoints the case can
+             negotiate (tls10 … tls13; tls12 / tls13 for chrome, whose
+             tls10 / tls11 failures only show in the exit-code mix); on
+             loopback this is almost entirely client-side overhead
+  CPU        user + sys of the runner and every process it reaped (curl,
+             chrome), also as CPU ms per probe
+  peak RSS   largest single process in that tree (ru_maxrss)
+plus the exit-code mix per endpoint kind, as a sanity check.
+
+  python3 bench/run_bench.py --hosts 50 --cases curl,batch,native,scan
+  python3 bench/run_bench.py --hosts 200 --cases native --env NATIVE_CONCURRENCY=200 --json out.json
+"""
+
+import argparse, collections, glob, json, os, shutil, socket, subprocess, sys, tempfile, time
+
+from tls_farm import ENDPOINT_OFFSETS, listen_addrs
+
+BENCH_DIR   = os.path.dirname(os.path.abspath(__file__))
+RUNNERS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "runners")
+DOMAIN      = "bench.test"
+CASES       = {    # case → (runner dir, extra env)
+    "curl":   ("curl-runner",   {"PROBE_ENGINE": "curl"}),
+    "batch":  ("curl-runner",   {"PROBE_ENGINE": "batch"}),
+    "native": ("curl-runner",   {"PROBE_ENGINE": "native"}),
+    "scan":   ("curl-runner",   {"PROBE_ENGINE": "scan"}),
+    # The farm's certificate is self-signed; only the bench lets Chrome accept it.
+    "chrome": ("chrome-runner", {"CHROME_IGNORE_CERT_ERRORS": "1"}),
+}
+# TLS endpoints whose DurationMs go into p50 / p99; Chrome has no TLS 1.0 / 1.1.
+TIMED_ENDPOINTS = {"chrome": ("tls12", "tls13")}
+# Never let a benchmark run talk to Azure, whatever the calling shell has set.
+SCRUBBED_ENV = ("STORAGE_CONN_STR", "LAW_WORKSPACE_ID", "LAW_SHARED_KEY", "LAW_ENDPOINT")
+
+
+def make_cert(workdir: str) -> tuple:
+    cert, key = os.path.join(workdir, "farm.pem"), os.path.join(workdir, "farm-key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+         "-keyout", key, "-out", cert, "-subj", f"/CN={DOMAIN}",
+         "-addext", f"subjectAltName=DNS:{DOMAIN},DNS:*.{DOMAIN}"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def start_farm(cert: str, key: str, args) -> subprocess.Popen:
+    farm = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "tls_farm.py"), "--cert", cert, "--key", key,
+         "--port-base", str(args.port_base), "--slow-ms", str(args.slow_ms),
+         "--workers", str(args.farm_workers)],
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", args.port_base + ENDPOINT_OFFSETS["blackhole"]), 1).close()
+            return farm
+        except OSError:
+            if farm.poll() is not None:
+                break
+            time.sleep(0.2)
+    farm.kill()
+    sys.exit("ERROR: TLS farm did not come up")
+
+
+def synthetic_targets(hosts: int, port_base: int) -> tuple:
+    """hosts per endpoint kind → (TARGETS_JSON list, RESOLVE_OVERRIDES dict)"""
+    targets, overrides, addrs = [], {}, listen_addrs()
+    for kind, offset in ENDPOINT_OFFSETS.items():
+        for i in range(hosts):
+            name = f"h{i}.{kind}.{DOMAIN}"
+            targets.append(f"{name}:{port_base + offset}")
+            overrides[name] = addrs
+    return targets, overrides
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_case(case: str, targets: list, overrides: dict, workdir: str, args) -> dict:
+    runner, case_env = CASES[case]
+    run_id = f"bench-{case}-{int(time.time())}"
+    env    = {k: v for k, v in os.environ.items() if k not in SCRUBBED_ENV}
+    env.update({
+        "TARGETS_JSON":       json.dumps(targets),
+        "RESOLVE_OVERRIDES":  json.dumps(overrides),
+        "RUN_ID":             run_id,
+        "RESULTS_DIR":        os.path.join(workdir, "results"),
+        "PROBE_TIMEOUT_SECS": str(args.timeout),
+        "PYTHONPATH":         RUNNERS_DIR,
+        **case_env,
+        **dict(kv.split("=", 1) for kv in args.env),
+    })
+    log_path = os.path.join(workdir, f"{run_id}.log")
+    print(f"[bench] {case}: {len(targets)} targets → {log_path}", flush=True)
+
+    with open(log_path, "w") as log:
+        t0   = time.monotonic()
+        proc = subprocess.Popen([sys.executable, "run.py"], cwd=os.path.join(RUNNERS_DIR, runner),
+                                env=env, stdout=log, stderr=subprocess.STDOUT)
+        # wait4() instead of wait(): its rusage covers exactly this runner and
+        # the curl / chrome processes it reaped, not the farm or earlier cases.
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall             = time.monotonic() - t0
+        proc.returncode  = os.waitstatus_to_exitcode(status)
+
+    records = []
+    for path in glob.glob(os.path.join(workdir, "results", run_id, "*.ndjson")):
+        with open(path) as f:
+            records += [json.loads(line) for line in f if line.strip()]
+
+    by_kind = collections.defaultdict(collections.Counter)
+    for r in records:
+        by_kind[r["TargetHost"].split(".")[1]][r["CurlExitCode"]] += 1
+    timed  = TIMED_ENDPOINTS.get(case, ("tls10", "tls11", "tls12", "tls13"))
+    tls_ms = [r["DurationMs"] for r in records
+              if r["TargetHost"].split(".")[1] in timed and not r.get("Skipped")]
+    cpu    = usage.ru_utime + usage.ru_stime
+
+    if proc.returncode != 0:
+        with open(log_path) as f:
+            print("".join(f.readlines()[-10:]), end="")
+    return {
+        "case":        case,
+        "exit":        proc.returncode,
+        "probes":      len(records),
+        "wall_s":      round(wall, 2),
+        "probes_per_s": round(len(records) / wall, 1) if wall else 0.0,
+        "p50_ms":      round(percentile(tls_ms, 0.50), 2),
+        "p99_ms":      round(percentile(tls_ms, 0.99), 2),
+        "cpu_s":       round(cpu, 2),
+        "cpu_ms_per_probe": round(cpu * 1000 / len(records), 2) if records else 0.0,
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "outcomes":    {kind: dict(sorted(c.items())) for kind, c in sorted(by_kind.items())},
+    }
+
+
+def print_report(results: list):
+    cols = [("case", 8), ("probes", 7), ("wall_s", 8), ("probes_per_s", 12), ("p50_ms", 8),
+            ("p99_ms", 8), ("cpu_s", 7), ("cpu_ms_per_probe", 16), ("peak_rss_mb", 11)]
+    print("\n" + "  ".join(name.rjust(w) for name, w in cols))
+    for res in results:
+        print("  ".join(str(res[name]).rjust(w) for name, w in cols))
+    print("\n  exit-code mix per endpoint (CurlExitCode: count)")
+    for res in results:
+        print(f"  {res['case']}:")
+        for kind, mix in res["outcomes"].items():
+            print(f"    {kind:<10} {mix}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--hosts", type=int, default=20, help="synthetic hosts per endpoint kind")
+    ap.add_argument("--cases", default="curl,batch,native,scan", help=f"comma list of {', '.join(CASES)}")
+    ap.add_argument("--timeout", type=int, default=3, help="PROBE_TIMEOUT_SECS for the runners")
+    ap.add_argument("--slow-ms", type=int, default=1000)
+    ap.add_argument("--port-base", type=int, default=14400)
+    ap.add_argument("--farm-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    ap.add_argument("--env", action="append", default=[], metavar="K=V", help="extra env for every case")
+    ap.add_argument("--json", default="", help="also write the report here")
+    ap.add_argument("--keep", action="store_true", help="keep the work dir (logs, NDJSON)")
+    args = ap.parse_args()
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    for c in cases:
+        if c not in CASES:
+            sys.exit(f"ERROR: unknown case {c!r}")
+    if not shutil.which("openssl"):
+        sys.exit("ERROR: openssl CLI is needed to make the farm certificate")
+
+    workdir = tempfile.mkdtemp(prefix="tls-bench-")
+    cert, key = make_cert(workdir)
+    farm = start_farm(cert, key, args)
+    try:
+        targets, overrides = synthetic_targets(args.hosts, args.port_base)
+        results = [run_case(c, targets, overrides, workdir, args) for c in cases]
+    finally:
+        farm.terminate()
+        farm.wait()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.keep:
+        print(f"\n  work dir: {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+bench/tls_farm.py
+Local HTTPS server farm for the benchmark in bench/run_bench.py. Every
+endpoint listens on 127.0.0.1 and ::1 (when available) on its own port:
+
+  tls10 … tls13  port_base+10 … +13   exactly one TLS version, 200 + body
+  slow           port_base+20         TLS 1.2/1.3, waits --slow-ms before answering
+  reset          port_base+21         accepts, then RST (SO_LINGER 0), no TLS
+  blackhole      port_base+22         accepts, never sends a byte → probe timeout
+  closed         port_base+23         nothing listens → connection refused
+
+Several farm processes can share the ports (SO_REUSEPORT), so the farm is
+not the bottleneck when a runner pushes a thousand probes at once.
+
+  python3 bench/tls_farm.py --cert c.pem --key k.pem --port-base 14400 [--workers 4]
+"""
+
+import argparse, asyncio, multiprocessing, signal, socket, ssl, struct, sys, warnings
+
+TLS_ENDPOINTS = {
+    "tls10": (10, ssl.TLSVersion.TLSv1),
+    "tls11": (11, ssl.TLSVersion.TLSv1_1),
+    "tls12": (12, ssl.TLSVersion.TLSv1_2),
+    "tls13": (13, ssl.TLSVersion.TLSv1_3),
+}
+OTHER_ENDPOINTS = {"slow": 20, "reset": 21, "blackhole": 22, "closed": 23}
+ENDPOINT_OFFSETS = {**{k: v[0] for k, v in TLS_ENDPOINTS.items()}, **OTHER_ENDPOINTS}
+MAX_HEADER = 8192
+
+
+def ipv6_available() -> bool:
+    try:
+        with socket.socket(socket.AF_INET6) as s:
+            s.bind(("::1", 0))
+        return True
+    except OSError:
+        return False
+
+
+def listen_addrs() -> list:
+    return ["127.0.0.1", "::1"] if ipv6_available() else ["127.0.0.1"]
+
+
+def server_context(cert: str, key: str, version: ssl.TLSVersion = None) -> ssl.SSLContext:
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)    # TLS 1.0/1.1 on purpose
+        if version:
+            ctx.minimum_version = ctx.maximum_version = version
+        else:
+            ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    if version and version < ssl.TLSVersion.TLSv1_2:
+        ctx.set_ciphers("DEFAULT:@SECLEVEL=0")
+    return ctx
+
+
+def _listener(addr: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in addr else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if ":" in addr:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+    sock.bind((addr, port))
+    sock.listen(4096)
+    sock.setblocking(False)
+    return sock
+
+
+def http_handler(body: bytes, delay: float = 0):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            if delay:
+                await asyncio.sleep(delay)
+            is_head = head.startswith(b"HEAD ")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body)
+                         + (b"" if is_head else body))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.transport.abort()
+    return handle
+
+
+async def reset_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    sock = writer.get_extra_info("socket")
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    writer.transport.abort()
+
+
+async def blackhole_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while await reader.read(65536):
+            pass
+    except ConnectionError:
+        pass
+    writer.transport.abort()
+
+
+async def serve(cert: str, key: str, port_base: int, slow_ms: int, body_bytes: int):
+    body     = b"x" * body_bytes
+    handlers = [(off, http_handler(body), server_context(cert, key, ver))
+                for off, ver in TLS_ENDPOINTS.values()]
+    handlers += [
+        (OTHER_ENDPOINTS["slow"],      http_handler(body, slow_ms / 1000), server_context(cert, key)),
+        (OTHER_ENDPOINTS["reset"],     reset_handler,     None),
+        (OTHER_ENDPOINTS["blackhole"], blackhole_handler, None),
+    ]
+    servers = []
+    for addr in listen_addrs():
+        for off, handler, ctx in handlers:
+            servers.append(await asyncio.start_server(
+                handler, sock=_listener(addr, port_base + off), ssl=ctx,
+                ssl_handshake_timeout=30 if ctx else None, limit=MAX_HEADER))
+    await asyncio.gather(*(s.serve_forever() for s in servers))
+
+
+def _worker(args):
+    try:
+        asyncio.run(serve(args.cert, args.key, args.port_base, args.slow_ms, args.body_bytes))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cert", required=True)
+    ap.add_argument("--key", required=True)
+    ap.add_argument("--port-base", type=int, default=14400)
+    ap.add_argument("--slow-ms", type=int, default=2000, help="delay before the slow endpoint answers")
+    ap.add_argument("--body-bytes", type=int, default=16384, help="response body size")
+    ap.add_argument("--workers", type=int, default=1, help="farm processes sharing the ports")
+    args = ap.parse_args()
+
+    print(f"[tls-farm] {args.workers} worker(s) on {', '.join(listen_addrs())}  "
+          + "  ".join(f"{k}:{args.port_base + v}" for k, v in ENDPOINT_OFFSETS.items()), flush=True)
+    # SIGTERM → normal exit, so multiprocessing terminates the daemon workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    procs = [multiprocessing.Process(target=_worker, args=(args,), daemon=True) for _ in range(args.workers)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -35,7 +35,7 @@ apt-get install -y -qq \
 curl -sL https://aka.ms/InstallAzureCLIDeb | bash
 
 # Python deps for capture-agent
-pip3 install --no-cache-dir azure-storage-blob
+pip3 install --no-cache-dir azure-storage-blob zstandard
 
 # ── 2. VXLAN interface ────────────────────────────────────────
 log "Configuring VXLAN decap interface: $VXLAN_IFACE"
@@ -124,6 +124,7 @@ STORAGE_ACCOUNT_NAME=
 OFFSITE_WEBHOOK_URL=
 RUNNER_SUBNET=10.10.1.0/24
 CAPTURE_IFACE=vxlan0
+CAPTURE_COMPRESSION=gzip
 EOF
 
 chown "$CAPTURE_USER":"$CAPTURE_USER" "$CAPTURE_DIR/capture-agent.env"
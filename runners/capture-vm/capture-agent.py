@@ -2,140 +2,615 @@
 """
 capture-agent.py
 Runs ON the capture VM. Manages the full lifecycle:
-  1. Start rotating tcpdump processes (one per runner × IP family)
-  2. Listen for STOP signal from orchestrator (HTTP on :9000)
-  3. On STOP: flush + close PCAPs, gzip, upload to Blob
-  4. Generate time-bounded SAS URLs
-  5. POST manifest + SAS URLs to offsite webhook
-  6. Exit cleanly (orchestrator will deallocate the VM)
+  1. On START: run ONE tcpdump on the capture interface and split its pcap
+     stream in process into one file per runner × IP family (PcapDemux)
+  2. Compress each file as its packets arrive (gzip or zstd, one
+     CompressedWriter thread per file); no raw pcap ever reaches the disk
+  3. Rotate each file into segments by size / age (SegmentedOutput); a
+     background uploader pushes every closed segment to pcap-staging/{run_id}/
+     while the capture goes on, so disk use stays at about one segment per file
+  4. On STOP (HTTP on :9000): stop tcpdump, flush and close the last
+     segments, wait for the uploader
+  5. Generate time-bounded SAS URLs; upload {run_id}-manifest.json listing
+     every segment in order
+  6. POST manifest + SAS URLs to offsite webhook
+  7. Exit cleanly (orchestrator will deallocate the VM)
 
 Signal protocol (simple HTTP):
-  POST /start   body: {"run_id": "...", "runners": ["curl","chrome"]}
+  POST /start   body: {"run_id": "...", "runners": ["curl","chrome"],
+                       "runner_ips": {"curl": ["10.10.1.4", "ace:cab:deca:deed::4"], ...},
+                       "capture_mode": "full|handshake"}
+                runner_ips is optional, merged with what /register has received;
+                capture_mode defaults to CAPTURE_MODE
+  POST /register body: {"runner": "curl", "ips": ["10.10.1.4", "ace:cab:deca:deed::4"]}
+                sent by run-tests.sh after creating each container, and by the
+                runners themselves at startup (shared/capture.py); any phase,
+                applied to a running capture at once.
   POST /stop    body: {"run_id": "..."}
-  GET  /status  → {"state": "idle|capturing|uploading|done", "run_id": "..."}
+  GET  /status  → {"state": "idle|capturing|uploading|done", "run_id": "...", "registered": {...}}
+
+Routing: a packet (either direction; the filter covers the runner subnets)
+goes to the registered runner whose address is its source or destination.
+A packet that matches no registered address goes to every runner that has
+not registered yet, so a runner that never registers gets what the old
+per-runner tcpdumps (with identical filters) wrote; once every runner has
+registered such packets are only counted (unmatched).
+
+CAPTURE_MODE=handshake (or "capture_mode" in the /start body) keeps, per TCP
+direction, every packet up to and including the end of the first TLS
+application-data record, plus every packet that starts a TLS alert record
+and all packets without payload (SYN, FIN, RST, ACKs). Later packets are cut
+to their link + IP + TCP headers (the pcap records the original length, so
+sequence analysis still works). A direction that does not start with a TLS
+record keeps its first payload packet only. With TLS 1.3 the first
+application-data record is the first encrypted handshake record.
 
 ENV VARS (injected by run-tests.sh via az vm run-command):
   STORAGE_CONN_STR
   STORAGE_ACCOUNT_NAME
   OFFSITE_WEBHOOK_URL
   RUNNER_SUBNET          e.g. 10.10.1.0/24
+  RUNNER_SUBNET6         e.g. ace:cab:deca:deed::/64
   CAPTURE_IFACE          e.g. eth0
+  CAPTURE_MODE           full (default) | handshake
+  CAPTURE_COMPRESSION    gzip (default, .pcap.gz) | zstd (.pcap.zst, needs the zstandard package)
+  CAPTURE_COMPRESSION_LEVEL  default 6 for gzip, 3 for zstd
+  CAPTURE_SEGMENT_MB     rotate a file after this much pcap data, before compression (default 256; 0 = off)
+  CAPTURE_SEGMENT_SECS   rotate a file this long after its segment started (default 300; 0 = off)
 """
 
-import os, subprocess, signal, gzip, shutil, json, time
+import os, subprocess, signal, gzip, json, time, struct, ipaddress
 import hashlib, hmac, base64, datetime, urllib.request, urllib.parse
-import threading
+import queue, threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
 
+try:
+    import zstandard
+except ImportError:            # gzip only
+    zstandard = None
+
 # ── Config ────────────────────────────────────────────────────
 STORAGE_CONN    = os.environ["STORAGE_CONN_STR"]
 STORAGE_ACCT    = os.environ["STORAGE_ACCOUNT_NAME"]
 WEBHOOK_URL     = os.environ["OFFSITE_WEBHOOK_URL"]
 RUNNER_SUBNET   = os.environ.get("RUNNER_SUBNET", "10.10.1.0/24")
+RUNNER_SUBNET6  = os.environ.get("RUNNER_SUBNET6", "ace:cab:deca:deed::/64")
 IFACE           = os.environ.get("CAPTURE_IFACE", "vxlan0")  # decap iface, not eth0
+CAPTURE_MODE    = os.environ.get("CAPTURE_MODE", "full")
+CAPTURE_MODES   = ("full", "handshake")
+COMPRESSION     = os.environ.get("CAPTURE_COMPRESSION", "gzip")
+if COMPRESSION == "zstd" and zstandard is None:
+    print("[capture-agent] WARN: zstandard not installed, compressing with gzip")
+    COMPRESSION = "gzip"
+COMPRESSION_LEVEL = int(os.environ.get("CAPTURE_COMPRESSION_LEVEL") or (3 if COMPRESSION == "zstd" else 6))
+COMPRESSED_SUFFIX = {"gzip": ".gz", "zstd": ".zst"}[COMPRESSION]
 PCAP_DIR        = Path("/tmp/pcaps")
 PCAP_CONTAINER  = "pcap-staging"
 SAS_EXPIRY_HRS  = 24
 
-RUNNER_PROFILES = {
-    "curl":   {"ipv4_filter": f"src net {RUNNER_SUBNET} and tcp",
-               "ipv6_filter": f"ip6 and src net ace:cab:deca:deed::/64 and tcp"},
-    "chrome": {"ipv4_filter": f"src net {RUNNER_SUBNET} and tcp",
-               "ipv6_filter": f"ip6 and src net ace:cab:deca:deed::/64 and tcp"},
-}
+CAPTURE_FILTER  = f"tcp and (net {RUNNER_SUBNET} or (ip6 and net {RUNNER_SUBNET6}))"
+WRITE_CHUNK     = 1 << 20       # bytes handed to the compressor thread at a time
+SEGMENT_BYTES   = int(float(os.environ.get("CAPTURE_SEGMENT_MB", "256")) * 2**20)
+SEGMENT_SECS    = float(os.environ.get("CAPTURE_SEGMENT_SECS", "300"))
+UPLOAD_RETRIES  = 3
+FLOW_IDLE_SECS  = 300           # handshake mode: per-direction state dropped after this
 
 # ── State ─────────────────────────────────────────────────────
-state    = {"phase": "idle", "run_id": None}
-procs    = {}   # key: "curl-ipv4" → subprocess.Popen
+state    = {"phase": "idle", "run_id": None, "registered": {}}   # registered: runner → [ip, ...]
+demux    = None   # PcapDemux while capturing
+uploader = None   # SegmentUploader of the current run
 lock     = threading.Lock()
 
 
 # ── tcpdump management ────────────────────────────────────────
-def pcap_path(run_id: str, runner: str, ip_family: str) -> Path:
+def pcap_path(run_id: str, runner: str, ip_family: str, segment: int) -> Path:
     PCAP_DIR.mkdir(parents=True, exist_ok=True)
-    return PCAP_DIR / f"{run_id}-{runner}-{ip_family}.pcap"
-
-
-def start_capture(run_id: str, runners: list):
-    for runner in runners:
-        for ip_family, filt_key in [("ipv4", "ipv4_filter"), ("ipv6", "ipv6_filter")]:
-            key    = f"{runner}-{ip_family}"
-            out    = str(pcap_path(run_id, runner, ip_family))
-            filt   = RUNNER_PROFILES[runner][filt_key]
-            cmd    = ["tcpdump", "-i", IFACE, "-w", out, "-s", "0", "--immediate-mode", filt]
-            print(f"[capture] START {key}: {' '.join(cmd)}")
-            procs[key] = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return PCAP_DIR / f"{run_id}-{runner}-{ip_family}-{segment:04d}.pcap{COMPRESSED_SUFFIX}"
+
+
+def utc_iso(ts: float) -> str:
+    return datetime.datetime.utcfromtimestamp(ts).isoformat() + "Z"
+
+
+class CompressedWriter:
+    """
+    A pcap output compressed while it is written. The demux thread only
+    appends to a buffer; full WRITE_CHUNK buffers go through a bounded queue
+    to a compressor thread of their own (zlib and zstd release the GIL on
+    large inputs), so compression keeps up with the capture and runs next to
+    it. close() flushes the final gzip member / zstd frame.
+    """
+
+    def __init__(self, path: Path, method: str = COMPRESSION, level: int = COMPRESSION_LEVEL):
+        self.path = path
+        self.raw  = open(path, "wb")
+        if method == "zstd":
+            self.out = zstandard.ZstdCompressor(level=level).stream_writer(self.raw, closefd=False)
+        else:
+            self.out = gzip.GzipFile(filename=path.name, mode="wb", compresslevel=level, fileobj=self.raw)
+        self.bytes_in = 0
+        self._buf     = bytearray()
+        self._queue   = queue.Queue(maxsize=32)
+        self._thread  = threading.Thread(target=self._run, name=f"compress-{path.name}", daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes):
+        self._buf += data
+        self.bytes_in += len(data)
+        if len(self._buf) >= WRITE_CHUNK:
+            self._queue.put(bytes(self._buf))
+            self._buf.clear()
+
+    def _run(self):
+        while (chunk := self._queue.get()) is not None:
+            self.out.write(chunk)
+
+    def close(self) -> int:
+        """Flush and close → compressed size in bytes."""
+        if self._buf:
+            self._queue.put(bytes(self._buf))
+            self._buf.clear()
+        self._queue.put(None)
+        self._thread.join()
+        self.out.close()
+        self.raw.close()
+        return self.path.stat().st_size
+
+
+class SegmentedOutput:
+    """
+    One runner × family stream, written as numbered segments. A segment is
+    closed once it holds SEGMENT_BYTES of pcap data or is SEGMENT_SECS old
+    (checked as packets arrive) and handed to the uploader; the next one
+    starts with the same pcap file header, so every segment opens on its own.
+    """
+
+    def __init__(self, run_id: str, runner: str, family: str, header: bytes, uploader):
+        self.run_id, self.runner, self.family = run_id, runner, family
+        self.key      = f"{run_id}-{runner}-{family}.pcap"
+        self.header   = header
+        self.uploader = uploader
+        self.segment  = -1
+        self.packets  = 0                 # over all segments
+        self._open()
+
+    def _open(self):
+        self.segment += 1
+        self.writer   = CompressedWriter(pcap_path(self.run_id, self.runner, self.family, self.segment))
+        self.writer.write(self.header)
+        self.opened   = time.monotonic()
+        self.seg_packets, self.first_ts, self.last_ts = 0, None, None
+
+    def _handoff(self):
+        self.uploader.submit(self.writer, {
+            "key":          self.key,
+            "runner":       self.runner,
+            "ip_family":    self.family,
+            "segment":      self.segment,
+            "packets":      self.seg_packets,
+            "first_packet": utc_iso(self.first_ts) if self.first_ts is not None else None,
+            "last_packet":  utc_iso(self.last_ts) if self.last_ts is not None else None,
+        })
+
+    def write(self, record: bytes, ts: float):
+        if self.seg_packets and (
+                (SEGMENT_BYTES and self.writer.bytes_in >= SEGMENT_BYTES) or
+                (SEGMENT_SECS and time.monotonic() - self.opened >= SEGMENT_SECS)):
+            self._handoff()
+            self._open()
+        self.writer.write(record)
+        self.packets     += 1
+        self.seg_packets += 1
+        self.first_ts     = ts if self.first_ts is None else self.first_ts
+        self.last_ts      = ts
+
+    def close(self):
+        self._handoff()
+
+
+# Link-layer types tcpdump may hand us → offset of the IP header, where fixed
+LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2 = 1, 101, 113, 276
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+
+def ip_header(linktype: int, frame: bytes) -> int:
+    """Offset of the IP header in a captured frame, -1 if it is not IP."""
+    if linktype == LINKTYPE_ETHERNET:
+        off, ethertype = 14, int.from_bytes(frame[12:14], "big")
+        while ethertype in ETHERTYPE_VLAN:                 # 802.1Q / QinQ tags
+            ethertype = int.from_bytes(frame[off + 2:off + 4], "big")
+            off += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        off, ethertype = 16, int.from_bytes(frame[14:16], "big")
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        off, ethertype = 20, int.from_bytes(frame[0:2], "big")
+    elif linktype == LINKTYPE_RAW:
+        return 0
+    else:
+        return -1
+    return off if ethertype in (0x0800, 0x86DD) else -1
+
+
+def ip_endpoints(frame: bytes, off: int) -> tuple:
+    """("ipv4"|"ipv6", src, dst) as packed addresses, or (None, b"", b"")."""
+    version = frame[off] >> 4 if len(frame) > off else 0
+    if version == 4 and len(frame) >= off + 20:
+        return "ipv4", frame[off + 12:off + 16], frame[off + 16:off + 20]
+    if version == 6 and len(frame) >= off + 40:
+        return "ipv6", frame[off + 8:off + 24], frame[off + 24:off + 40]
+    return None, b"", b""
+
+
+# TLS record content types: change_cipher_spec, alert, handshake, application_data, heartbeat
+TLS_CHANGE_CIPHER_SPEC, TLS_ALERT, TLS_HANDSHAKE, TLS_APPLICATION_DATA, TLS_HEARTBEAT = 20, 21, 22, 23, 24
+
+
+class _Direction:
+    """TLS record tracking for one direction of one TCP connection."""
+    __slots__ = ("seq", "need", "header", "last_appdata", "cut", "seen")
+
+    def __init__(self, seq: int, seen: int):
+        self.seq          = seq      # next expected sequence number
+        self.need         = 0        # body bytes left in the current record
+        self.header       = b""      # partial record header carried over from the last segment
+        self.last_appdata = False    # the current record is the first application-data record
+        self.cut          = False    # past the first application-data record
+        self.seen         = seen     # pcap timestamp (s) of the last packet
+
+
+class HandshakeFilter:
+    """Decides how much of each TCP packet handshake mode keeps."""
+
+    def __init__(self):
+        self.flows    = {}           # (src, sport, dst, dport) → _Direction
+        self.packets  = 0
+        self.counters = {"truncated": 0, "bytes_dropped": 0, "non_tls": 0, "resyncs": 0}
+
+    def keep(self, frame: bytes, off: int, family: str, ts: int) -> int:
+        """Bytes of `frame` to store: len(frame), or the header length when cut."""
+        if family == "ipv4":
+            ihl, proto = (frame[off] & 0x0F) * 4, frame[off + 9]
+            end        = off + int.from_bytes(frame[off + 2:off + 4], "big")
+        else:
+            ihl, proto = 40, frame[off + 6]
+            end        = off + 40 + int.from_bytes(frame[off + 4:off + 6], "big")
+        tcp = off + ihl
+        if proto != 6 or len(frame) < tcp + 20:
+            return len(frame)        # IPv6 extension headers, fragments: keep as is
+        payload_at = tcp + (frame[tcp + 12] >> 4) * 4
+        payload    = frame[payload_at:min(end, len(frame))]
+        flags      = frame[tcp + 13]
+        key        = (frame[off + 12:off + 16] + frame[off + 16:off + 20] if family == "ipv4"
+                      else frame[off + 8:off + 40], frame[tcp:tcp + 4])
+
+        self.packets += 1
+        if self.packets % 50000 == 0:
+            self._expire(ts)
+        if flags & 0x04:             # RST: nothing more to track in this direction
+            self.flows.pop(key, None)
+        if not payload:
+            return len(frame)
+
+        seq = int.from_bytes(frame[tcp + 4:tcp + 8], "big")
+        d   = self.flows.get(key)
+        if d is None:
+            d = self.flows[key] = _Direction(seq, ts)
+        d.seen = ts
+        ahead  = (seq - d.seq) & 0xFFFFFFFF
+        if ahead >= 1 << 31:         # retransmission of bytes already walked
+            keep = not d.cut
+        else:
+            if ahead:                # a segment went missing: assume a record starts here
+                d.need, d.header, d.last_appdata = 0, b"", False
+                self.counters["resyncs"] += 1
+            keep   = self._walk(d, payload)
+            d.seq  = (seq + len(payload)) & 0xFFFFFFFF
+        if flags & 0x01:             # FIN
+            self.flows.pop(key, None)
+        if keep:
+            return len(frame)
+        self.counters["truncated"]     += 1
+        self.counters["bytes_dropped"] += len(frame) - payload_at
+        return payload_at
+
+    def _walk(self, d: _Direction, payload: bytes) -> bool:
+        """Advances the record state over one in-order segment → keep the segment?"""
+        keep, i, n = not d.cut, 0, len(payload)
+        while i < n:
+            if d.need:
+                take    = min(d.need, n - i)
+                d.need -= take
+                i      += take
+                if not d.need and d.last_appdata:
+                    d.cut, d.last_appdata = True, False
+                continue
+            take      = 5 - len(d.header)
+            d.header += payload[i:i + take]
+            i        += take
+            if len(d.header) < 5:
+                break
+            ctype, major, length = d.header[0], d.header[1], int.from_bytes(d.header[3:5], "big")
+            d.header = b""
+            if not TLS_CHANGE_CIPHER_SPEC <= ctype <= TLS_HEARTBEAT or major != 3:
+                if not d.cut:
+                    self.counters["non_tls"] += 1
+                d.cut = True         # not TLS (or lost sync for good): keep this segment only
+                return keep
+            if ctype == TLS_ALERT:
+                keep = True
+            elif ctype == TLS_APPLICATION_DATA and not d.cut:
+                d.last_appdata = True
+            d.need = length
+            if not length and d.last_appdata:
+                d.cut, d.last_appdata = True, False
+        return keep
+
+    def _expire(self, now: int):
+        for key in [k for k, d in self.flows.items() if now - d.seen > FLOW_IDLE_SECS]:
+            del self.flows[key]
+
+
+class PcapDemux:
+    """
+    One tcpdump writing pcap to a pipe; a reader thread appends every packet
+    to the {run_id}-{runner}-{family} output(s) it belongs to. The kernel
+    copies each mirrored packet out once, however many runners there are.
+    """
+
+    def __init__(self, run_id: str, runners: list, uploader, runner_ips: dict = None, mode: str = "full"):
+        self.run_id  = run_id
+        self.uploader = uploader
+        self.mode    = mode
+        self.filter  = HandshakeFilter() if mode == "handshake" else None
+        self.runners = list(runners)
+        self.set_routes(runner_ips or {})
+        self.outputs  = {}                                 # (runner, family) → SegmentedOutput
+        self.counters = {"packets": 0, "bytes": 0, "unmatched": 0, "not_ip": 0}
+        self.proc     = None
+        self._thread  = threading.Thread(target=self._run, name="demux", daemon=True)
+
+    def set_routes(self, runner_ips: dict):
+        """Replace the demux table; safe while the reader thread runs."""
+        routes = {ipaddress.ip_address(ip).packed: runner
+                  for runner, ips in runner_ips.items() for ip in ips}
+        self.routes, self.unrouted = routes, [r for r in self.runners if r not in runner_ips]
+
+    def start(self):
+        cmd = ["tcpdump", "-i", IFACE, "-w", "-", "-U", "-s", "0", "--immediate-mode", CAPTURE_FILTER]
+        print(f"[capture] START {self.run_id} ({self.mode}; registered: {sorted(set(self.routes.values())) or 'none'}): "
+              f"{' '.join(cmd)}")
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._thread.start()
+        return self
+
+    def targets(self, src: bytes, dst: bytes) -> list:
+        routes = self.routes
+        runner = routes.get(src) or routes.get(dst)
+        if runner:
+            return [runner] if runner in self.runners else []
+        return self.unrouted
+
+    def _run(self):
+        stream = self.proc.stdout
+        header = stream.read(24)
+        if len(header) < 24:
+            return                                         # tcpdump failed to start
+        endian   = "<" if header[:4] in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1") else ">"
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+        for runner in self.runners:
+            for family in ("ipv4", "ipv6"):
+                self.outputs[(runner, family)] = SegmentedOutput(self.run_id, runner, family,
+                                                                 header, self.uploader)
+
+        record = struct.Struct(endian + "IIII")
+        ts_div = 1e9 if header[:4] in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d") else 1e6
+        while True:
+            rec_header = stream.read(16)
+            if len(rec_header) < 16:
+                break
+            caplen = record.unpack(rec_header)[2]
+            frame  = stream.read(caplen)
+            if len(frame) < caplen:
+                break                                      # cut off when tcpdump exited
+            self.counters["packets"] += 1
+            self.counters["bytes"]   += 16 + caplen
+            off = ip_header(linktype, frame)
+            family, src, dst = ip_endpoints(frame, off) if off >= 0 else (None, b"", b"")
+            if family is None:
+                self.counters["not_ip"] += 1
+                continue
+            runners = self.targets(src, dst)
+            if not runners:
+                self.counters["unmatched"] += 1
+                continue
+            ts_sec, ts_frac, _, orig_len = record.unpack(rec_header)
+            if self.filter:
+                keep = self.filter.keep(frame, off, family, ts_sec)
+                if keep < caplen:
+                    rec_header, frame = record.pack(ts_sec, ts_frac, keep, orig_len), frame[:keep]
+            for runner in runners:
+                self.outputs[(runner, family)].write(rec_header + frame, ts_sec + ts_frac / ts_div)
+
+    def close(self):
+        self.proc.send_signal(signal.SIGTERM)
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        # tcpdump is gone, so the pipe reaches EOF: wait for the demux thread
+        # to drain it (and the compressor queues) before the writers go to the uploader.
+        self._thread.join()
+        for output in self.outputs.values():
+            output.close()                             # last segments → uploader
+        print(f"  [capture] tcpdump exit={self.proc.returncode}  "
+              f"{self.proc.stderr.read().decode(errors='replace').strip().replace(chr(10), '; ')}")
+        print(f"  [capture] demux: {self.counters}  per file: " + "  ".join(
+            f"{runner}-{family} {o.packets} pkts / {o.segment + 1} segments"
+            for (runner, family), o in self.outputs.items()))
+        if self.filter:
+            print(f"  [capture] handshake mode: {self.filter.counters}")
+
+
+def register_runner(runner: str, ips: list):
+    """Record a runner's addresses (ValueError if one is not an IP) and update a running capture."""
+    addrs   = [ipaddress.ip_address(ip) for ip in ips]
+    subnets = [ipaddress.ip_network(RUNNER_SUBNET), ipaddress.ip_network(RUNNER_SUBNET6)]
+    for addr in addrs:
+        if not any(addr in net for net in subnets):
+            print(f"[register] WARN {runner} {addr} is outside the captured runner subnets")
+    state["registered"][runner] = sorted(set(state["registered"].get(runner, [])) | {str(a) for a in addrs})
+    print(f"[register] {runner}: {', '.join(state['registered'][runner])}")
+    if demux:
+        demux.set_routes(state["registered"])
+
+
+def start_capture(run_id: str, runners: list, runner_ips: dict = None, mode: str = CAPTURE_MODE):
+    global demux, uploader
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"capture_mode must be one of {', '.join(CAPTURE_MODES)}")
+    for runner, ips in (runner_ips or {}).items():
+        register_runner(runner, ips)
+    uploader = SegmentUploader(run_id).start()
+    demux    = PcapDemux(run_id, runners, uploader, state["registered"], mode).start()
+    state["segments_uploaded"] = 0
     state["phase"]  = "capturing"
     state["run_id"] = run_id
 
 
 def stop_capture():
-    print("[capture] Stopping all tcpdump processes...")
-    for key, proc in procs.items():
-        proc.send_signal(signal.SIGTERM)
-    for key, proc in procs.items():
-        try:
-            proc.wait(timeout=10)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-        print(f"  [capture] {key} exit={proc.returncode}")
-    procs.clear()
-
-
-# ── Compress + upload ─────────────────────────────────────────
-def compress_and_upload(run_id: str) -> list:
-    """Returns list of dicts: {key, blob_name, sas_url, size_bytes}"""
-    state["phase"] = "uploading"
-    client  = BlobServiceClient.from_connection_string(STORAGE_CONN)
-    results = []
-
-    for pcap_file in sorted(PCAP_DIR.glob(f"{run_id}-*.pcap")):
-        gz_path = pcap_file.with_suffix(".pcap.gz")
-        print(f"[upload] Compressing {pcap_file.name}...")
-        with open(pcap_file, "rb") as f_in, gzip.open(gz_path, "wb", compresslevel=6) as f_out:
-            shutil.copyfileobj(f_in, f_out)
-        pcap_file.unlink()  # remove raw file immediately
-
-        size       = gz_path.stat().st_size
-        blob_name  = f"{run_id}/{gz_path.name}"
-        print(f"[upload] Uploading {blob_name} ({size // 1024}KB)...")
-
-        blob = client.get_blob_client(container=PCAP_CONTAINER, blob=blob_name)
-        with open(gz_path, "rb") as data:
-            blob.upload_blob(data, overwrite=True)
-        gz_path.unlink()  # remove local gzip after upload
-
-        # Generate 24h SAS URL
-        expiry  = datetime.datetime.utcnow() + datetime.timedelta(hours=SAS_EXPIRY_HRS)
-        sas_tok = generate_blob_sas(
-            account_name   = STORAGE_ACCT,
-            container_name = PCAP_CONTAINER,
-            blob_name      = blob_name,
-            account_key    = BlobServiceClient.from_connection_string(STORAGE_CONN).credential.account_key,
-            permission     = BlobSasPermissions(read=True),
-            expiry         = expiry,
-        )
-        sas_url = f"https://{STORAGE_ACCT}.blob.core.windows.net/{PCAP_CONTAINER}/{blob_name}?{sas_tok}"
-        results.append({
-            "key":        gz_path.stem,        # e.g. "abc123-curl-ipv4.pcap"
+    """Stops tcpdump and hands the last segments to the uploader → (uploader, capture mode)."""
+    global demux, uploader
+    print("[capture] Stopping tcpdump...")
+    demux.close()
+    out = (uploader, demux.mode)
+    demux, uploader = None, None
+    return out
+
+
+# ── Upload ────────────────────────────────────────────────────
+def sas_url(blob_name: str) -> tuple:
+    """24h read-only SAS URL for a blob in PCAP_CONTAINER → (url, expiry)."""
+    expiry  = datetime.datetime.utcnow() + datetime.timedelta(hours=SAS_EXPIRY_HRS)
+    sas_tok = generate_blob_sas(
+        account_name   = STORAGE_ACCT,
+        container_name = PCAP_CONTAINER,
+        blob_name      = blob_name,
+        account_key    = BlobServiceClient.from_connection_string(STORAGE_CONN).credential.account_key,
+        permission     = BlobSasPermissions(read=True),
+        expiry         = expiry,
+    )
+    return f"https://{STORAGE_ACCT}.blob.core.windows.net/{PCAP_CONTAINER}/{blob_name}?{sas_tok}", expiry
+
+
+class SegmentUploader:
+    """
+    Background uploader: closes (final-flushes) each segment it is handed,
+    uploads it to pcap-staging/{run_id}/, deletes the local file and keeps
+    the webhook / manifest entry. Runs for the whole capture, so uploads
+    overlap with probing instead of starting at /stop.
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id  = run_id
+        self.entries = []                 # one per uploaded segment
+        self.failed  = []                 # local paths left behind after UPLOAD_RETRIES
+        self._queue  = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, writer: CompressedWriter, meta: dict):
+        self._queue.put((writer, meta))
+
+    def _run(self):
+        client = None
+        while (item := self._queue.get()) is not None:
+            writer, meta = item
+            size = writer.close()
+            client = client or BlobServiceClient.from_connection_string(STORAGE_CONN)
+            entry  = self._upload(client, writer.path, size, meta)
+            if entry:
+                self.entries.append(entry)
+                with lock:
+                    state["segments_uploaded"] = len(self.entries)
+
+    def _upload(self, client, path: Path, size: int, meta: dict) -> dict:
+        blob_name = f"{self.run_id}/{path.name}"
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        for attempt in range(1, UPLOAD_RETRIES + 1):
+            try:
+                print(f"[upload] Uploading {blob_name} ({size // 1024}KB, {meta['packets']} pkts)...")
+                blob = client.get_blob_client(container=PCAP_CONTAINER, blob=blob_name)
+                with open(path, "rb") as data:
+                    blob.upload_blob(data, overwrite=True)
+                break
+            except Exception as e:
+                print(f"  ✗ {blob_name} attempt {attempt}/{UPLOAD_RETRIES}: {e}")
+                if attempt < UPLOAD_RETRIES:
+                    time.sleep(2 ** attempt)
+        else:
+            self.failed.append(str(path))
+            return None
+        path.unlink()  # remove local file after upload
+
+        url, expiry = sas_url(blob_name)
+        print(f"  ✓ {blob_name}")
+        return {
+            **meta,                                      # key, runner, ip_family, segment, packets, ...
+            "compression": COMPRESSION,
             "blob_name":  blob_name,
-            "sas_url":    sas_url,
+            "sas_url":    url,
             "sas_expiry": expiry.isoformat() + "Z",
             "size_bytes": size,
-        })
-        print(f"  ✓ {blob_name}")
-
-    return results
+            "sha256":     digest,
+        }
+
+    def finish(self) -> list:
+        """Waits for every queued segment → entries ordered by key, then segment."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.failed:
+            print(f"[upload] WARN {len(self.failed)} segments not uploaded, left in {PCAP_DIR}: {self.failed}")
+        return sorted(self.entries, key=lambda e: (e["key"], e["segment"]))
+
+
+def upload_manifest(run_id: str, pcap_files: list, mode: str) -> dict:
+    """{run_id}/{run_id}-manifest.json: every segment in order → {blob_name, sas_url, sas_expiry}."""
+    blob_name = f"{run_id}/{run_id}-manifest.json"
+    manifest  = {
+        "run_id":        run_id,
+        "created":       datetime.datetime.utcnow().isoformat() + "Z",
+        "capture_mode":  mode,
+        "compression":   COMPRESSION,
+        "segment_bytes": SEGMENT_BYTES,
+        "segment_secs":  SEGMENT_SECS,
+        "segments":      [{k: v for k, v in f.items() if k not in ("sas_url", "sas_expiry")}
+                          for f in pcap_files],
+    }
+    client = BlobServiceClient.from_connection_string(STORAGE_CONN)
+    client.get_blob_client(container=PCAP_CONTAINER, blob=blob_name).upload_blob(
+        json.dumps(manifest, indent=2).encode(), overwrite=True)
+    url, expiry = sas_url(blob_name)
+    print(f"[upload] Manifest {blob_name}: {len(pcap_files)} segments")
+    return {"blob_name": blob_name, "sas_url": url, "sas_expiry": expiry.isoformat() + "Z"}
 
 
 # ── Offsite webhook ───────────────────────────────────────────
-def notify_offsite(run_id: str, pcap_files: list) -> int:
+def notify_offsite(run_id: str, pcap_files: list, manifest: dict = None) -> int:
     payload = json.dumps({
         "run_id":     run_id,
         "timestamp":  datetime.datetime.utcnow().isoformat() + "Z",
         "pcap_files": pcap_files,
+        "manifest":   manifest,
         "note":       "SAS URLs expire in 24h. Fetch promptly.",
     }).encode()
     req = urllib.request.Request(
@@ -168,7 +643,9 @@ class Handler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         if self.path == "/status":
-            self.send_json(200, state)
+            with lock:
+                snapshot = {**state, "registered": {r: list(ips) for r, ips in state["registered"].items()}}
+            self.send_json(200, snapshot)
         else:
             self.send_json(404, {"error": "not found"})
 
@@ -183,21 +660,46 @@ class Handler(BaseHTTPRequestHandler):
                     return
                 run_id  = body.get("run_id", "unknown")
                 runners = body.get("runners", ["curl", "chrome"])
-                start_capture(run_id, runners)
+                try:
+                    start_capture(run_id, runners, body.get("runner_ips"),
+                                  body.get("capture_mode", CAPTURE_MODE))
+                except ValueError as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
             self.send_json(200, {"started": True, "run_id": run_id})
 
+        elif self.path == "/register":
+            runner, ips = body.get("runner"), body.get("ips", [])
+            if not runner or not isinstance(ips, list) or not ips:
+                self.send_json(400, {"error": "need runner and a non-empty ips list"})
+                return
+            with lock:
+                try:
+                    register_runner(runner, ips)
+                except ValueError as e:
+                    self.send_json(400, {"error": f"bad ips: {e}"})
+                    return
+                live = demux is not None
+            self.send_json(200, {"registered": runner, "ips": state["registered"][runner], "live": live})
+
         elif self.path == "/stop":
             with lock:
                 if state["phase"] != "capturing":
                     self.send_json(409, {"error": f"not capturing, phase={state['phase']}"})
                     return
                 run_id = state["run_id"]
-                stop_capture()
+                segments, mode = stop_capture()
+                state["phase"] = "uploading"
 
             # Upload + notify in background so HTTP response returns quickly
             def finish():
-                pcap_files = compress_and_upload(run_id)
-                wh_status  = notify_offsite(run_id, pcap_files)
+                pcap_files = segments.finish()
+                try:
+                    manifest = upload_manifest(run_id, pcap_files, mode)
+                except Exception as e:
+                    print(f"[upload] Manifest FAILED: {e}")
+                    manifest = None
+                wh_status  = notify_offsite(run_id, pcap_files, manifest)
                 with lock:
                     state["phase"]            = "done"
                     state["last_webhook_http"] = wh_status
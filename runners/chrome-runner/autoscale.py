@@ -0,0 +1,241 @@
+"""
+chrome-runner/autoscale.py
+Adaptive probe concurrency for chrome-runner, driven by the container's own
+cgroup accounting instead of a fixed CHROME_WORKERS.
+
+A sampler thread reads, every `interval` seconds:
+  memory  limit and working set (usage minus inactive file cache, as the
+          kernel OOM killer and kubelet see it)
+          v2: memory.max, memory.current, memory.stat:inactive_file
+          v1: memory.limit_in_bytes, memory.usage_in_bytes, memory.stat:total_inactive_file
+  CPU     quota and usage rate
+          v2: cpu.max, cpu.stat:usage_usec
+          v1: cpu.cfs_quota_us / cpu.cfs_period_us, cpuacct.usage
+Without a cgroup limit it falls back to /proc/meminfo, /proc/stat and
+os.cpu_count().
+
+The limit moves between floor and ceiling: +1 while every slot is busy
+and memory has room for one more probe at the current per-probe average
+(and CPU has headroom), ×0.75 once memory crosses `mem_high`,
+-1 when CPU is pegged. Past `mem_critical` no new probe is admitted at all,
+floor or not, until in-flight probes finish and memory comes back down.
+Every tick spent paused calls `on_pause` (e.g. DriverPool.release_idle) so
+idle browsers give their memory back. If memory is still critical with
+nothing in flight after `max_pause` seconds, one probe at a time is let
+through anyway, so the run cannot stall for good.
+Every change is logged, and the timeline is summarised in stats().
+"""
+
+import os, threading, time
+from contextlib import contextmanager
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _stat(path: str, key: str) -> int:
+    for line in _read(path).splitlines():
+        name, _, value = line.partition(" ")
+        if name == key:
+            return int(value)
+    return 0
+
+
+def _meminfo() -> dict:
+    out = {}
+    for line in _read("/proc/meminfo").splitlines():
+        name, _, value = line.partition(":")
+        out[name] = int(value.split()[0]) * 1024
+    return out
+
+
+def _host_cpu_secs() -> float:
+    fields = _read("/proc/stat").splitlines()[0].split()[1:]
+    busy   = sum(int(v) for i, v in enumerate(fields[:8]) if i not in (3, 4))   # minus idle, iowait
+    return busy / os.sysconf("SC_CLK_TCK")
+
+
+class CgroupStats:
+    """Memory and CPU of the container, whichever cgroup version it runs under."""
+
+    def __init__(self, root: str = CGROUP_ROOT):
+        self.root    = root
+        self.version = 2 if os.path.exists(f"{root}/cgroup.controllers") else \
+                       1 if os.path.exists(f"{root}/memory/memory.limit_in_bytes") else 0
+        host_mem     = _meminfo().get("MemTotal", 0)
+        limit        = self._memory_limit()
+        self.mem_limit = limit if 0 < limit < host_mem else host_mem
+        self.cpus      = self._cpu_quota() or float(os.cpu_count() or 1)
+
+    def _memory_limit(self) -> int:
+        raw = _read(f"{self.root}/memory.max") if self.version == 2 else \
+              _read(f"{self.root}/memory/memory.limit_in_bytes") if self.version == 1 else ""
+        return int(raw) if raw.isdigit() else 0
+
+    def _cpu_quota(self) -> float:
+        if self.version == 2:
+            quota, _, period = _read(f"{self.root}/cpu.max").partition(" ")
+        elif self.version == 1:
+            quota  = _read(f"{self.root}/cpu/cpu.cfs_quota_us")
+            period = _read(f"{self.root}/cpu/cpu.cfs_period_us")
+        else:
+            return 0.0
+        if not quota.isdigit() or not period.isdigit():
+            return 0.0      # "max" / -1: unlimited
+        return int(quota) / int(period)
+
+    def memory_used(self) -> int:
+        """Working set in bytes."""
+        if self.version == 2:
+            usage, inactive = int(_read(f"{self.root}/memory.current") or 0), \
+                              _stat(f"{self.root}/memory.stat", "inactive_file")
+        elif self.version == 1:
+            usage, inactive = int(_read(f"{self.root}/memory/memory.usage_in_bytes") or 0), \
+                              _stat(f"{self.root}/memory/memory.stat", "total_inactive_file")
+        else:
+            info = _meminfo()
+            return info.get("MemTotal", 0) - info.get("MemAvailable", 0)
+        return max(0, usage - inactive)
+
+    def cpu_secs(self) -> float:
+        """Cumulative CPU time of the container in seconds."""
+        if self.version == 2:
+            return _stat(f"{self.root}/cpu.stat", "usage_usec") / 1e6
+        if self.version == 1:
+            raw = _read(f"{self.root}/cpuacct/cpuacct.usage")
+            if raw.isdigit():
+                return int(raw) / 1e9
+        return _host_cpu_secs()
+
+
+class AdaptiveLimiter:
+    """
+    Admission control for probe threads: `with limiter.slot(): ...` blocks
+    until the current limit has room. Submit up to `ceiling` threads.
+    """
+
+    def __init__(self, start: int, floor: int, ceiling: int, interval: float = 2.0,
+                 mem_high: float = 0.80, mem_critical: float = 0.90, cpu_high: float = 0.90,
+                 stats_source: CgroupStats = None, on_resize=None, on_pause=None,
+                 max_pause: float = 30.0):
+        self.floor        = max(1, floor)
+        self.ceiling      = max(self.floor, ceiling)
+        self.limit        = min(max(start, self.floor), self.ceiling)
+        self.interval     = interval
+        self.mem_high     = mem_high
+        self.mem_critical = mem_critical
+        self.cpu_high     = cpu_high
+        self.cgroup       = stats_source or CgroupStats()
+        self.on_resize    = on_resize       # on_resize(limit), e.g. DriverPool.resize
+        self.on_pause     = on_pause        # on_pause(), e.g. DriverPool.release_idle
+        self.max_pause    = max_pause
+        self.in_flight    = 0
+        self.paused       = False
+        self._paused_at   = 0.0
+        self._cond        = threading.Condition()
+        self._stop        = threading.Event()
+        self._thread      = threading.Thread(target=self._run, name="autoscale", daemon=True)
+        self._t0          = time.monotonic()
+        self.timeline     = [(0.0, self.limit)]     # (seconds into the run, limit)
+        self.counters     = {"grown": 0, "shrunk": 0, "paused": 0, "paused_secs": 0.0,
+                             "forced": 0, "peak_mem_frac": 0.0, "peak_cpu_frac": 0.0}
+
+    @property
+    def adaptive(self) -> bool:
+        return self.ceiling > self.floor
+
+    def start(self):
+        print(f"  → autoscale: {self.limit} probes in flight (floor {self.floor}, ceiling {self.ceiling}; "
+              f"cgroup v{self.cgroup.version or '-'}, {self.cgroup.mem_limit // 2**20} MB, "
+              f"{self.cgroup.cpus:g} CPUs)")
+        self._thread.start()
+        return self
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self.in_flight >= self.limit or (self.paused and not self._force_one()):
+                self._cond.wait(self.interval)
+            self.in_flight += 1
+        try:
+            yield self.limit
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify()
+
+    def _force_one(self) -> bool:
+        """Paused too long with nothing in flight: let one probe through (caller holds _cond)."""
+        if self.in_flight or time.monotonic() - self._paused_at < self.max_pause:
+            return False
+        self.counters["forced"] += 1
+        return True
+
+    def _run(self):
+        cpu_prev, t_prev = self.cgroup.cpu_secs(), time.monotonic()
+        while not self._stop.wait(self.interval):
+            cpu_now, t_now = self.cgroup.cpu_secs(), time.monotonic()
+            cpu_frac = (cpu_now - cpu_prev) / max(t_now - t_prev, 1e-6) / self.cgroup.cpus
+            cpu_prev, t_prev = cpu_now, t_now
+            mem_frac = self.cgroup.memory_used() / self.cgroup.mem_limit if self.cgroup.mem_limit else 0.0
+            self._adjust(mem_frac, cpu_frac)
+
+    def _adjust(self, mem_frac: float, cpu_frac: float):
+        with self._cond:
+            self.counters["peak_mem_frac"] = max(self.counters["peak_mem_frac"], round(mem_frac, 3))
+            self.counters["peak_cpu_frac"] = max(self.counters["peak_cpu_frac"], round(cpu_frac, 3))
+            if self.paused:
+                self.counters["paused_secs"] += self.interval
+
+            was_paused, old = self.paused, self.limit
+            self.paused     = mem_frac >= self.mem_critical
+            if mem_frac >= self.mem_high:
+                self.limit = max(self.floor, int(self.limit * 0.75))
+            elif cpu_frac >= self.cpu_high:
+                self.limit = max(self.floor, self.limit - 1)
+            elif self.in_flight >= self.limit and \
+                    mem_frac + mem_frac / max(self.in_flight, 1) < self.mem_high:
+                self.limit = min(self.ceiling, self.limit + 1)
+
+            if self.paused and not was_paused:
+                self.counters["paused"] += 1
+                self._paused_at = time.monotonic()
+            if self.limit != old:
+                self.counters["grown" if self.limit > old else "shrunk"] += 1
+                self.timeline.append((round(time.monotonic() - self._t0, 1), self.limit))
+            self._cond.notify_all()
+            in_flight = self.in_flight
+
+        if self.limit != old or self.paused != was_paused:
+            state = "  PAUSED (memory critical)" if self.paused else "  resumed" if was_paused else ""
+            print(f"  → autoscale: {old} → {self.limit} probes in flight  "
+                  f"(running {in_flight}, mem {mem_frac:.0%}, cpu {cpu_frac:.0%}){state}")
+        if self.limit != old and self.on_resize:
+            self.on_resize(self.limit)
+        if self.paused and self.on_pause:
+            self.on_pause()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(self.interval + 1)
+
+    def stats(self) -> dict:
+        """Counters plus the limit's min / max / time-weighted mean over the run."""
+        with self._cond:
+            points = self.timeline + [(round(time.monotonic() - self._t0, 1), self.limit)]
+            out    = dict(self.counters)
+        span = points[-1][0] or 1.0
+        out["paused_secs"] = round(out["paused_secs"], 1)
+        out["limit_min"]   = min(limit for _, limit in points)
+        out["limit_max"]   = max(limit for _, limit in points)
+        out["limit_mean"]  = round(sum(limit * (t2 - t1) for (t1, limit), (t2, _) in
+                                       zip(points, points[1:])) / span, 1)
+        out["timeline"]    = " ".join(f"{t:g}s:{limit}" for t, limit in self.timeline)
+        return out
@@ -0,0 +1,335 @@
+"""
+chrome-runner/cdp.py
+Minimal DevTools Protocol client for CHROME_BACKEND=cdp. It attaches a raw
+websocket (websocket-client, already a selenium dependency) to the page of
+a pooled driver and drives the navigation itself with the Network and Page
+domains enabled, so one navigation yields everything the record needs:
+  Network.responseReceived  status, remote IP/port, ALPN protocol, timing,
+                            securityDetails (protocol, cipher, key exchange,
+                            issuer, validTo)
+  Network.loadingFailed     net::ERR_* text, mapped to curl exit codes
+
+BrowserContexts (CHROME_BACKEND=contexts) goes one step further: a single
+browser serves many probes at once, each in its own browser context
+(Target.createBrowserContext), which Chrome isolates like a separate
+incognito profile: cookies, cache, socket pools, HSTS and TLS session
+cache. The context is disposed right after its navigation.
+
+CHROME_PROFILE=tls: navigate(stop_at_response=True, block=True) pauses
+subresource requests in the Fetch domain and fails images, fonts, media
+and anything third-party, and returns as soon as the main document's
+response headers are in, instead of waiting for the load event.
+"""
+
+import datetime, itertools, json, threading, time, urllib.parse, urllib.request
+from contextlib import contextmanager
+
+import websocket
+
+# Chrome net errors → the curl exit codes the KQL already understands.
+NET_ERROR_EXITS = {
+    "net::ERR_NAME_NOT_RESOLVED":        6,
+    "net::ERR_NAME_RESOLUTION_FAILED":   6,
+    "net::ERR_CONNECTION_REFUSED":       7,
+    "net::ERR_CONNECTION_FAILED":        7,
+    "net::ERR_ADDRESS_UNREACHABLE":      7,
+    "net::ERR_INTERNET_DISCONNECTED":    7,
+    "net::ERR_TIMED_OUT":                28,
+    "net::ERR_CONNECTION_TIMED_OUT":     28,
+    "net::ERR_EMPTY_RESPONSE":           52,
+    "net::ERR_CONNECTION_RESET":         56,
+    "net::ERR_CONNECTION_CLOSED":        56,
+}
+NET_ERROR_PREFIX_EXITS = [
+    ("net::ERR_CERT_", 60),    # curl: peer certificate cannot be authenticated
+    ("net::ERR_SSL_",  35),
+    ("net::ERR_QUIC_", 96),    # curl: QUIC connection error
+]
+
+# CHROME_PROFILE=tls: subresources that never reach the probe's handshake.
+BLOCKED_RESOURCE_TYPES = ("Image", "Font", "Media")
+# Everything else below the main document is paused too, so third-party
+# origins can be failed; same-origin requests are let through.
+FETCH_PATTERNS = [{"urlPattern": "*", "resourceType": t, "requestStage": "Request"}
+                  for t in BLOCKED_RESOURCE_TYPES + ("Stylesheet", "Script", "XHR", "Fetch",
+                                                     "EventSource", "WebSocket", "Manifest",
+                                                     "Ping", "Prefetch", "Other")]
+# Same idea for the webdriver backend, which has no event loop to answer
+# Fetch.requestPaused: Network.setBlockedURLs by file extension.
+BLOCKED_URL_PATTERNS = [f"*.{ext}*" for ext in (
+    "png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico",
+    "woff", "woff2", "ttf", "otf", "eot",
+    "mp4", "webm", "mp3", "ogg", "m3u8")]
+
+
+class CdpError(Exception):
+    pass
+
+
+class BrowserSessionError(CdpError):
+    """
+    A probe's context / target could not be set up. Not the navigation's
+    fault; `fatal` when the browser-level session could not be reopened
+    either, so the browser should be replaced.
+    """
+
+    def __init__(self, message: str, fatal: bool = False):
+        super().__init__(message)
+        self.fatal = fatal
+
+
+# Errors that mean the session (or the browser behind it) is unusable.
+# TimeoutError is an OSError too; callers must catch it first.
+SESSION_ERRORS = (CdpError, websocket.WebSocketException, OSError)
+
+
+class CdpSession:
+    """One websocket to one page target. Not thread-safe: one probe at a time."""
+
+    def __init__(self, ws_url: str, timeout: float = 30):
+        self.ws     = websocket.create_connection(ws_url, timeout=timeout, suppress_origin=True)
+        self.events = []              # events read while waiting for a command reply
+        self._ids   = itertools.count(1)
+
+    def _recv(self, deadline: float) -> dict:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("DevTools wait timed out")
+        self.ws.settimeout(remaining)
+        try:
+            return json.loads(self.ws.recv())
+        except websocket.WebSocketTimeoutException:
+            raise TimeoutError("DevTools wait timed out") from None
+
+    def call(self, method: str, params: dict = None, timeout: float = 10) -> dict:
+        msg_id   = next(self._ids)
+        deadline = time.monotonic() + timeout
+        self.ws.send(json.dumps({"id": msg_id, "method": method, "params": params or {}}))
+        while True:
+            msg = self._recv(deadline)
+            if msg.get("id") == msg_id:
+                if "error" in msg:
+                    raise CdpError(f"{method}: {msg['error'].get('message', msg['error'])}")
+                return msg.get("result", {})
+            if "method" in msg:
+                self.events.append(msg)
+
+    def next_event(self, deadline: float) -> dict:
+        if self.events:
+            return self.events.pop(0)
+        while True:
+            msg = self._recv(deadline)
+            if "method" in msg:
+                return msg
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+def _debugger_json(debugger: str, path: str):
+    with urllib.request.urlopen(f"http://{debugger}/json/{path}", timeout=10) as resp:
+        return json.load(resp)
+
+
+def _page_session(ws_url: str) -> CdpSession:
+    session = CdpSession(ws_url)
+    try:
+        session.call("Network.enable")
+        session.call("Page.enable")
+    except Exception:
+        session.close()
+        raise
+    return session
+
+
+def attach(driver) -> CdpSession:
+    """Open a session on the driver's page target and enable Network + Page."""
+    debugger = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+    pages    = [t for t in _debugger_json(debugger, "list") if t.get("type") == "page"]
+    if not pages:
+        raise CdpError(f"no page target on {debugger}")
+    return _page_session(pages[0]["webSocketDebuggerUrl"])
+
+
+class BrowserContexts:
+    """One running browser; page() hands out a fresh, isolated context per probe. Thread-safe."""
+
+    def __init__(self, driver):
+        self.driver   = driver
+        self.debugger = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+        self.browser  = self._connect()
+        self._lock    = threading.Lock()    # the browser-level session is shared
+
+    def _connect(self) -> CdpSession:
+        return CdpSession(_debugger_json(self.debugger, "version")["webSocketDebuggerUrl"])
+
+    def _call(self, method: str, params: dict = None) -> dict:
+        with self._lock:
+            try:
+                return self.browser.call(method, params)
+            except CdpError:
+                raise                   # an error reply: the session is still in step
+            except (websocket.WebSocketException, OSError) as e:
+                # A late reply may still arrive on this socket and be taken
+                # for the next command's; start over on a new one.
+                self.browser.close()
+                try:
+                    self.browser = self._connect()
+                except (websocket.WebSocketException, OSError) as again:
+                    raise BrowserSessionError(f"{method}: {e}; reconnect failed: {again}",
+                                              fatal=True) from e
+                raise BrowserSessionError(f"{method}: {e}") from e
+
+    @contextmanager
+    def page(self):
+        """
+        Yields a CdpSession on a blank page in a new context; the context is
+        disposed on exit. Any failure before the yield is a BrowserSessionError.
+        """
+        ctx, session = None, None
+        try:
+            try:
+                ctx     = self._call("Target.createBrowserContext",
+                                     {"disposeOnDetach": True})["browserContextId"]
+                target  = self._call("Target.createTarget", {"url": "about:blank", "browserContextId": ctx})
+                session = _page_session(f"ws://{self.debugger}/devtools/page/{target['targetId']}")
+            except BrowserSessionError:
+                raise
+            except SESSION_ERRORS as e:     # TimeoutError included
+                raise BrowserSessionError(f"probe page setup failed: {e}") from e
+            yield session
+        finally:
+            if session:
+                session.close()
+            if ctx:
+                try:
+                    self._call("Target.disposeBrowserContext", {"browserContextId": ctx})
+                except CdpError:
+                    pass
+
+    def quit(self):
+        self.browser.close()
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+def net_error_exit(error_text: str) -> int:
+    if error_text in NET_ERROR_EXITS:
+        return NET_ERROR_EXITS[error_text]
+    for prefix, code in NET_ERROR_PREFIX_EXITS:
+        if error_text.startswith(prefix):
+            return code
+    return 1
+
+
+def _origin(url: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _answer_paused(session: CdpSession, params: dict, origin: str):
+    """Fetch.requestPaused → fail blocked types and third-party origins, continue the rest."""
+    blocked = params.get("resourceType") in BLOCKED_RESOURCE_TYPES \
+        or _origin(params["request"]["url"]) != origin
+    try:
+        if blocked:
+            session.call("Fetch.failRequest", {"requestId": params["requestId"],
+                                               "errorReason": "BlockedByClient"})
+        else:
+            session.call("Fetch.continueRequest", {"requestId": params["requestId"]})
+    except CdpError:
+        pass    # the request went away (page navigated or stopped) before the answer
+
+
+def navigate(session: CdpSession, url: str, timeout: float,
+             stop_at_response: bool = False, block: bool = False) -> dict:
+    """
+    Navigate and wait for the main document's load event (or its failure).
+    → {"response": Network.Response or None, "error": "net::ERR_..." or "",
+       "duration_ms": float}. Raises TimeoutError past `timeout`.
+    stop_at_response: return once the main document's headers arrive and
+    stop the page loading. block: fail images, fonts, media and third-party
+    subresources (see FETCH_PATTERNS).
+    """
+    if not block:
+        return _navigate(session, url, timeout, stop_at_response)
+    session.call("Fetch.enable", {"patterns": FETCH_PATTERNS}, timeout)
+    result = _navigate(session, url, timeout, stop_at_response)
+    # Not left on: a pooled page would stall on paused requests nobody answers.
+    # (On a timeout the caller drops the session, which ends interception too.)
+    session.call("Fetch.disable")
+    return result
+
+
+def _navigate(session: CdpSession, url: str, timeout: float, stop_at_response: bool) -> dict:
+    t0       = time.monotonic()
+    deadline = t0 + timeout
+    nav      = session.call("Page.navigate", {"url": url}, timeout)
+    elapsed  = lambda: (time.monotonic() - t0) * 1000
+    if nav.get("errorText"):
+        return {"response": None, "error": nav["errorText"], "duration_ms": elapsed()}
+
+    loader, main_ids, response = nav.get("loaderId"), set(), None
+    while True:
+        event  = session.next_event(deadline)
+        method = event["method"]
+        params = event.get("params", {})
+        if method == "Network.requestWillBeSent" and params.get("loaderId") == loader \
+                and params.get("type") == "Document":
+            main_ids.add(params["requestId"])
+        elif method == "Fetch.requestPaused":
+            _answer_paused(session, params, _origin(url))
+        elif method == "Network.responseReceived" and params.get("requestId") in main_ids:
+            response = params["response"]
+            if stop_at_response:
+                duration = elapsed()
+                try:
+                    session.call("Page.stopLoading")
+                except CdpError:
+                    pass
+                return {"response": response, "error": "", "duration_ms": duration}
+        elif method == "Network.loadingFailed" and params.get("requestId") in main_ids:
+            return {"response": response, "error": params.get("errorText", "net::ERR_FAILED"),
+                    "duration_ms": elapsed()}
+        elif method == "Page.loadEventFired" and response is not None:
+            # load events from before this navigation are skipped: no response yet
+            return {"response": response, "error": "", "duration_ms": elapsed()}
+
+
+def response_fields(response: dict) -> dict:
+    """Network.Response → record fields (status, peer, negotiated TLS, certificate)."""
+    sec    = response.get("securityDetails") or {}
+    expiry = ""
+    if sec.get("validTo"):
+        expiry = datetime.datetime.utcfromtimestamp(sec["validTo"]).isoformat() + "Z"
+    return {
+        "HttpStatus":     response.get("status", 0),
+        "RemoteIp":       response.get("remoteIPAddress", ""),
+        "RemotePort":     response.get("remotePort", 0),
+        "AlpnProtocol":   response.get("protocol", ""),
+        "TlsProtocol":    sec.get("protocol", ""),
+        "TlsCipher":      sec.get("cipher", ""),
+        "TlsKeyExchange": sec.get("keyExchangeGroup") or sec.get("keyExchange", ""),
+        "CertIssuer":     sec.get("issuer", ""),
+        "CertExpiry":     expiry,
+    }
+
+
+def response_phases(response: dict) -> dict:
+    """
+    Network.ResourceTiming (ms after requestTime, -1 = not applicable) →
+    cumulative offsets for shared.timing.phase_fields().
+    """
+    t = response.get("timing") or {}
+    at = lambda key: max(t.get(key, -1), 0)
+    return {
+        "namelookup":    at("dnsEnd"),
+        "connect":       at("sslStart") or at("connectEnd"),
+        "appconnect":    at("sslEnd"),
+        "starttransfer": at("receiveHeadersEnd"),
+    }
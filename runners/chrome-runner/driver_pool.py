@@ -0,0 +1,296 @@
+"""
+chrome-runner/driver_pool.py
+Long-lived Chrome drivers shared by the probe threads, so a probe pays for
+a navigation and not for a browser start. Drivers are keyed by ip_pref
+("ipv4" / "ipv6") because the family-specific launch flags and resolver
+rules cannot change once Chrome is running.
+
+Between probes a driver is reset so nothing learned from one target
+carries into the next:
+  Network.clearBrowserCache / clearBrowserCookies   (DevTools)
+  Storage.clearDataForOrigin for the probed origin  (DevTools)
+  socket pools flushed, HSTS entry deleted          (chrome://net-internals)
+  back to about:blank
+A driver is recycled (quit, replaced on demand) after `max_navigations`,
+when a reset fails, or when a probe reports it broken (crash, lost session).
+resize() lets the autoscaler (autoscale.py) shrink the pool under memory
+pressure: surplus idle browsers are quit straight away, busy ones on release.
+release_idle() quits every idle browser while admission is paused.
+With a Supervisor (supervisor.py) every browser's process tree is tracked,
+each probe runs under its RSS / wall-clock caps, and quitting a browser
+kills whatever quit() left behind.
+"""
+
+import threading, time
+from contextlib import contextmanager, nullcontext
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from shared.resolve import split_target
+from supervisor import driver_pid
+
+NET_INTERNALS = "chrome://net-internals/#sockets"
+# net-internals WebUI handlers; missing ones are skipped so a Chrome
+# release that renames them only loses that step, not the whole reset.
+NET_INTERNALS_RESET = """
+    const host = arguments[0];
+    if (typeof chrome === 'undefined' || !chrome.send) return false;
+    for (const [msg, args] of [['closeIdleSockets', []], ['flushSocketPools', []],
+                               ['hstsDelete', [host]]]) {
+        try { chrome.send(msg, args); } catch (e) {}
+    }
+    return true;
+"""
+
+
+class PooledDriver:
+    def __init__(self, key: str, driver, start_ms: float):
+        self.key         = key
+        self.driver      = driver
+        self.start_ms    = start_ms
+        self.navigations = 0
+        self.cdp         = None     # DevTools session attached by CHROME_BACKEND=cdp
+        self.killed      = ""       # why the supervisor killed this browser mid-probe
+
+
+class DriverPool:
+    def __init__(self, factory, size: int, max_navigations: int = 50, supervisor=None):
+        """
+        factory(key) → a ready webdriver.Chrome for that ip_pref.
+        size caps the number of live browsers across all keys; an idle browser
+        of another key is quit to make room, so callers should submit probes
+        grouped by key.
+        """
+        self.factory         = factory
+        self.size            = size
+        self.max_navigations = max_navigations
+        self.supervisor      = supervisor
+        self._idle           = {}     # key → [PooledDriver, ...]
+        self._live           = 0
+        self._cond           = threading.Condition()
+        self.counters        = {"started": 0, "start_ms": 0.0, "reused": 0,
+                                "recycled": 0, "broken": 0, "reset_failed": 0, "evicted": 0,
+                                "shrunk": 0}
+
+    @contextmanager
+    def driver(self, key: str, host: str):
+        """
+        Yields (PooledDriver, startup_ms): startup_ms is the browser start this
+        probe had to wait for, 0 when an idle driver was reused. Set
+        `entry.broken = True` inside the block to have the driver replaced.
+        """
+        entry, startup_ms = self._acquire(key)
+        entry.broken = False
+        entry.killed = ""
+        watch = self.supervisor.watch(driver_pid(entry.driver), lambda reason: self._killed(entry, reason)) \
+            if self.supervisor else nullcontext()
+        try:
+            with watch:
+                yield entry, startup_ms
+        except TimeoutException:
+            if entry.killed:
+                raise WebDriverException(f"killed by supervisor: {entry.killed}") from None
+            raise                 # slow page, healthy browser: the reset navigates away
+        except WebDriverException as e:
+            entry.broken = True
+            if entry.killed:
+                raise WebDriverException(f"killed by supervisor: {entry.killed}") from e
+            raise
+        finally:
+            entry.navigations += 1
+            self._release(entry, host)
+
+    def _acquire(self, key: str) -> tuple:
+        victim = None
+        with self._cond:
+            while True:
+                if self._idle.get(key):
+                    self.counters["reused"] += 1
+                    return self._idle[key].pop(), 0.0
+                if self._live < self.size:
+                    self._live += 1
+                    break
+                # Full, but another family may be holding idle browsers.
+                other = next((k for k, v in self._idle.items() if v), None)
+                if other:
+                    victim = self._idle[other].pop()
+                    self.counters["evicted"] += 1
+                    break
+                self._cond.wait()
+        if victim:
+            self._quit(victim)
+
+        t0 = time.monotonic()
+        try:
+            drv = self.factory(key)
+        except Exception:
+            with self._cond:
+                self._live -= 1
+                self._cond.notify()
+            raise
+        start_ms = (time.monotonic() - t0) * 1000
+        if self.supervisor:
+            self.supervisor.register(driver_pid(drv))
+        with self._cond:
+            self.counters["started"]  += 1
+            self.counters["start_ms"] += start_ms
+        return PooledDriver(key, drv, start_ms), start_ms
+
+    @staticmethod
+    def _killed(entry: PooledDriver, reason: str):
+        entry.killed = reason
+        entry.broken = True
+
+    def _release(self, entry: PooledDriver, host: str):
+        keep = not entry.broken and entry.navigations < self.max_navigations
+        if keep:
+            keep = self._reset(entry, host)
+        with self._cond:
+            if keep and self._live > self.size:
+                keep = False
+                self.counters["shrunk"] += 1
+            elif not keep:
+                self.counters["broken" if entry.broken else "recycled"] += 1
+            if keep:
+                self._idle.setdefault(entry.key, []).append(entry)
+            else:
+                self._live -= 1
+            self._cond.notify()
+        if not keep:
+            self._quit(entry)      # outside the lock: retire() can take 15 s
+
+    def resize(self, size: int):
+        surplus = []
+        with self._cond:
+            self.size = size
+            for entries in self._idle.values():
+                while entries and self._live > size:
+                    surplus.append(entries.pop())
+                    self._live -= 1
+            self.counters["shrunk"] += len(surplus)
+            self._cond.notify_all()
+        for entry in surplus:
+            self._quit(entry)
+
+    def release_idle(self):
+        """Quit every idle browser; the size is kept, so they come back on demand."""
+        with self._cond:
+            idle = [entry for entries in self._idle.values() for entry in entries]
+            for entries in self._idle.values():
+                entries.clear()
+            self._live -= len(idle)
+            self.counters["shrunk"] += len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._quit(entry)
+
+    def _reset(self, entry: PooledDriver, host: str) -> bool:
+        drv = entry.driver
+        try:
+            drv.execute_cdp_cmd("Network.clearBrowserCache", {})
+            drv.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            drv.execute_cdp_cmd("Storage.clearDataForOrigin",
+                                {"origin": f"https://{host}", "storageTypes": "all"})
+            drv.get(NET_INTERNALS)
+            drv.execute_script(NET_INTERNALS_RESET, split_target(host)[0])
+            drv.get("about:blank")
+            return True
+        except WebDriverException as e:
+            with self._cond:
+                self.counters["reset_failed"] += 1
+            print(f"  ✗ driver reset failed, recycling: {str(e).splitlines()[0][:200]}")
+            return False
+
+    def _quit(self, entry: PooledDriver):
+        if entry.cdp:
+            entry.cdp.close()
+        if self.supervisor:
+            self.supervisor.retire(driver_pid(entry.driver), lambda: _quietly(entry.driver.quit))
+        else:
+            _quietly(entry.driver.quit)
+
+    def close(self):
+        with self._cond:
+            idle = [entry for entries in self._idle.values() for entry in entries]
+            self._idle.clear()
+            self._live = 0
+        for entry in idle:
+            self._quit(entry)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self.counters)
+        return _with_start_avg(out)
+
+
+class SharedBrowsers:
+    """
+    CHROME_BACKEND=contexts: one browser per key, shared by every probe
+    thread of that family (isolation comes from per-probe browser contexts,
+    see cdp.BrowserContexts). factory(key) → object with .driver and .quit().
+    """
+
+    def __init__(self, factory, supervisor=None):
+        self.factory    = factory
+        self.supervisor = supervisor
+        self._live    = {}                          # key → browser
+        self._locks   = {}                          # key → start lock
+        self._lock    = threading.Lock()
+        self.counters = {"started": 0, "start_ms": 0.0, "broken": 0}
+
+    def get(self, key: str) -> tuple:
+        """→ (browser, startup_ms), starting it if this is the first probe of the family."""
+        with self._lock:
+            start_lock = self._locks.setdefault(key, threading.Lock())
+        with start_lock:
+            if key in self._live:
+                return self._live[key], 0.0
+            t0 = time.monotonic()
+            browser  = self.factory(key)
+            start_ms = (time.monotonic() - t0) * 1000
+            if self.supervisor:
+                self.supervisor.register(driver_pid(browser.driver))
+            with self._lock:
+                self._live[key] = browser
+                self.counters["started"]  += 1
+                self.counters["start_ms"] += start_ms
+            return browser, start_ms
+
+    def discard(self, key: str, browser):
+        """Crashed or unreachable: quit it so the next get() starts a fresh one."""
+        with self._lock:
+            if self._live.get(key) is not browser:
+                return
+            del self._live[key]
+            self.counters["broken"] += 1
+        self._quit(browser)
+
+    def _quit(self, browser):
+        if self.supervisor:
+            self.supervisor.retire(driver_pid(browser.driver), browser.quit)
+        else:
+            browser.quit()
+
+    def close(self):
+        with self._lock:
+            browsers, self._live = list(self._live.values()), {}
+        for browser in browsers:
+            self._quit(browser)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+        return _with_start_avg(out)
+
+
+def _quietly(fn):
+    try:
+        fn()
+    except Exception:
+        pass
+
+
+def _with_start_avg(counters: dict) -> dict:
+    counters["start_ms_avg"] = round(counters["start_ms"] / counters["started"], 1) if counters["started"] else 0.0
+    counters["start_ms"]     = round(counters["start_ms"], 1)
+    return counters
@@ -0,0 +1,211 @@
+"""
+chrome-runner/netlog.py
+CHROME_NETLOG=1: every browser is started with --log-net-log, and after the
+run the files are parsed here into one compact summary per TLS connection,
+uploaded next to the results as {run_id}/{ts}-chrome-netlog.ndjson. For
+routine Chrome runs that replaces the capture VM + VNet TAP + tcpdump path.
+
+A NetLog file is one JSON document, but Chrome writes it one event per
+line ("constants" first), so it is read line by line and per-socket state
+is dropped as soon as the socket closes: memory stays flat however long
+the browser ran. A file cut short by a killed browser is parsed up to
+its last complete line.
+
+Per connection (NetLog SOCKET source):
+  Host             group of the connect job(s) that created the socket
+  Peer, Family     TCP_CONNECT_ATTEMPT address
+  ConnectMs        TCP_CONNECT begin → end
+  HandshakeMs      SSL_CONNECT begin → end
+  TlsVersion, Cipher, Alpn, KeyExchange, Resumed, Ech    SSL_CONNECT end
+  NetError         SSL_CONNECT / TCP_CONNECT net_error, if any
+  Alerts           SSL_ALERT_RECEIVED / SSL_ALERT_SENT descriptions
+  CertChain        SSL_CERTIFICATES_RECEIVED (subject, issuer, expiry,
+                   SHA-256; subject/issuer/expiry need `cryptography`)
+  OfferedVersions  ClientHello supported_versions; only logged with
+                   NETLOG_CAPTURE_MODE=Everything (handshake bytes)
+
+  python3 netlog.py /tmp/netlog/*.json      # summaries as NDJSON on stdout
+"""
+
+import base64, glob, hashlib, itertools, json, os, re, ssl, sys
+
+try:
+    from cryptography import x509
+except ImportError:            # fingerprints only
+    x509 = None
+
+TLS_VERSIONS = {0x0301: "TLSv1", 0x0302: "TLSv1.1", 0x0303: "TLSv1.2", 0x0304: "TLSv1.3"}
+KEY_EXCHANGE_GROUPS = {23: "secp256r1", 24: "secp384r1", 25: "secp521r1", 29: "x25519",
+                       0x11EC: "X25519MLKEM768", 0x6399: "X25519Kyber768Draft00"}
+SUPPORTED_VERSIONS_EXT = 43
+_paths = itertools.count()
+
+
+def new_path(directory: str, run_id: str, ip_pref: str) -> str:
+    """A fresh --log-net-log target for the next browser of this family."""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{run_id}-{ip_pref}-{next(_paths)}.json")
+
+
+def _ms(a: str, b: str) -> float:
+    return round(float(b) - float(a), 2) if a and b else 0.0
+
+
+def _version(v) -> str:
+    return TLS_VERSIONS.get(v, hex(v)) if isinstance(v, int) else (v or "")
+
+
+def _host(group: str) -> str:
+    """"ssl/example.com:443", "https://example.com:443 <...>" → "example.com"."""
+    m = re.search(r"(?:^|/)(\[[^\]]+\]|[^/:\s<>]+)(?::\d+)?(?:\s|$|<)", group)
+    return m.group(1).strip("[]") if m else ""
+
+
+def offered_versions(message_b64: str) -> list:
+    """ClientHello handshake message → supported_versions (GREASE dropped), [] if not there."""
+    b = base64.b64decode(message_b64)
+    if len(b) > 4 and b[0] == 1 and int.from_bytes(b[1:4], "big") == len(b) - 4:
+        b = b[4:]                                          # strip the handshake header
+    try:
+        i  = 2 + 32                                        # legacy_version, random
+        i += 1 + b[i]                                      # session_id
+        i += 2 + int.from_bytes(b[i:i + 2], "big")         # cipher_suites
+        i += 1 + b[i]                                      # compression_methods
+        end = i + 2 + int.from_bytes(b[i:i + 2], "big")
+        i  += 2
+        while i + 4 <= end:
+            ext, size = int.from_bytes(b[i:i + 2], "big"), int.from_bytes(b[i + 2:i + 4], "big")
+            if ext == SUPPORTED_VERSIONS_EXT:
+                raw = b[i + 5:i + 5 + b[i + 4]]
+                return [_version(int.from_bytes(raw[j:j + 2], "big")) for j in range(0, len(raw), 2)
+                        if raw[j] & 0x0F != 0x0A]          # GREASE is 0x?A?A
+            i += 4 + size
+    except IndexError:
+        pass
+    return []
+
+
+def cert_summary(pem: str) -> dict:
+    der = ssl.PEM_cert_to_DER_cert(pem)
+    out = {"Sha256": hashlib.sha256(der).hexdigest()}
+    if x509:
+        cert  = x509.load_der_x509_certificate(der)
+        after = cert.not_valid_after_utc.replace(tzinfo=None) if hasattr(cert, "not_valid_after_utc") \
+            else cert.not_valid_after
+        out.update(Subject=cert.subject.rfc4514_string(), Issuer=cert.issuer.rfc4514_string(),
+                   NotAfter=after.isoformat() + "Z")
+    return out
+
+
+class _Names:
+    """NetLog constants: numeric ids → names for event types, source types and phases."""
+
+    def __init__(self, constants: dict):
+        self.events  = {v: k for k, v in constants.get("logEventTypes", {}).items()}
+        self.sources = {v: k for k, v in constants.get("logSourceType", {}).items()}
+        self.phases  = {v: k for k, v in constants.get("logEventPhase", {}).items()}
+
+
+def _events(f):
+    """Yields (names, event) for every complete event line of an open NetLog file."""
+    names = _Names({})
+    for line in f:
+        s = line.strip().rstrip(",")
+        if s.startswith('{"constants":'):
+            names = _Names(json.loads(s[len('{"constants":'):]))
+        elif s.startswith("{") and '"phase"' in s:
+            try:
+                yield names, json.loads(s)
+            except ValueError:
+                return          # truncated last line of a killed browser
+        elif s.startswith("]"):
+            return
+
+
+def summarize(path: str):
+    """Yields one summary dict per socket that attempted a TLS handshake."""
+    groups, parents, sockets = {}, {}, {}   # source id → host / source it depends on / socket state
+
+    def host_of(sid) -> str:
+        for _ in range(4):        # socket → transport job → SSL job → ...
+            if sid is None or sid in groups:
+                break
+            sid = parents.get(sid)
+        return groups.get(sid, "")
+
+    def finish(sid):
+        s = sockets.pop(sid, None)
+        if not s or not s.pop("tls"):
+            return None
+        del s["t"]
+        s["Host"] = host_of(sid)
+        return s
+
+    with open(path, errors="replace") as f:
+        for names, ev in _events(f):
+            sid    = ev["source"]["id"]
+            etype  = names.events.get(ev["type"], "")
+            phase  = names.phases.get(ev["phase"], "")
+            params = ev.get("params") or {}
+
+            group = params.get("group_id") or params.get("group_name") or params.get("host_and_port")
+            if group and sid not in groups:
+                groups[sid] = _host(group)
+            dep = (params.get("source_dependency") or {}).get("id")
+            if dep is not None and sid not in parents:
+                parents[sid] = dep
+            if names.sources.get(ev["source"]["type"]) != "SOCKET":
+                continue
+
+            s = sockets.setdefault(sid, {
+                "Host": "", "Peer": "", "Family": "", "ConnectMs": 0.0, "HandshakeMs": 0.0,
+                "TlsVersion": "", "Cipher": "", "Alpn": "", "KeyExchange": "", "Resumed": False,
+                "Ech": False, "NetError": 0, "Alerts": [], "CertChain": [], "OfferedVersions": [],
+                "tls": False, "t": {}})
+            if etype == "SOCKET_ALIVE" and phase == "PHASE_END":
+                summary = finish(sid)
+                if summary:
+                    yield summary
+            elif etype == "TCP_CONNECT_ATTEMPT" and phase == "PHASE_BEGIN":
+                s["Peer"]   = params.get("address", "")
+                s["Family"] = "IPv6" if s["Peer"].startswith("[") else "IPv4"
+            elif etype in ("TCP_CONNECT", "SSL_CONNECT"):
+                if phase == "PHASE_BEGIN":
+                    s["t"][etype] = ev["time"]
+                    s["tls"] |= etype == "SSL_CONNECT"
+                    continue
+                took = _ms(s["t"].get(etype), ev["time"])
+                s["ConnectMs" if etype == "TCP_CONNECT" else "HandshakeMs"] = took
+                s["NetError"] = params.get("net_error", s["NetError"])
+                if etype == "SSL_CONNECT" and "net_error" not in params:
+                    group = params.get("key_exchange_group", 0)
+                    s.update(TlsVersion=_version(params.get("version")),
+                             Cipher=f"0x{params.get('cipher_suite', 0):04X}",
+                             Alpn=params.get("next_proto", ""),
+                             KeyExchange=KEY_EXCHANGE_GROUPS.get(group, str(group or "")),
+                             Resumed=bool(params.get("is_resumed")),
+                             Ech=bool(params.get("encrypted_client_hello")))
+            elif etype == "SSL_CERTIFICATES_RECEIVED":
+                s["CertChain"] = [cert_summary(pem) for pem in params.get("certificates", [])]
+            elif etype in ("SSL_ALERT_RECEIVED", "SSL_ALERT_SENT"):
+                s["Alerts"].append(f"{etype.rsplit('_', 1)[1].lower()}:{params.get('description', '?')}")
+            elif etype == "SSL_HANDSHAKE_MESSAGE_SENT" and params.get("type") == 1 and params.get("bytes"):
+                s["OfferedVersions"] = offered_versions(params["bytes"])
+
+    for sid in list(sockets):      # browser quit (or was killed) with sockets still open
+        summary = finish(sid)
+        if summary:
+            yield summary
+
+
+def summarize_dir(directory: str):
+    """Yields (file name, summary) for every NetLog file in the directory."""
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        for summary in summarize(path):
+            yield os.path.basename(path), summary
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        for summary in summarize(path):
+            print(json.dumps(summary, separators=(",", ":")))
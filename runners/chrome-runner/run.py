@@ -2,40 +2,120 @@
 chrome-runner/run.py
 Invokes Chrome (Selenium) against each target using DEFAULT TLS settings —
 simulating real browser behavior. Tests both IPv4 and IPv6 via DNS resolution
-hints passed through Chrome flags.
+hints passed through Chrome flags. Results are streamed to Blob as NDJSON
+(see shared/sink.py) and to Log Analytics (see shared/law.py) while probes
+are still running.
 
 ENV VARS expected:
-  TARGETS_JSON     — JSON array of hostnames
+  TARGETS_JSON     — JSON array of hostnames (optionally host:port)
   RUN_ID           — unique run identifier
   STORAGE_CONN_STR — Azure Storage connection string
   LAW_WORKSPACE_ID — Log Analytics workspace ID
   LAW_SHARED_KEY   — Log Analytics shared key
+  LAW_ENDPOINT     — optional ingestion URL override (e.g. the shared/law_stub.py stub)
   CHROME_WORKERS   — parallel Chrome instances (default: 4, Chrome is heavy)
+  CHROME_WORKERS_MIN / CHROME_WORKERS_MAX — floor / ceiling for the probes in
+                     flight, which autoscale.py moves with the container's cgroup
+                     memory and CPU use (default: 1 / the starting value)
+  CHROME_MEM_HIGH / CHROME_MEM_CRITICAL — working-set fraction of the memory limit
+                     at which to shrink / stop admitting probes (default: 0.80 / 0.90)
+  CHROME_MAX_NAVIGATIONS — probes per pooled browser before it is replaced (default: 50)
+  CHROME_BACKEND   — "webdriver" (default, driver.get + navigation timing)
+                     | "cdp" (DevTools Network events: real status, peer, TLS details, see cdp.py)
+                     | "contexts" (as cdp, but one browser per IP family and a fresh
+                       browser context per probe; CHROME_CONTEXTS probes in flight)
+  CHROME_CONTEXTS  — concurrent probes per run with CHROME_BACKEND=contexts (default: 20)
+  CHROME_PROFILE   — "pageload" (default, full page load as a user sees it)
+                     | "tls" (images, fonts, media and third-party requests blocked;
+                       ProbeMode "ttfb", DurationMs = time to the main document's
+                       response headers; the cdp backends stop right there. The
+                       webdriver backend only blocks by extension and stops at
+                       DOMContentLoaded: ProbeMode "domcontent")
+  RESOLVER_WORKERS — concurrent DNS lookups in the pre-resolution stage (default: 32)
+  RESOLVE_OVERRIDES — optional JSON {"host": ["addr", ...]} answered without DNS (used by bench/)
+  PROBE_TIMEOUT_SECS — page load timeout (default: 20)
+  CHROME_QUIC      — "default" (Chrome decides, as users get it)
+                     | "compare" (every host and family probed twice, QUIC forced on and
+                       forced off; QuicMode "on" / "off", see KQL query #11)
+  CHROME_SUPERVISOR — "1" (default): track every browser's process tree, kill leftovers
+                     and leaks, reap zombies (see supervisor.py); "0" to disable
+  CHROME_PROBE_RSS_MB — per-probe cap on the browser tree's summed RSS (default: 1500)
+  CHROME_PROBE_WALL_SECS — per-probe wall-clock cap (default: 3 × PROBE_TIMEOUT_SECS)
+  CHROME_NETLOG    — "1": run every browser with --log-net-log and upload a per-connection
+                     TLS summary as {run_id}/{ts}-chrome-netlog.ndjson (see netlog.py)
+  NETLOG_DIR       — where the raw NetLog files go (default: /tmp/netlog)
+  NETLOG_CAPTURE_MODE — Default | IncludeSensitive | Everything (default: Default;
+                     Everything adds the offered TLS versions, at several times the size)
+  CHROME_USER_DATA_TEMPLATE — pre-baked profile every browser starts from a copy of
+                     (default: /home/runner/chrome-template, baked into the image; baked
+                     at start if missing; "" for a fresh profile per browser, see chrome_profile.py)
+  RESULTS_DIR      — optional local directory that also receives the NDJSON results
+  CHROME_IGNORE_CERT_ERRORS — "1": accept untrusted certificates (bench/ only, for the
+                     loopback farm's self-signed one; never set for real runs)
+  CAPTURE_AGENT_URL — optional capture-agent base URL; the runner registers its addresses
+                     there before probing (see shared/capture.py)
 """
 
-import os, json, uuid, datetime, time, hashlib, hmac, base64, urllib.request
+import os, json, uuid, datetime, time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from azure.storage.blob import BlobServiceClient
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.common.exceptions import WebDriverException
+import cdp, chrome_profile, netlog
+from autoscale import AdaptiveLimiter
+from driver_pool import DriverPool, SharedBrowsers
+from supervisor import Supervisor
+from shared import capture, resolve, timing
+from shared.law import LawIngestor
+from shared.sink import ResultSink
 
 TARGETS      = json.loads(os.environ.get("TARGETS_JSON", "[]"))
 RUN_ID       = os.environ.get("RUN_ID", str(uuid.uuid4()))
 STORAGE_CONN = os.environ.get("STORAGE_CONN_STR", "")
 LAW_WS_ID    = os.environ.get("LAW_WORKSPACE_ID", "")
 LAW_KEY      = os.environ.get("LAW_SHARED_KEY", "")
+LAW_ENDPOINT = os.environ.get("LAW_ENDPOINT", "")
 MAX_WORKERS  = int(os.environ.get("CHROME_WORKERS", "4"))
-TIMEOUT_SECS = 20
+TIMEOUT_SECS = int(os.environ.get("PROBE_TIMEOUT_SECS", "20"))
+MAX_NAVIGATIONS = int(os.environ.get("CHROME_MAX_NAVIGATIONS", "50"))
+CHROME_BACKEND  = os.environ.get("CHROME_BACKEND", "webdriver")
+CHROME_CONTEXTS = int(os.environ.get("CHROME_CONTEXTS", "20"))
+CHROME_PROFILE  = os.environ.get("CHROME_PROFILE", "pageload")
+TLS_PROFILE     = CHROME_PROFILE == "tls"
+# webdriver cannot answer Fetch.requestPaused or stop at the headers, so its
+# tls-profile rows measure something else and must not share a ProbeMode.
+PROBE_MODE      = ("pageload" if not TLS_PROFILE else
+                   "domcontent" if CHROME_BACKEND == "webdriver" else "ttfb")
+QUIC_MODES      = ("on", "off") if os.environ.get("CHROME_QUIC", "default") == "compare" else ("",)
+WORKERS_MIN     = int(os.environ.get("CHROME_WORKERS_MIN", "1"))
+WORKERS_MAX     = int(os.environ.get("CHROME_WORKERS_MAX", "0"))    # 0 = the starting value
+MEM_HIGH        = float(os.environ.get("CHROME_MEM_HIGH", "0.80"))
+MEM_CRITICAL    = float(os.environ.get("CHROME_MEM_CRITICAL", "0.90"))
+SUPERVISE       = os.environ.get("CHROME_SUPERVISOR", "1") == "1"
+PROBE_RSS_MB    = int(os.environ.get("CHROME_PROBE_RSS_MB", "1500"))
+PROBE_WALL_SECS = float(os.environ.get("CHROME_PROBE_WALL_SECS", str(3 * TIMEOUT_SECS)))
+NETLOG          = os.environ.get("CHROME_NETLOG", "0") == "1"
+NETLOG_DIR      = os.environ.get("NETLOG_DIR", "/tmp/netlog")
+NETLOG_MODE     = os.environ.get("NETLOG_CAPTURE_MODE", "Default")
+PROFILE_TEMPLATE  = os.environ.get("CHROME_USER_DATA_TEMPLATE", "/home/runner/chrome-template")
+RESOLVER_WORKERS  = int(os.environ.get("RESOLVER_WORKERS", "32"))
+RESOLVE_OVERRIDES = json.loads(os.environ.get("RESOLVE_OVERRIDES", "{}"))
+RESULTS_DIR       = os.environ.get("RESULTS_DIR", "")
+CAPTURE_AGENT_URL = os.environ.get("CAPTURE_AGENT_URL", "")
+IGNORE_CERT_ERRORS = os.environ.get("CHROME_IGNORE_CERT_ERRORS", "0") == "1"
 
 
-def build_driver(ip_pref: str) -> webdriver.Chrome:
+def build_driver(ip_pref: str, resolver_rules: str = "", quic: str = "") -> webdriver.Chrome:
     """
     ip_pref: "ipv4" | "ipv6"
-    Chrome uses --disable-features=DnsOverHttps and explicit preference flags.
-    True IPv4/IPv6 isolation requires OS-level routing; we use Chrome flags
-    as a best-effort signal.
+    resolver_rules: --host-resolver-rules value pinning every target of this
+    family to its pre-resolved A or AAAA address (see shared/resolve.py), so
+    Chrome does no DNS and can only connect over that family. Fixed for the
+    life of the browser, hence one pool per family.
+    quic: "on" forces HTTP/3 to every origin (no Alt-Svc discovery needed),
+    "off" disables QUIC, "" leaves Chrome's default. Also fixed per browser,
+    so it is part of the pool key (see pool_key).
     """
     opts = Options()
     opts.add_argument("--headless=new")
@@ -43,23 +123,66 @@ def build_driver(ip_pref: str) -> webdriver.Chrome:
     opts.add_argument("--disable-dev-shm-usage")
     opts.add_argument("--disable-gpu")
     opts.add_argument("--disable-extensions")
-    opts.add_argument("--disable-features=DnsOverHttps")
+    for flag in chrome_profile.BACKGROUND_FLAGS:
+        opts.add_argument(flag)
+    # One flag: Chrome only honours the last --disable-features. HTTPS/SVCB
+    # records could hand Chrome alternative endpoints around the pinned address.
+    disabled = ["DnsOverHttps", "UseDnsHttpsSvcb", *chrome_profile.DISABLED_FEATURES]
+    opts.add_argument(f"--disable-features={','.join(disabled)}")
     opts.add_argument("--window-size=1280,720")
     opts.add_argument("--remote-debugging-port=0")  # ephemeral port
+    if resolver_rules:
+        opts.add_argument(f"--host-resolver-rules={resolver_rules}")
+    if IGNORE_CERT_ERRORS:
+        opts.add_argument("--ignore-certificate-errors")
+        opts.accept_insecure_certs = True
+    if quic == "on":
+        opts.add_argument("--enable-quic")
+        opts.add_argument("--origin-to-force-quic-on=*")
+    elif quic == "off":
+        opts.add_argument("--disable-quic")
+    if NETLOG:
+        opts.add_argument(f"--log-net-log={netlog.new_path(NETLOG_DIR, RUN_ID, pool_key(ip_pref, quic))}")
+        opts.add_argument(f"--net-log-capture-mode={NETLOG_MODE}")
 
-    if ip_pref == "ipv4":
-        opts.add_argument("--disable-features=UseDnsHttpsSvcb")
+    if CHROME_BACKEND == "webdriver":
+        # DevTools events via chromedriver's log; the peer address comes from here
         opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if TLS_PROFILE:
+        opts.page_load_strategy = "eager"   # driver.get returns at DOMContentLoaded
+
+    profile = chrome_profile.clone(PROFILE_TEMPLATE) if PROFILE_TEMPLATE else ""
+    if profile:
+        opts.add_argument(f"--user-data-dir={profile}")
 
     svc = Service(executable_path="/usr/local/bin/chromedriver", log_path="/dev/null")
-    drv = webdriver.Chrome(service=svc, options=opts)
+    try:
+        drv = webdriver.Chrome(service=svc, options=opts)
+    except WebDriverException:
+        if profile:
+            chrome_profile.discard(profile)
+        raise
+    if profile:
+        chrome_profile.remove_on_quit(drv, profile)
     drv.set_page_load_timeout(TIMEOUT_SECS)
+    if TLS_PROFILE:
+        try:
+            drv.execute_cdp_cmd("Network.enable", {})
+            drv.execute_cdp_cmd("Network.setBlockedURLs", {"urls": cdp.BLOCKED_URL_PATTERNS})
+        except WebDriverException:
+            drv.quit()
+            raise
     return drv
 
 
-def probe_chrome(host: str, ip_label: str) -> dict:
+def pool_key(ip_label: str, quic: str) -> str:
+    """Browsers are pooled per launch-flag set: "ipv4", "ipv6-quic-on", ..."""
+    return ip_label.lower() + (f"-quic-{quic}" if quic else "")
+
+
+def new_record(host: str, ip_label: str, quic: str = "") -> dict:
     url     = f"https://{host}"
-    result  = {
+    return {
         "TimeGenerated": datetime.datetime.utcnow().isoformat() + "Z",
         "RunId":         RUN_ID,
         "Runner":        "chrome",
@@ -73,73 +196,188 @@ def probe_chrome(host: str, ip_label: str) -> dict:
         "DurationMs":    0.0,
         "CertIssuer":    "",
         "CertExpiry":    "",
+        "ProbeMode":     PROBE_MODE,
+        "DriverStartMs": 0.0,    # browser start this probe waited for (0 = pooled driver reused)
+        "QuicMode":      quic,   # CHROME_QUIC=compare: "on" / "off"; "" = Chrome's default
+        "Concurrency":   0,      # autoscaler's probes-in-flight limit when this probe started
+        # Peer the main document came from, i.e. the pinned address actually used
+        "RemoteIp":       "",
+        "RemotePort":     0,
+        # Negotiated connection details; filled by CHROME_BACKEND=cdp
+        "AlpnProtocol":   "",
+        "TlsProtocol":    "",
+        "TlsCipher":      "",
+        "TlsKeyExchange": "",
+        **timing.phase_fields(),
     }
-    drv = None
-    t0  = time.monotonic()
+
+
+def probe_chrome(pool: DriverPool, host: str, ip_label: str, quic: str = "") -> dict:
+    url     = f"https://{host}"
+    result  = new_record(host, ip_label, quic)
+    t0      = time.monotonic()
     try:
-        drv              = build_driver(ip_label.lower())
-        drv.get(url)
-        elapsed          = (time.monotonic() - t0) * 1000
-        result["HttpStatus"]   = 200  # Chrome doesn't expose HTTP status directly
-        result["CurlExitCode"] = 0
-        result["DurationMs"]   = round(elapsed, 2)
-
-        # Extract TLS info from Chrome security state via JS
-        tls_info = drv.execute_script("""
-            const e = window.performance.getEntriesByType('navigation')[0];
-            return e ? {
-                protocol:    e.nextHopProtocol,
-                transferred: e.transferSize
-            } : null;
-        """)
-        if tls_info:
-            result["ErrorDetail"] = json.dumps(tls_info)
+        with pool.driver(pool_key(ip_label, quic), host) as (entry, startup_ms):
+            result["DriverStartMs"] = round(startup_ms, 2)
+            drv = entry.driver
+            drv.get_log("performance")     # drop events left over from the reset
+            t0  = time.monotonic()    # DurationMs is the navigation alone
+            drv.get(url)
+            elapsed          = (time.monotonic() - t0) * 1000
+            result["CurlExitCode"] = 0
+            result["DurationMs"]   = round(elapsed, 2)
+            response = document_response(drv.get_log("performance"))
+            if response:     # main document's real status, as the cdp backends record it
+                result["HttpStatus"] = response.get("status", 0)
+                result["RemoteIp"]   = response.get("remoteIPAddress", "")
+                result["RemotePort"] = response.get("remotePort", 0)
+
+            # Extract TLS info and phase timings from the navigation timing entry.
+            # Offsets are taken from fetchStart so they line up with curl's time_*.
+            tls_info = drv.execute_script("""
+                const e = window.performance.getEntriesByType('navigation')[0];
+                if (!e) return null;
+                const at = t => t > 0 ? t - e.fetchStart : 0;
+                return {
+                    protocol:    e.nextHopProtocol,
+                    phases: {
+                        namelookup:    at(e.domainLookupEnd),
+                        connect:       at(e.secureConnectionStart || e.connectEnd),
+                        appconnect:    e.secureConnectionStart > 0 ? at(e.connectEnd) : 0,
+                        starttransfer: at(e.responseStart)
+                    }
+                };
+            """)
+            if tls_info:
+                result.update(timing.phase_fields(**tls_info["phases"]))
+                result["AlpnProtocol"] = tls_info["protocol"] or ""
 
     except WebDriverException as e:
         result["ErrorDetail"]   = str(e)[:500]
         result["CurlExitCode"]  = 1
         result["DurationMs"]    = round((time.monotonic() - t0) * 1000, 2)
-    finally:
-        if drv:
-            drv.quit()
 
     return result
 
 
-def send_to_law(records: list):
-    if not LAW_WS_ID or not LAW_KEY:
-        return
-    body        = json.dumps(records).encode("utf-8")
-    rfc1123date = datetime.datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
-    content_len = len(body)
-    sig_str     = f"POST\n{content_len}\napplication/json\nx-ms-date:{rfc1123date}\n/api/logs"
-    sig_bytes   = base64.b64decode(LAW_KEY)
-    sig         = base64.b64encode(
-        hmac.new(sig_bytes, sig_str.encode("utf-8"), hashlib.sha256).digest()
-    ).decode()
-    headers = {
-        "Content-Type":  "application/json",
-        "Authorization": f"SharedKey {LAW_WS_ID}:{sig}",
-        "Log-Type":      "TLSTestResults",
-        "x-ms-date":     rfc1123date,
-    }
-    url = f"https://{LAW_WS_ID}.ods.opinsights.azure.com/api/logs?api-version=2016-04-01"
-    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+def document_response(perf_log: list) -> dict:
+    """Last main-frame Document response in chromedriver's performance log (after redirects)."""
+    main_frame, response = None, None
+    for entry in perf_log:
+        msg    = json.loads(entry["message"])["message"]
+        params = msg.get("params", {})
+        if params.get("type") != "Document":
+            continue
+        if msg["method"] == "Network.requestWillBeSent" and main_frame is None:
+            main_frame = params.get("frameId")
+        elif msg["method"] == "Network.responseReceived" and params.get("frameId") == main_frame:
+            response = params["response"]
+    return response
+
+
+def probe_chrome_cdp(pool: DriverPool, host: str, ip_label: str, quic: str = "") -> dict:
+    """Same probe over a DevTools session: one navigation fills status, peer, TLS and certificate."""
+    url     = f"https://{host}"
+    result  = new_record(host, ip_label, quic)
     try:
-        urllib.request.urlopen(req, timeout=30)
-    except Exception as e:
-        print(f"  ✗ LAW ingest failed: {e}")
+        with pool.driver(pool_key(ip_label, quic), host) as (entry, startup_ms):
+            result["DriverStartMs"] = round(startup_ms, 2)
+            try:
+                if entry.cdp is None:
+                    entry.cdp = cdp.attach(entry.driver)
+                nav = cdp.navigate(entry.cdp, url, TIMEOUT_SECS, TLS_PROFILE, TLS_PROFILE)
+            except TimeoutError:
+                # A recv cut short can leave the websocket mid-frame; re-attach next time.
+                if entry.cdp:
+                    entry.cdp.close()
+                entry.cdp = None
+                result["CurlExitCode"] = 28
+                result["ErrorDetail"]  = f"navigation timed out after {TIMEOUT_SECS}s"
+                result["DurationMs"]   = TIMEOUT_SECS * 1000.0
+                return result
+            except cdp.SESSION_ERRORS as e:
+                entry.broken = True
+                result["CurlExitCode"] = 1
+                result["ErrorDetail"]  = f"killed by supervisor: {entry.killed}" if entry.killed \
+                    else f"DevTools session error: {e}"[:500]
+                return result
+        fill_from_navigation(result, nav)
 
+    except WebDriverException as e:     # browser could not be started
+        result["ErrorDetail"]   = str(e)[:500]
+        result["CurlExitCode"]  = 1
 
-def upload_to_blob(results: list):
-    if not STORAGE_CONN:
-        return
-    client = BlobServiceClient.from_connection_string(STORAGE_CONN)
-    ts     = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    name   = f"{RUN_ID}/{ts}-chrome.json"
-    blob   = client.get_blob_client(container="test-results", blob=name)
-    blob.upload_blob(json.dumps(results, indent=2).encode(), overwrite=True)
-    print(f"  → Uploaded results to blob: test-results/{name}")
+    return result
+
+
+def probe_chrome_context(browsers: SharedBrowsers, host: str, ip_label: str, quic: str = "") -> dict:
+    """CDP probe in a throwaway browser context of the family's shared browser."""
+    url     = f"https://{host}"
+    result  = new_record(host, ip_label, quic)
+    key     = pool_key(ip_label, quic)
+    browser = None
+    try:
+        browser, startup_ms = browsers.get(key)
+        result["DriverStartMs"] = round(startup_ms, 2)
+        with browser.page() as session:
+            fill_from_navigation(result, cdp.navigate(session, url, TIMEOUT_SECS, TLS_PROFILE, TLS_PROFILE))
+    except cdp.BrowserSessionError as e:    # before the navigation: not the target's fault
+        if e.fatal and browser:
+            browsers.discard(key, browser)
+        result["CurlExitCode"] = 1
+        result["ErrorDetail"]  = f"browser session error: {e}"[:500]
+    except TimeoutError:
+        result["CurlExitCode"] = 28
+        result["ErrorDetail"]  = f"navigation timed out after {TIMEOUT_SECS}s"
+        result["DurationMs"]   = TIMEOUT_SECS * 1000.0
+    except cdp.SESSION_ERRORS as e:
+        if browser:
+            browsers.discard(key, browser)
+        result["CurlExitCode"] = 1
+        result["ErrorDetail"]  = f"DevTools session error: {e}"[:500]
+    except WebDriverException as e:     # browser could not be started
+        result["ErrorDetail"]   = str(e)[:500]
+        result["CurlExitCode"]  = 1
+
+    return result
+
+
+def fill_from_navigation(result: dict, nav: dict):
+    if nav["response"]:
+        result.update(cdp.response_fields(nav["response"]))
+        result.update(timing.phase_fields(**cdp.response_phases(nav["response"])))
+    result["CurlExitCode"] = cdp.net_error_exit(nav["error"]) if nav["error"] else 0
+    result["ErrorDetail"]  = nav["error"]
+    result["DurationMs"]   = round(nav["duration_ms"], 2)
+    if TLS_PROFILE:
+        use_ttfb_duration(result)
+
+
+def use_ttfb_duration(result: dict):
+    """CHROME_PROFILE=tls: DurationMs is connect + handshake + TTFB (DNS is pre-resolved)."""
+    ttfb = result["TcpMs"] + result["TlsMs"] + result["TtfbMs"]
+    if result["TtfbMs"]:
+        result["DurationMs"] = round(ttfb, 2)
+
+
+def start_shared_browser(ip_pref: str, rules: str, quic: str = "") -> cdp.BrowserContexts:
+    drv = build_driver(ip_pref, rules, quic)
+    try:
+        return cdp.BrowserContexts(drv)
+    except Exception:
+        drv.quit()
+        raise
+
+
+def upload_netlog_summary():
+    """Browsers are closed, so their NetLog files are complete: one summary row per TLS connection."""
+    out   = ResultSink(STORAGE_CONN, RUN_ID, "chrome-netlog", local_dir=RESULTS_DIR)
+    files = set()
+    for name, summary in netlog.summarize_dir(NETLOG_DIR):
+        files.add(name)
+        out.write({"RunId": RUN_ID, "NetLogFile": name, **summary})
+    out.close()
+    print(f"  → NetLog: {out.records} TLS connections from {len(files)} files")
 
 
 def main():
@@ -148,26 +386,107 @@ def main():
         return
 
     print(f"[chrome-runner] RUN_ID={RUN_ID}  targets={len(TARGETS)}")
+    capture.register(CAPTURE_AGENT_URL, "chrome")
+    global PROFILE_TEMPLATE
+    if PROFILE_TEMPLATE and not chrome_profile.ensure(PROFILE_TEMPLATE):
+        PROFILE_TEMPLATE = ""
     tasks   = [(host, ip) for host in TARGETS for ip in ("IPv4", "IPv6")]
-    print(f"  Total probes: {len(tasks)}  workers: {MAX_WORKERS}")
+    tasks   = [(host, ip, quic) for host, ip in tasks for quic in QUIC_MODES]
+    print(f"  Total probes: {len(tasks)}")
+
+    # Resolve every host once; Chrome is pinned to these addresses, so the
+    # lookup time measured here is what every record reports as DnsMs.
+    dns   = resolve.resolve_all(TARGETS, RESOLVER_WORKERS, RESOLVE_OVERRIDES)
+    addrs = dns.pinned()
+    print(f"  Resolved: {dns.summary()}")
+
+    sink     = ResultSink(STORAGE_CONN, RUN_ID, "chrome", local_dir=RESULTS_DIR)
+    law      = LawIngestor(LAW_WS_ID, LAW_KEY, LAW_ENDPOINT).start()
+    failures = 0
+
+    def collect(r: dict):
+        nonlocal failures
+        r["DnsMs"] = round(dns.millis.get((r["TargetHost"], r["IpVersion"]), r["DnsMs"]), 2)
+        sink.write(r)
+        law.submit(r)
+        failures += r["CurlExitCode"] != 0
+
+    # Cells with no address in their family are recorded straight away
+    # instead of launching a browser for them.
+    skipped = 0
+    for host, ip, quic in tasks:
+        if (host, ip) not in addrs:
+            r = new_record(host, ip, quic)
+            r["CurlExitCode"] = resolve.NO_ADDRESS_EXIT
+            r["ErrorDetail"]  = dns.no_address_error(host, ip)
+            collect(r)
+            skipped += 1
+    # Browser kind by browser kind: the pool then only swaps browsers over once per kind.
+    tasks = sorted((t for t in tasks if t[:2] in addrs), key=lambda t: pool_key(t[1], t[2]))
+
+    # One resolver-rule set per family, covering every target, so a pooled
+    # browser can probe any host of its family.
+    rules = {
+        ip.lower(): ", ".join(dict.fromkeys(
+            resolve.chrome_rule(host, addr) for (host, fam), addr in addrs.items() if fam == ip))
+        for ip in ("IPv4", "IPv6")
+    }
+    workers = CHROME_CONTEXTS if CHROME_BACKEND == "contexts" else MAX_WORKERS
+    ceiling = WORKERS_MAX or workers
+    if CHROME_BACKEND == "contexts":
+        # CHROME_WORKERS_MAX is sized for pooled browsers; contexts are far
+        # cheaper, so it never clamps CHROME_CONTEXTS below its own value.
+        ceiling = max(ceiling, workers)
+    limiter = AdaptiveLimiter(workers, WORKERS_MIN, ceiling,
+                              mem_high=MEM_HIGH, mem_critical=MEM_CRITICAL)
+
+    def launch(key: str, build):
+        ip_pref, _, quic = key.partition("-quic-")
+        return build(ip_pref, rules[ip_pref], quic)
+
+    supervisor = Supervisor(PROBE_RSS_MB, PROBE_WALL_SECS).start() if SUPERVISE else None
+    if CHROME_BACKEND == "contexts":
+        pool  = SharedBrowsers(lambda key: launch(key, start_shared_browser), supervisor)
+        probe = probe_chrome_context
+    else:
+        pool  = DriverPool(lambda key: launch(key, build_driver),
+                           limiter.limit, MAX_NAVIGATIONS, supervisor)
+        probe = probe_chrome_cdp if CHROME_BACKEND == "cdp" else probe_chrome
+        limiter.on_resize = pool.resize
+        limiter.on_pause  = pool.release_idle
+
+    def admitted(host: str, ip: str, quic: str) -> dict:
+        with limiter.slot() as limit:
+            r = probe(pool, host, ip, quic)
+        r["Concurrency"] = limit
+        return r
 
-    results = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        futs = {ex.submit(probe_chrome, host, ip): (host, ip) for host, ip in tasks}
-        done = 0
+    print(f"  Backend: {CHROME_BACKEND}  profile: {CHROME_PROFILE}")
+    limiter.start()
+    with ThreadPoolExecutor(max_workers=limiter.ceiling) as ex:
+        futs = {ex.submit(admitted, *t): t for t in tasks}
+        done, window = 0, time.monotonic()
         for fut in as_completed(futs):
-            results.append(fut.result())
+            collect(fut.result())
             done += 1
             if done % 20 == 0:
-                print(f"  Progress: {done}/{len(tasks)}")
+                rate, window = 20 / max(time.monotonic() - window, 1e-6), time.monotonic()
+                print(f"  Progress: {done}/{len(tasks)}  {rate:.1f} probes/s  law-queue={law.queue_depth}")
+    limiter.close()
+    pool.close()
+    print(f"  → Driver pool: {pool.stats()}")
+    if supervisor:
+        supervisor.close()
+        print(f"  → Supervisor: {supervisor.stats()}")
+    print(f"  → Autoscale: {limiter.stats()}")
+    if NETLOG:
+        upload_netlog_summary()
 
-    print(f"  Probes complete. Uploading {len(results)} records...")
-    upload_to_blob(results)
-    for i in range(0, len(results), 500):
-        send_to_law(results[i:i+500])
+    print(f"  Probes complete. Flushing {done + skipped} records...")
+    sink.close()
+    law.close()
 
-    failures = [r for r in results if r["CurlExitCode"] != 0]
-    print(f"\n  Summary: {len(results)} probes, {len(failures)} failures")
+    print(f"\n  Summary: {done + skipped} probes, {failures} failures")
 
 
 if __name__ == "__main__":
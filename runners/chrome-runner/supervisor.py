@@ -0,0 +1,225 @@
+"""
+chrome-runner/supervisor.py
+Keeps Chrome's process trees in check over long runs. chromedriver starts
+chrome, which starts zygotes, renderers and utility processes; when quit()
+fails or chromedriver hangs those survive, pile up and eventually show up
+as probe timeouts and an OOM kill.
+
+The runner becomes a child subreaper (PR_SET_CHILD_SUBREAPER), so orphaned
+Chrome processes are reparented to it rather than vanishing under PID 1,
+and a watchdog thread scans /proc every `interval` seconds:
+  watch()    per-probe caps: the probe's browser tree is killed when its
+             summed RSS passes `rss_cap_mb` or the probe runs longer than
+             `wall_secs` (the browser is then replaced, counted as a restart)
+  retire()   quit() with a deadline; whatever is left of the tree afterwards
+             is SIGKILLed and counted as leaked
+  sweeps     chrome / chromedriver processes below the runner that belong to
+             no live browser and are older than `grace_secs` are killed
+             (leaked); zombie children are reaped (reaped)
+
+Per-probe caps need a browser per probe (CHROME_BACKEND webdriver / cdp);
+with contexts the shared browsers only get retire() and the sweeps.
+"""
+
+import ctypes, os, signal, threading, time
+from contextlib import contextmanager
+
+PR_SET_CHILD_SUBREAPER = 36
+CHROME_COMMS = ("chrome", "nacl_helper")     # prefix match: chrome, chromedriver, chrome_crashpad
+CLK_TCK      = os.sysconf("SC_CLK_TCK")
+PAGE_BYTES   = os.sysconf("SC_PAGE_SIZE")
+
+
+def _become_subreaper() -> bool:
+    try:
+        return ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def snapshot() -> dict:
+    """pid → (ppid, comm, state, rss_bytes, age_secs) for every process we can see."""
+    with open("/proc/uptime") as f:
+        uptime = float(f.read().split()[0])
+    procs = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                raw = f.read()
+        except OSError:
+            continue                 # exited while we were looking
+        comm   = raw[raw.index("(") + 1:raw.rindex(")")]
+        fields = raw[raw.rindex(")") + 2:].split()     # fields[0] is stat field 3 (state)
+        procs[int(name)] = (int(fields[1]), comm, fields[0],
+                            int(fields[21]) * PAGE_BYTES, uptime - int(fields[19]) / CLK_TCK)
+    return procs
+
+
+def descendants(procs: dict, root: int) -> set:
+    children = {}
+    for pid, (ppid, *_) in procs.items():
+        children.setdefault(ppid, []).append(pid)
+    out, todo = set(), [root]
+    while todo:
+        pid = todo.pop()
+        for child in children.get(pid, ()):
+            if child not in out:
+                out.add(child)
+                todo.append(child)
+    return out
+
+
+def _kill(pids) -> int:
+    killed = 0
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+
+def driver_pid(driver) -> int:
+    """chromedriver's pid: the root of the browser's process tree."""
+    return driver.service.process.pid
+
+
+class Supervisor:
+    def __init__(self, rss_cap_mb: int = 1500, wall_secs: float = 60, interval: float = 1.0,
+                 sweep_secs: float = 10, grace_secs: float = 60, quit_secs: float = 15):
+        self.rss_cap    = rss_cap_mb * 2**20
+        self.wall_secs  = wall_secs
+        self.interval   = interval
+        self.sweep_secs = sweep_secs
+        self.grace_secs = grace_secs
+        self.quit_secs  = quit_secs
+        self.subreaper  = _become_subreaper()
+        self._roots     = set()            # chromedriver pids of live browsers
+        self._watches   = {}               # root pid → (started, on_kill)
+        self._lock      = threading.Lock()
+        self._stop      = threading.Event()
+        self._thread    = threading.Thread(target=self._run, name="supervisor", daemon=True)
+        self.peak_rss   = 0
+        self.counters   = {"leaked": 0, "reaped": 0, "restarts": 0,
+                           "killed_rss": 0, "killed_wall": 0, "quit_hung": 0}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # ── browser lifecycle ────────────────────────────────────
+    def register(self, root: int):
+        with self._lock:
+            self._roots.add(root)
+
+    def retire(self, root: int, quit_fn):
+        """Run quit_fn (driver.quit) with a deadline, then kill whatever of the tree survived."""
+        tree = descendants(snapshot(), root) | {root}
+        with self._lock:
+            self._roots.discard(root)
+            self._watches.pop(root, None)
+        quitter = threading.Thread(target=quit_fn, name="driver-quit", daemon=True)
+        quitter.start()
+        quitter.join(self.quit_secs)
+        if quitter.is_alive():
+            with self._lock:
+                self.counters["quit_hung"] += 1
+        procs  = snapshot()
+        alive  = {pid for pid in tree if pid in procs and procs[pid][2] != "Z"}
+        leaked = _kill(alive)
+        if leaked:
+            with self._lock:
+                self.counters["leaked"] += leaked
+        self._reap(procs)
+
+    @contextmanager
+    def watch(self, root: int, on_kill):
+        """Per-probe RSS and wall-clock caps on one browser; on_kill(reason) runs before the kill."""
+        with self._lock:
+            self._watches[root] = (time.monotonic(), on_kill)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._watches.pop(root, None)
+
+    # ── watchdog ─────────────────────────────────────────────
+    def _run(self):
+        next_sweep = time.monotonic() + self.sweep_secs
+        while not self._stop.wait(self.interval):
+            procs = snapshot()
+            self._check_watches(procs)
+            if time.monotonic() >= next_sweep:
+                self._sweep(procs)
+                self._reap(procs)
+                next_sweep = time.monotonic() + self.sweep_secs
+
+    def _check_watches(self, procs: dict):
+        with self._lock:
+            watches = list(self._watches.items())
+        for root, (started, on_kill) in watches:
+            tree = descendants(procs, root)
+            rss  = sum(procs[pid][3] for pid in tree)
+            self.peak_rss = max(self.peak_rss, rss)
+            took = time.monotonic() - started
+            if rss > self.rss_cap:
+                reason, counter = f"browser RSS {rss // 2**20} MB over {self.rss_cap // 2**20} MB", "killed_rss"
+            elif took > self.wall_secs:
+                reason, counter = f"probe ran {took:.0f}s, over {self.wall_secs:.0f}s", "killed_wall"
+            else:
+                continue
+            with self._lock:
+                if self._watches.pop(root, None) is None:
+                    continue         # probe finished meanwhile
+                self.counters[counter]    += 1
+                self.counters["restarts"] += 1
+            print(f"  ✗ supervisor: killing browser tree of {root}: {reason}")
+            on_kill(reason)
+            _kill(tree)              # chromedriver stays; the pool quits it with the driver
+
+    def _sweep(self, procs: dict):
+        mine = descendants(procs, os.getpid())
+        with self._lock:
+            roots = set(self._roots)
+        owned = set(roots)
+        for root in roots:
+            owned |= descendants(procs, root)
+        stray = [pid for pid in mine - owned
+                 if procs[pid][1].startswith(CHROME_COMMS) and procs[pid][2] != "Z"
+                 and procs[pid][4] > self.grace_secs]    # a browser still starting has no root yet
+        leaked = _kill(stray)
+        if leaked:
+            with self._lock:
+                self.counters["leaked"] += leaked
+            print(f"  ✗ supervisor: killed {leaked} leaked Chrome processes")
+
+    def _reap(self, procs: dict):
+        me     = os.getpid()
+        reaped = 0
+        for pid, (ppid, _, state, *_) in procs.items():
+            if ppid == me and state == "Z":
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        reaped += 1
+                except ChildProcessError:
+                    pass             # already waited for (subprocess.Popen)
+        if reaped:
+            with self._lock:
+                self.counters["reaped"] += reaped
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(self.interval + 1)
+        procs = snapshot()
+        self._sweep({pid: p[:4] + (self.grace_secs + 1,) for pid, p in procs.items()})
+        self._reap(snapshot())
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+        out["subreaper"]         = self.subreaper
+        out["peak_probe_rss_mb"] = self.peak_rss // 2**20
+        return out
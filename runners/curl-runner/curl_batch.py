@@ -0,0 +1,128 @@
+"""
+curl-runner/curl_batch.py
+Batched execution: one `curl --parallel` process per (TLS version × IP
+family) group instead of one curl per cell. Selected with
+PROBE_ENGINE=batch in run.py.
+
+Each group gets a generated config file with one `next`-separated block
+per host, pinned to its pre-resolved address with `resolve`. Every block carries `write-out = "%{json}\\n"`, so curl prints
+one JSON object per finished transfer; `urlnum` in that object is the
+block index and maps the line back to its host. Outcomes are handed back
+as the same (http_code, exit_code, error, duration_ms) tuple run.probe()
+produces, plus the phase timings from the same JSON object.
+"""
+
+import json, os, shlex, subprocess, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.resolve import curl_resolve
+from shared.timing import phase_fields
+
+SHORT_FLAGS = {"-4": "ipv4", "-6": "ipv6"}
+
+
+def _config_lines(flags: str) -> list:
+    """'--tlsv1.0 --tls-max 1.0 -4' → ['tlsv1.0', 'tls-max = "1.0"', 'ipv4']"""
+    lines, tokens = [], shlex.split(flags)
+    while tokens:
+        tok = tokens.pop(0)
+        if tok in SHORT_FLAGS:
+            lines.append(SHORT_FLAGS[tok])
+        elif tokens and not tokens[0].startswith("-"):
+            lines.append(f'{tok[2:]} = "{tokens.pop(0)}"')
+        else:
+            lines.append(tok[2:])
+    return lines
+
+
+def build_config(hosts: list, tls_flags: str, ip_flag: str, timeout: int, pins: dict = None,
+                 mode_flags: str = "") -> str:
+    # `next` resets per-transfer options, so every block repeats them.
+    common = _config_lines(f"{ip_flag} {tls_flags} {mode_flags}") + [
+        'output = "/dev/null"',
+        f'max-time = "{timeout}"',
+        "insecure",           # we're testing connectivity/TLS version, not cert validity
+        'write-out = "%{json}\\n"',
+    ]
+    pins   = pins or {}
+    blocks = [
+        "\n".join([f'url = "https://{host}"']
+                  + ([f'resolve = "{curl_resolve(host, pins[host])}"'] if host in pins else [])
+                  + common)
+        for host in hosts
+    ]
+    return "\nnext\n".join(blocks) + "\n"
+
+
+def run_group(hosts: list, tls_label: str, tls_flags: str, ip_label: str, ip_flag: str,
+              timeout: int, parallel_max: int, on_result, addrs: dict = None,
+              mode_flags: str = "", timer: str = "time_total", ok_codes: tuple = ()):
+    if addrs is not None:
+        hosts = [h for h in hosts if (h, ip_label) in addrs]
+        if not hosts:
+            return
+    pins = {h: addrs[(h, ip_label)] for h in hosts} if addrs else None
+    with tempfile.NamedTemporaryFile("w", prefix=f"curl-{tls_label}-{ip_label}-",
+                                     suffix=".cfg", delete=False) as cfg:
+        cfg.write(build_config(hosts, tls_flags, ip_flag, timeout, pins, mode_flags))
+
+    cmd  = ["curl", "--parallel", "--parallel-max", str(parallel_max), "--silent", "--config", cfg.name]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    # Every transfer is bounded by max-time; the whole batch cannot legitimately
+    # take longer than one max-time per wave of parallel_max transfers.
+    waves    = -(-len(hosts) // parallel_max)
+    watchdog = threading.Timer(waves * timeout + 30, proc.kill)
+    watchdog.start()
+
+    pending = set(range(len(hosts)))
+    try:
+        for line in proc.stdout:
+            try:
+                out = json.loads(line)
+                idx = int(out["urlnum"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if idx not in pending:
+                continue
+            pending.discard(idx)
+            exit_code = int(out.get("exitcode") or 0)
+            exit_code = 0 if exit_code in ok_codes else exit_code
+            on_result((hosts[idx], tls_label, ip_label), (
+                int(out.get("http_code") or 0),
+                exit_code,
+                (out.get("errormsg") or "")[:500] if exit_code != 0 else "",
+                float(out.get(timer) or 0) * 1000,
+            ), phase_fields(*(float(out.get(f"time_{t}") or 0) * 1000
+                              for t in ("namelookup", "connect", "appconnect", "starttransfer"))))
+        proc.wait()
+    finally:
+        watchdog.cancel()
+        os.unlink(cfg.name)
+
+    # Transfers curl never reported (killed by the watchdog, or curl itself died)
+    for idx in sorted(pending):
+        on_result((hosts[idx], tls_label, ip_label),
+                  (0, 28, f"no write-out from batched curl (exit {proc.returncode})", timeout * 1000), {})
+
+
+def run(hosts: list, tls_versions: dict, ip_versions: dict, timeout: int, parallel_max: int, on_result,
+        addrs: dict = None, mode_flags: str = "", timer: str = "time_total", ok_codes: tuple = ()):
+    """
+    Runs all (TLS version × IP family) groups concurrently, one curl process each.
+    on_result is called from the group threads as
+    on_result(cell, (http, exit, error, ms), {DnsMs, TcpMs, TlsMs, TtfbMs}).
+    addrs:      (host, ip_label) → pre-resolved address; hosts missing from it are skipped
+    mode_flags: extra per-transfer options for the probe mode (e.g. "--head")
+    timer:      %{json} timer reported as the duration
+    ok_codes:   curl exit codes the probe mode treats as success
+    """
+    groups = [
+        (tls_label, tls_flags, ip_label, ip_flag)
+        for tls_label, tls_flags in tls_versions.items()
+        for ip_label, ip_flag in ip_versions.items()
+    ]
+    with ThreadPoolExecutor(max_workers=len(groups)) as ex:
+        futs = [ex.submit(run_group, hosts, *g, timeout, parallel_max, on_result, addrs,
+                          mode_flags, timer, ok_codes) for g in groups]
+        for fut in futs:
+            fut.result()
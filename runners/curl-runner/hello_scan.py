@@ -0,0 +1,273 @@
+"""
+curl-runner/hello_scan.py
+ClientHello scanner: answers "does this host accept TLS version X?" with a
+single round trip and no TLS library. Selected with PROBE_ENGINE=scan in
+run.py.
+
+For each cell a hand-built ClientHello offering exactly one protocol
+version is written to the socket, and the first record that comes back
+is classified:
+  ServerHello at the offered version  → accepted (exit 0, cipher recorded)
+  ServerHello at another version      → rejected (exit 35)
+  alert / close / reset               → rejected (exit 35)
+Each hello offers every common suite of its version (ECDHE, DHE and static
+RSA; GCM, ChaCha20 and CBC), so a server that only takes an unusual suite
+is not mistaken for one that refuses the version.
+Connect-level outcomes use the same curl exit codes as the other engines
+(6/7/28). No HTTP request is made, so HttpStatus and TtfbMs are always 0;
+TlsMs is the ClientHello → first server record round trip.
+"""
+
+import asyncio, os, struct, time
+from concurrent.futures import ThreadPoolExecutor
+
+from native_probe import FAMILIES, RESOLVER_POOL, open_socket
+from shared.resolve import split_target
+from shared.timing import from_marks
+
+RECORD_HANDSHAKE, RECORD_ALERT = 22, 21
+HANDSHAKE_SERVER_HELLO         = 2
+MAX_READ                       = 16 * 1024 + 5   # one full TLS record
+
+PROTOCOLS = {
+    "TLS1.0": 0x0301,
+    "TLS1.1": 0x0302,
+    "TLS1.2": 0x0303,
+    "TLS1.3": 0x0304,
+}
+VERSION_LABELS = {v: k for k, v in PROTOCOLS.items()}
+
+CIPHER_NAMES = {
+    0x1301: "TLS_AES_128_GCM_SHA256",
+    0x1302: "TLS_AES_256_GCM_SHA384",
+    0x1303: "TLS_CHACHA20_POLY1305_SHA256",
+    0x1304: "TLS_AES_128_CCM_SHA256",
+    0x1305: "TLS_AES_128_CCM_8_SHA256",
+    0xc02b: "ECDHE-ECDSA-AES128-GCM-SHA256",
+    0xc02f: "ECDHE-RSA-AES128-GCM-SHA256",
+    0xc02c: "ECDHE-ECDSA-AES256-GCM-SHA384",
+    0xc030: "ECDHE-RSA-AES256-GCM-SHA384",
+    0xcca9: "ECDHE-ECDSA-CHACHA20-POLY1305",
+    0xcca8: "ECDHE-RSA-CHACHA20-POLY1305",
+    0x009e: "DHE-RSA-AES128-GCM-SHA256",
+    0x009f: "DHE-RSA-AES256-GCM-SHA384",
+    0xccaa: "DHE-RSA-CHACHA20-POLY1305",
+    0x00a2: "DHE-DSS-AES128-GCM-SHA256",
+    0x00a3: "DHE-DSS-AES256-GCM-SHA384",
+    0xc023: "ECDHE-ECDSA-AES128-SHA256",
+    0xc024: "ECDHE-ECDSA-AES256-SHA384",
+    0xc027: "ECDHE-RSA-AES128-SHA256",
+    0xc028: "ECDHE-RSA-AES256-SHA384",
+    0x0067: "DHE-RSA-AES128-SHA256",
+    0x006b: "DHE-RSA-AES256-SHA256",
+    0x0040: "DHE-DSS-AES128-SHA256",
+    0x006a: "DHE-DSS-AES256-SHA256",
+    0x009c: "AES128-GCM-SHA256",
+    0x009d: "AES256-GCM-SHA384",
+    0x003c: "AES128-SHA256",
+    0x003d: "AES256-SHA256",
+    0xc009: "ECDHE-ECDSA-AES128-SHA",
+    0xc00a: "ECDHE-ECDSA-AES256-SHA",
+    0xc013: "ECDHE-RSA-AES128-SHA",
+    0xc014: "ECDHE-RSA-AES256-SHA",
+    0x0033: "DHE-RSA-AES128-SHA",
+    0x0039: "DHE-RSA-AES256-SHA",
+    0x0032: "DHE-DSS-AES128-SHA",
+    0x0038: "DHE-DSS-AES256-SHA",
+    0x002f: "AES128-SHA",
+    0x0035: "AES256-SHA",
+    0xc008: "ECDHE-ECDSA-DES-CBC3-SHA",
+    0xc012: "ECDHE-RSA-DES-CBC3-SHA",
+    0x0016: "EDH-RSA-DES-CBC3-SHA",
+    0x0013: "EDH-DSS-DES-CBC3-SHA",
+    0x000a: "DES-CBC3-SHA",
+    0xc007: "ECDHE-ECDSA-RC4-SHA",
+    0xc011: "ECDHE-RSA-RC4-SHA",
+    0x0005: "RC4-SHA",
+    0x0004: "RC4-MD5",
+}
+# Suites usable at TLS 1.0 / 1.1 (CBC and RC4); TLS 1.2 adds AEAD and the SHA-256/384 CBC suites.
+LEGACY_CIPHERS = [0xc009, 0xc00a, 0xc013, 0xc014, 0x0033, 0x0039, 0x0032, 0x0038, 0x002f, 0x0035,
+                  0xc008, 0xc012, 0x0016, 0x0013, 0x000a, 0xc007, 0xc011, 0x0005, 0x0004]
+TLS12_CIPHERS  = [0xc02b, 0xc02f, 0xc02c, 0xc030, 0xcca9, 0xcca8, 0x009e, 0x009f, 0xccaa, 0x00a2,
+                  0x00a3, 0xc023, 0xc027, 0xc024, 0xc028, 0x0067, 0x006b, 0x0040, 0x006a,
+                  0x009c, 0x009d, 0x003c, 0x003d]
+CIPHERS = {
+    "TLS1.0": LEGACY_CIPHERS,
+    "TLS1.1": LEGACY_CIPHERS,
+    "TLS1.2": TLS12_CIPHERS + LEGACY_CIPHERS,
+    "TLS1.3": [0x1301, 0x1302, 0x1303, 0x1304, 0x1305],
+}
+ALERTS = {
+    0: "close_notify", 10: "unexpected_message", 20: "bad_record_mac", 40: "handshake_failure",
+    47: "illegal_parameter", 50: "decode_error", 70: "protocol_version",
+    71: "insufficient_security", 80: "internal_error", 86: "inappropriate_fallback",
+    90: "user_canceled", 109: "missing_extension", 112: "unrecognized_name",
+}
+# ServerHello.random of a TLS 1.3 HelloRetryRequest (RFC 8446 §4.1.3)
+HRR_RANDOM = bytes.fromhex("cf21ad74e59a6111be1d8c021e65b891c2a211167abb8c5e079e09e2c8a8339c")
+
+GROUPS   = [0x001d, 0x0017, 0x0018]                       # x25519, secp256r1, secp384r1
+SIG_ALGS = [0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501, 0x0806, 0x0601, 0x0201]
+
+
+def _vec(data: bytes, width: int) -> bytes:
+    return len(data).to_bytes(width, "big") + data
+
+
+def _ext(ext_type: int, data: bytes) -> bytes:
+    return struct.pack("!H", ext_type) + _vec(data, 2)
+
+
+def _u16s(values: list) -> bytes:
+    return b"".join(struct.pack("!H", v) for v in values)
+
+
+def client_hello(host: str, tls_label: str) -> bytes:
+    """A ClientHello record that offers `tls_label` and nothing else."""
+    tls13 = tls_label == "TLS1.3"
+    exts  = [
+        _ext(0x0000, _vec(b"\x00" + _vec(host.encode("idna"), 2), 2)),   # server_name
+        _ext(0x000a, _vec(_u16s(GROUPS), 2)),                            # supported_groups
+        _ext(0x000b, _vec(b"\x00", 1)),                                  # ec_point_formats
+        _ext(0xff01, _vec(b"", 1)),                                      # renegotiation_info
+    ]
+    if PROTOCOLS[tls_label] >= 0x0303:
+        exts.append(_ext(0x000d, _vec(_u16s(SIG_ALGS), 2)))              # signature_algorithms
+    if tls13:
+        exts += [
+            _ext(0x002b, _vec(_u16s([0x0304]), 1)),                      # supported_versions
+            _ext(0x002d, _vec(b"\x01", 1)),                              # psk_key_exchange_modes
+            # key_share: any 32 bytes are a valid x25519 public key; we never derive secrets
+            _ext(0x0033, _vec(struct.pack("!H", 0x001d) + _vec(os.urandom(32), 2), 2)),
+        ]
+
+    body = (
+        struct.pack("!H", min(PROTOCOLS[tls_label], 0x0303))   # legacy_version
+        + os.urandom(32)
+        + _vec(os.urandom(32) if tls13 else b"", 1)            # legacy_session_id
+        + _vec(_u16s(CIPHERS[tls_label]), 2)
+        + _vec(b"\x00", 1)                                     # null compression only
+        + _vec(b"".join(exts), 2)
+    )
+    handshake = bytes([1]) + _vec(body, 3)
+    return bytes([RECORD_HANDSHAKE]) + struct.pack("!H", 0x0301) + _vec(handshake, 2)
+
+
+def classify(tls_label: str, data: bytes) -> tuple:
+    """
+    First bytes from the server → (exit_code, error, cipher_name).
+    Only the first record is inspected; a ServerHello always comes first.
+    """
+    if len(data) < 5:
+        return 35, "connection closed before ServerHello", ""
+    rtype, _, rlen = struct.unpack("!BHH", data[:5])
+    payload = data[5:5 + rlen]
+
+    if rtype == RECORD_ALERT and len(payload) >= 2:
+        desc = payload[1]
+        return 35, f"TLS alert {ALERTS.get(desc, 'unknown')}({desc})", ""
+    if rtype != RECORD_HANDSHAKE or len(payload) < 4 or payload[0] != HANDSHAKE_SERVER_HELLO:
+        return 35, f"unexpected first record type {rtype}", ""
+
+    try:
+        hello   = payload[4:4 + int.from_bytes(payload[1:4], "big")]
+        version = struct.unpack("!H", hello[0:2])[0]
+        random  = hello[2:34]
+        pos     = 35 + hello[34]                       # skip legacy_session_id
+        cipher  = struct.unpack("!H", hello[pos:pos + 2])[0]
+        pos    += 3                                    # cipher + compression method
+        if pos + 2 <= len(hello):
+            end  = pos + 2 + struct.unpack("!H", hello[pos:pos + 2])[0]
+            pos += 2
+            while pos + 4 <= end:
+                ext_type, ext_len = struct.unpack("!HH", hello[pos:pos + 4])
+                if ext_type == 0x002b and ext_len == 2:     # supported_versions (TLS 1.3)
+                    version = struct.unpack("!H", hello[pos + 4:pos + 6])[0]
+                pos += 4 + ext_len
+    except (struct.error, IndexError):
+        return 35, "truncated ServerHello", ""
+
+    negotiated = VERSION_LABELS.get(version, f"0x{version:04x}")
+    if negotiated != tls_label:
+        return 35, f"server negotiated {negotiated}", ""
+    name = CIPHER_NAMES.get(cipher, f"0x{cipher:04x}")
+    if random == HRR_RANDOM:
+        return 0, "", f"{name} (HelloRetryRequest)"
+    return 0, "", name
+
+
+async def _read_first_record(reader: asyncio.StreamReader) -> bytes:
+    data = b""
+    while len(data) < MAX_READ:
+        if len(data) >= 5 and len(data) >= 5 + struct.unpack("!H", data[3:5])[0]:
+            break
+        chunk = await reader.read(MAX_READ - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+async def _scan(host: str, tls_label: str, family: int, t0: float, marks: dict, addr: str = None) -> tuple:
+    elapsed    = lambda: (time.monotonic() - t0) * 1000
+    name, port = split_target(host)
+
+    sock, err = await open_socket(name, port, family, addr, marks)
+    if err:
+        return (0, *err, elapsed()), ""
+
+    try:
+        reader, writer = await asyncio.open_connection(sock=sock)
+    except OSError as e:
+        sock.close()
+        return (0, 35, f"TLS connect error: {e}", elapsed()), ""
+    except BaseException:              # cancelled (probe timeout)
+        sock.close()
+        raise
+    try:
+        writer.write(client_hello(name, tls_label))
+        await writer.drain()
+        data = await _read_first_record(reader)
+        marks["appconnect"] = time.monotonic()
+    except OSError as e:
+        return (0, 35, f"TLS connect error: {e}", elapsed()), ""
+    finally:
+        writer.transport.abort()
+
+    exit_code, error, cipher = classify(tls_label, data)
+    return (0, exit_code, error, elapsed()), cipher
+
+
+async def scan(host: str, tls_label: str, ip_label: str, timeout: float, addr: str = None) -> tuple:
+    """→ ((http, exit, error, ms), cipher, phase fields)"""
+    t0, marks = time.monotonic(), {}
+    try:
+        outcome, cipher = await asyncio.wait_for(
+            _scan(host, tls_label, FAMILIES[ip_label], t0, marks, addr), timeout)
+    except asyncio.TimeoutError:
+        outcome, cipher = (0, 28, f"Operation timed out after {int(timeout * 1000)} milliseconds",
+                           timeout * 1000), ""
+    return outcome, cipher, from_marks(t0, marks)
+
+
+async def _run_all(cells: list, timeout: float, concurrency: int, on_result, addrs: dict):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=RESOLVER_POOL))
+    pending = iter(cells)
+
+    async def worker():
+        for cell in pending:
+            addr            = addrs.get((cell[0], cell[2])) if addrs else None
+            outcome, cipher, phases = await scan(*cell, timeout, addr)
+            on_result(cell, outcome, {"TlsCipher": cipher, **phases})
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(cells)) or 1)))
+
+
+def run(cells: list, timeout: float, concurrency: int, on_result, addrs: dict = None):
+    """
+    cells:     [(host, tls_label, ip_label), ...]
+    on_result: called as on_result(cell, (http, exit, error, ms), {"TlsCipher": ..., DnsMs, TcpMs, TlsMs, TtfbMs})
+    addrs:     (host, ip_label) → pre-resolved address; others are resolved here
+    """
+    asyncio.run(_run_all(cells, timeout, concurrency, on_result, addrs))
@@ -0,0 +1,188 @@
+"""
+curl-runner/native_probe.py
+In-process probe engine: TCP connect + TLS handshake + optional HTTP
+request, all driven from a single asyncio event loop. Selected with
+PROBE_ENGINE=native in run.py.
+
+How far a probe goes follows PROBE_MODE; DurationMs stops at that point:
+  handshake  TLS handshake complete, nothing sent
+  head       HEAD sent, status line received
+  firstbyte  GET sent, status line received, body never read
+  full       GET sent, body read to EOF
+
+Each probe returns the same (http_code, exit_code, error, duration_ms)
+tuple that run.probe() derives from curl, using curl's exit codes so the
+KQL in kql-queries.kql treats both engines identically:
+   0  ok                       28  operation timed out
+   6  could not resolve host   35  TLS handshake failed
+   7  failed to connect        52  empty reply / 56 recv failure
+"""
+
+import asyncio, socket, ssl, time
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.resolve import split_target
+from shared.timing import from_marks
+
+OPENSSL_VERSION = ssl.OPENSSL_VERSION
+USER_AGENT      = "curl/8.7.1"
+RESOLVER_POOL   = 32    # getaddrinfo() is blocking; it runs on this many threads
+
+TLS_PINS = {
+    "TLS1.0": ssl.TLSVersion.TLSv1,
+    "TLS1.1": ssl.TLSVersion.TLSv1_1,
+    "TLS1.2": ssl.TLSVersion.TLSv1_2,
+    "TLS1.3": ssl.TLSVersion.TLSv1_3,
+}
+FAMILIES = {
+    "IPv4": socket.AF_INET,
+    "IPv6": socket.AF_INET6,
+}
+
+
+def build_contexts() -> dict:
+    """
+    One SSLContext per TLS version, min == max, mirroring
+    `--tlsvX --tls-max X --insecure`. The contexts pick up OPENSSL_CONF
+    and LD_LIBRARY_PATH from the image, i.e. the same legacy-enabled
+    OpenSSL that curl is linked against.
+    """
+    contexts = {}
+    for label, version in TLS_PINS.items():
+        ctx                 = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.check_hostname  = False
+        ctx.verify_mode     = ssl.CERT_NONE   # testing TLS version, not cert validity
+        ctx.minimum_version = version
+        ctx.maximum_version = version
+        if version < ssl.TLSVersion.TLSv1_2:
+            ctx.set_ciphers("DEFAULT:@SECLEVEL=0")   # SHA-1 suites needed below TLS1.2
+        ctx.set_alpn_protocols(["http/1.1"])
+        contexts[label] = ctx
+    return contexts
+
+
+async def open_socket(host: str, port: int, family: int, addr: str = None, marks: dict = None):
+    """
+    Resolve + TCP connect, or connect straight to `addr` when the host was
+    pre-resolved. Returns (sock, None) or (None, (exit_code, error)).
+    marks, if given, receives the "namelookup" and "connect" timestamps.
+    """
+    marks = {} if marks is None else marks
+    loop = asyncio.get_running_loop()
+    try:
+        infos = ([(family, socket.SOCK_STREAM, 0, "", (addr, port))] if addr else
+                 await loop.getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM))
+    except socket.gaierror:
+        return None, (6, f"Could not resolve host: {host}")
+    marks["namelookup"] = time.monotonic()
+
+    last_err = None
+    for fam, kind, proto, _, addr in infos:
+        sock = None
+        try:
+            sock = socket.socket(fam, kind, proto)     # EMFILE lands here too
+            sock.setblocking(False)
+            await loop.sock_connect(sock, addr)
+            marks["connect"] = time.monotonic()
+            return sock, None
+        except OSError as e:
+            if sock:
+                sock.close()
+            last_err = e
+        except BaseException:          # cancelled (probe timeout) mid-connect
+            if sock:
+                sock.close()
+            raise
+    return None, (7, f"Failed to connect to {host} port {port}: {last_err.strerror or last_err}")
+
+
+async def _probe(host: str, ctx: ssl.SSLContext, family: int, mode: str, t0: float,
+                 marks: dict, addr: str = None) -> tuple:
+    elapsed    = lambda: (time.monotonic() - t0) * 1000
+    name, port = split_target(host)
+
+    sock, err = await open_socket(name, port, family, addr, marks)
+    if err:
+        return (0, *err, elapsed())
+
+    try:
+        reader, writer = await asyncio.open_connection(sock=sock, ssl=ctx, server_hostname=name)
+    except (ssl.SSLError, OSError) as e:
+        sock.close()
+        return 0, 35, f"TLS connect error: {e}", elapsed()
+    marks["appconnect"] = time.monotonic()
+
+    try:
+        if mode == "handshake":
+            return 0, 0, "", elapsed()
+        writer.write(
+            f"{'HEAD' if mode == 'head' else 'GET'} / HTTP/1.1\r\nHost: {host}\r\n"
+            f"User-Agent: {USER_AGENT}\r\nAccept: */*\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        marks["starttransfer"] = time.monotonic()
+        if mode == "full":
+            while await reader.read(65536):
+                pass
+    except (ssl.SSLError, OSError) as e:
+        return 0, 56, f"Recv failure: {e}", elapsed()
+    finally:
+        writer.transport.abort()   # no close_notify round trip; we have what we need
+
+    if not status_line:
+        return 0, 52, "Empty reply from server", elapsed()
+    parts = status_line.split()
+    code  = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    return code, 0, "", elapsed()
+
+
+async def probe(host: str, tls_label: str, ip_label: str, contexts: dict,
+                timeout: float, mode: str = "head", addr: str = None) -> tuple:
+    """
+    Single probe, bounded by `timeout` like curl --max-time.
+    Returns ((http, exit, error, ms), phase fields).
+    """
+    t0, marks = time.monotonic(), {}
+    try:
+        outcome = await asyncio.wait_for(
+            _probe(host, contexts[tls_label], FAMILIES[ip_label], mode, t0, marks, addr), timeout
+        )
+    except asyncio.TimeoutError:
+        outcome = 0, 28, f"Operation timed out after {int(timeout * 1000)} milliseconds", timeout * 1000
+    return outcome, from_marks(t0, marks)
+
+
+async def _run_all(cells: list, timeout: float, concurrency: int, on_result, mode: str, addrs: dict):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=RESOLVER_POOL))
+    contexts = build_contexts()
+    pending  = iter(cells)
+
+    # Fixed set of workers pulling from one iterator: memory stays bounded
+    # by `concurrency`, not by the number of cells.
+    async def worker():
+        for cell in pending:
+            host, tls_label, ip_label = cell
+            addr = addrs.get((host, ip_label)) if addrs else None
+            t0   = time.monotonic()
+            try:
+                result = await probe(host, tls_label, ip_label, contexts, timeout, mode, addr)
+            except Exception as e:     # one bad probe must not end the run
+                result = ((0, 1, f"probe error: {e!r}"[:500], (time.monotonic() - t0) * 1000),
+                          from_marks(t0, {}))
+            on_result(cell, *result)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(cells)) or 1)))
+
+
+def run(cells: list, timeout: float, concurrency: int, on_result, mode: str = "head",
+        addrs: dict = None):
+    """
+    cells:     [(host, tls_label, ip_label), ...]
+    on_result: called on the loop thread as
+               on_result(cell, (http, exit, error, ms), {DnsMs, TcpMs, TlsMs, TtfbMs})
+    mode:      "handshake" | "head" | "firstbyte" | "full" (see module docstring)
+    addrs:     (host, ip_label) → pre-resolved address; others are resolved here
+    """
+    asyncio.run(_run_all(cells, timeout, concurrency, on_result, mode, addrs))
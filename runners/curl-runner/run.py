@@ -1,20 +1,42 @@
 """
 curl-runner/run.py
 Wraps your existing curl regression script, fans out across
-TLS versions and IP families, ships results to Blob + Log Analytics.
+TLS versions and IP families, streams results to Blob (NDJSON, see
+shared/sink.py) + Log Analytics (background ingestion, see shared/law.py)
+while probes are still running.
 
 ENV VARS expected (injected by ACI):
-  TARGETS_JSON     — JSON array of hostnames, or path to blob with list
+  TARGETS_JSON     — JSON array of hostnames (optionally host:port), or path to blob with list
   RUN_ID           — unique run identifier (e.g. UUID)
   STORAGE_CONN_STR — Azure Storage connection string
   LAW_WORKSPACE_ID — Log Analytics workspace ID
   LAW_SHARED_KEY   — Log Analytics shared key
+  LAW_ENDPOINT     — optional ingestion URL override (e.g. the shared/law_stub.py stub)
+  PROBE_ENGINE     — "curl" (default, one curl per probe) | "batch" (curl --parallel, see curl_batch.py)
+                     | "native" (asyncio, see native_probe.py)
+                     | "scan" (raw ClientHello, no HTTP, see hello_scan.py; Runner="tls-scan")
+  CURL_PARALLEL_MAX — transfers in flight per batched curl process (default: 50, curl caps at 300)
+  NATIVE_CONCURRENCY — probes in flight for the native and scan engines (default: 1000)
+  PROBE_MODE       — how far each probe goes, recorded as ProbeMode:
+                     "full" (GET + whole body; curl/batch default) | "head" (native default)
+                     | "firstbyte" (GET, stop at first byte) | "handshake" (TLS handshake only)
+                     The scan engine always reports "hello".
+  RESOLVER_WORKERS — concurrent DNS lookups in the pre-resolution stage (default: 32)
+  RESOLVE_OVERRIDES — optional JSON {"host": ["addr", ...]} answered without DNS (used by bench/)
+  PROBE_TIMEOUT_SECS — per-probe limit, curl --max-time (default: 15)
+  RESULTS_DIR      — optional local directory that also receives the NDJSON results
+  CIRCUIT_BREAKER  — "1" (default) | "0": curl engine stops probing a (host, IP family)
+                     after a connect-level failure and records the rest as Skipped
+  CAPTURE_AGENT_URL — optional capture-agent base URL; the runner registers its addresses
+                     there before probing (see shared/capture.py)
 """
 
-import os, json, subprocess, time, uuid, datetime, hashlib, hmac, base64
-import urllib.request, urllib.parse
+import os, json, subprocess, time, uuid, datetime, threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from azure.storage.blob import BlobServiceClient
+import curl_batch, hello_scan, native_probe
+from shared import capture, resolve, timing
+from shared.law import LawIngestor
+from shared.sink import ResultSink
 
 # ── Config ────────────────────────────────────────────────────
 TARGETS      = json.loads(os.environ.get("TARGETS_JSON", "[]"))
@@ -22,6 +44,7 @@ RUN_ID       = os.environ.get("RUN_ID", str(uuid.uuid4()))
 STORAGE_CONN = os.environ.get("STORAGE_CONN_STR", "")
 LAW_WS_ID    = os.environ.get("LAW_WORKSPACE_ID", "")
 LAW_KEY      = os.environ.get("LAW_SHARED_KEY", "")
+LAW_ENDPOINT = os.environ.get("LAW_ENDPOINT", "")
 
 TLS_VERSIONS = {
     "TLS1.0": "--tlsv1.0 --tls-max 1.0",
@@ -34,20 +57,53 @@ IP_VERSIONS = {
     "IPv6": "-6",
 }
 MAX_WORKERS  = 20
-TIMEOUT_SECS = 15
+TIMEOUT_SECS = int(os.environ.get("PROBE_TIMEOUT_SECS", "15"))
 
+PROBE_ENGINE       = os.environ.get("PROBE_ENGINE", "curl")
+NATIVE_CONCURRENCY = int(os.environ.get("NATIVE_CONCURRENCY", "1000"))
+CURL_PARALLEL_MAX  = int(os.environ.get("CURL_PARALLEL_MAX", "50"))
+RESOLVER_WORKERS   = int(os.environ.get("RESOLVER_WORKERS", "32"))
+RESOLVE_OVERRIDES  = json.loads(os.environ.get("RESOLVE_OVERRIDES", "{}"))
+RESULTS_DIR        = os.environ.get("RESULTS_DIR", "")
+CIRCUIT_BREAKER    = os.environ.get("CIRCUIT_BREAKER", "1") != "0"
+CAPTURE_AGENT_URL  = os.environ.get("CAPTURE_AGENT_URL", "")
 
-def probe(host: str, tls_label: str, tls_flags: str, ip_label: str, ip_flag: str) -> dict:
+# Order the curl engine walks the TLS versions of one (host, IP family):
+# most likely to connect first, so a breaker trip is a real reachability
+# problem and not a version the host refuses.
+BREAKER_ORDER = ["TLS1.2", "TLS1.3", "TLS1.1", "TLS1.0"]
+CONNECT_EXITS = (6, 7)    # could not resolve / failed to connect
+
+# mode → (extra curl flags, write-out timer reported as DurationMs).
+# curl has no connect-only switch, so "handshake" sends a HEAD (no body)
+# and reports time_appconnect; "firstbyte" lets --max-filesize abort the
+# body, and the resulting exit 63 counts as success.
+PROBE_MODES = {
+    "full":      ("",                 "time_total"),
+    "head":      ("--head",           "time_total"),
+    "firstbyte": ("--max-filesize 1", "time_starttransfer"),
+    "handshake": ("--head",           "time_appconnect"),
+}
+FIRSTBYTE_ABORT = 63    # curl: maximum file size exceeded
+PROBE_MODE = ("hello" if PROBE_ENGINE == "scan" else
+              os.environ.get("PROBE_MODE") or ("head" if PROBE_ENGINE == "native" else "full"))
+
+
+def probe(host: str, tls_label: str, tls_flags: str, ip_label: str, ip_flag: str,
+          addr: str = None) -> tuple:
+    """One curl run → (record, curl's time_connect in ms, or None if curl reported none)."""
     url  = f"https://{host}"
     t0   = time.monotonic()
+    pin  = f"--resolve '{resolve.curl_resolve(host, addr)}' " if addr else ""
+    mode_flags, timer = PROBE_MODES[PROBE_MODE]
     cmd  = (
-        f"curl {ip_flag} {tls_flags} "
+        f"curl {ip_flag} {tls_flags} {pin}{mode_flags} "
         f"--silent --output /dev/null "
         f"--write-out '%{{http_code}}|%{{ssl_verify_result}}|%{{remote_ip}}|"
-        f"%{{time_total}}|%{{num_connects}}' "
+        f"%{{{timer}}}|%{{num_connects}}|%{{time_namelookup}}|%{{time_connect}}|"
+        f"%{{time_appconnect}}|%{{time_starttransfer}}' "
         f"--max-time {TIMEOUT_SECS} "
         f"--insecure "        # we're testing connectivity/TLS version, not cert validity
-        f"-w '\\n%{{ssl_verify_result}}' "
         f"'{url}'"
     )
     try:
@@ -55,11 +111,58 @@ def probe(host: str, tls_label: str, tls_flags: str, ip_label: str, ip_flag: str
         parts      = r.stdout.strip().split("|")
         http_code  = int(parts[0]) if parts[0].isdigit() else 0
         duration   = float(parts[3]) * 1000 if len(parts) > 3 else 0
-        exit_code  = r.returncode
-        error      = r.stderr.strip()[:500] if r.returncode != 0 else ""
+        exit_code  = 0 if r.returncode == FIRSTBYTE_ABORT and PROBE_MODE == "firstbyte" else r.returncode
+        error      = r.stderr.strip()[:500] if exit_code != 0 else ""
+        phases     = timing.phase_fields(*(float(p) * 1000 for p in parts[5:9])) if len(parts) > 8 else {}
+        connect_ms = float(parts[6]) * 1000 if len(parts) > 8 else None
     except subprocess.TimeoutExpired:
-        http_code, exit_code, duration, error = 0, 28, TIMEOUT_SECS * 1000, "timeout"
+        http_code, exit_code, duration, error, phases = 0, 28, TIMEOUT_SECS * 1000, "timeout", {}
+        connect_ms = None
+
+    return make_record(host, tls_label, ip_label, http_code, exit_code, error, duration, **phases), connect_ms
+
+
+def connect_failed(r: dict, connect_ms: float = None) -> bool:
+    """
+    True if the probe never got a TCP connection. A timeout (28) counts only
+    when curl itself reported time_connect 0; a curl killed from outside
+    reported nothing and may well have connected.
+    """
+    return r["CurlExitCode"] in CONNECT_EXITS or (r["CurlExitCode"] == 28 and connect_ms == 0)
 
+
+def probe_group(group: list, addr: str) -> list:
+    """
+    All TLS versions of one (host, IP family), one after another in
+    BREAKER_ORDER. After a connect-level failure the versions still queued
+    cannot do better, so they are recorded as Skipped with the same exit
+    code instead of each waiting out TIMEOUT_SECS. Once any version has
+    connected the host is reachable, and the breaker stays off for the
+    rest of the group: a later connect failure is that version's own.
+    """
+    records, cause, reachable = [], None, False
+    for t in sorted(group, key=lambda t: BREAKER_ORDER.index(t[1])):
+        host, tls_label, _, ip_label, _ = t
+        if cause:
+            records.append(make_record(
+                host, tls_label, ip_label, 0, cause["CurlExitCode"],
+                f"skipped: circuit open after exit {cause['CurlExitCode']} on {cause['TlsVersion']}",
+                0, Skipped=True,
+            ))
+            continue
+        r, connect_ms = probe(*t, addr)
+        records.append(r)
+        if connect_failed(r, connect_ms):
+            if CIRCUIT_BREAKER and not reachable:
+                cause = r
+        elif connect_ms or r["CurlExitCode"] not in (*CONNECT_EXITS, 28):
+            reachable = True
+    return records
+
+
+def make_record(host: str, tls_label: str, ip_label: str,
+                http_code: int, exit_code: int, error: str, duration: float, **extra) -> dict:
+    url = f"https://{host}"
     return {
         "TimeGenerated": datetime.datetime.utcnow().isoformat() + "Z",
         "RunId":         RUN_ID,
@@ -74,80 +177,110 @@ def probe(host: str, tls_label: str, tls_flags: str, ip_label: str, ip_flag: str
         "DurationMs":    round(duration, 2),
         "CertIssuer":    "",   # extend with --write-out %{ssl_peer_cert} if needed
         "CertExpiry":    "",
+        "ProbeMode":     PROBE_MODE,
+        "Skipped":       False,
+        **timing.phase_fields(),
+        **extra,
     }
 
 
-def send_to_law(records: list):
-    """POST records to Log Analytics Data Collector API."""
-    if not LAW_WS_ID or not LAW_KEY:
-        return
-    body        = json.dumps(records).encode("utf-8")
-    rfc1123date = datetime.datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
-    content_len = len(body)
-    sig_str     = f"POST\n{content_len}\napplication/json\nx-ms-date:{rfc1123date}\n/api/logs"
-    sig_bytes   = base64.b64decode(LAW_KEY)
-    sig         = base64.b64encode(
-        hmac.new(sig_bytes, sig_str.encode("utf-8"), hashlib.sha256).digest()
-    ).decode()
-    headers = {
-        "Content-Type":  "application/json",
-        "Authorization": f"SharedKey {LAW_WS_ID}:{sig}",
-        "Log-Type":      "TLSTestResults",
-        "x-ms-date":     rfc1123date,
-    }
-    url = f"https://{LAW_WS_ID}.ods.opinsights.azure.com/api/logs?api-version=2016-04-01"
-    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
-    try:
-        urllib.request.urlopen(req, timeout=30)
-        print(f"  → Sent {len(records)} records to Log Analytics")
-    except Exception as e:
-        print(f"  ✗ LAW ingest failed: {e}")
-
-
-def upload_to_blob(results: list):
-    if not STORAGE_CONN:
-        return
-    client = BlobServiceClient.from_connection_string(STORAGE_CONN)
-    ts     = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    name   = f"{RUN_ID}/{ts}-curl.json"
-    blob   = client.get_blob_client(container="test-results", blob=name)
-    blob.upload_blob(json.dumps(results, indent=2).encode(), overwrite=True)
-    print(f"  → Uploaded results to blob: test-results/{name}")
-
-
 def main():
     if not TARGETS:
         print("ERROR: TARGETS_JSON is empty. Set the env var before running.")
         return
 
     print(f"[curl-runner] RUN_ID={RUN_ID}  targets={len(TARGETS)}")
+    capture.register(CAPTURE_AGENT_URL, "curl")
     tasks   = [
         (host, tls_label, tls_flags, ip_label, ip_flag)
         for host in TARGETS
         for tls_label, tls_flags in TLS_VERSIONS.items()
         for ip_label, ip_flag in IP_VERSIONS.items()
     ]
-    print(f"  Total probes: {len(tasks)}")
-
-    results = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        futs = {ex.submit(probe, *t): t for t in tasks}
-        done = 0
-        for fut in as_completed(futs):
-            r = fut.result()
-            results.append(r)
-            done += 1
-            if done % 50 == 0:
-                print(f"  Progress: {done}/{len(tasks)}")
-
-    print(f"  Probes complete. Uploading {len(results)} records...")
-    upload_to_blob(results)
-    # Send in batches of 500 (LAW API limit per request)
-    for i in range(0, len(results), 500):
-        send_to_law(results[i:i+500])
-
-    failures = [r for r in results if r["CurlExitCode"] not in (0, 35, 36)]
-    print(f"\n  Summary: {len(results)} probes, {len(failures)} unexpected failures")
+    print(f"  Total probes: {len(tasks)}  mode: {PROBE_MODE}")
+
+    # Resolve every host once; probes are pinned to these addresses, so the
+    # lookup time measured here is what every record reports as DnsMs.
+    dns   = resolve.resolve_all(TARGETS, RESOLVER_WORKERS, RESOLVE_OVERRIDES)
+    addrs = dns.pinned()
+    print(f"  Resolved: {dns.summary()}")
+
+    # Results are streamed out as they arrive instead of being kept in a
+    # list; collect() may be called from several engine threads at once.
+    sink    = ResultSink(STORAGE_CONN, RUN_ID, "curl", local_dir=RESULTS_DIR)
+    law     = LawIngestor(LAW_WS_ID, LAW_KEY, LAW_ENDPOINT).start()
+    counts  = {"done": 0, "unexpected": 0, "skipped": 0}
+    lock    = threading.Lock()
+    total   = len(tasks)
+
+    def collect(r: dict):
+        r["DnsMs"] = round(dns.millis.get((r["TargetHost"], r["IpVersion"]), r["DnsMs"]), 2)
+        sink.write(r)
+        law.submit(r)
+        with lock:
+            counts["done"] += 1
+            if r["Skipped"]:
+                counts["skipped"] += 1
+            elif r["CurlExitCode"] not in (0, 35, 36):
+                counts["unexpected"] += 1
+            if counts["done"] % 50 == 0:
+                print(f"  Progress: {counts['done']}/{total}  law-queue={law.queue_depth}")
+
+    # Cells with no address in their family are recorded straight away and
+    # never reach an engine.
+    for host, tls_label, _, ip_label, _ in tasks:
+        if (host, ip_label) not in addrs:
+            collect(make_record(host, tls_label, ip_label, 0, resolve.NO_ADDRESS_EXIT,
+                                dns.no_address_error(host, ip_label), 0))
+    tasks = [t for t in tasks if (t[0], t[3]) in addrs]
+
+    if PROBE_ENGINE == "native":
+        print(f"  Engine: native  concurrency={NATIVE_CONCURRENCY}  {native_probe.OPENSSL_VERSION}")
+        native_probe.run(
+            [(host, tls_label, ip_label) for host, tls_label, _, ip_label, _ in tasks],
+            TIMEOUT_SECS, NATIVE_CONCURRENCY,
+            lambda cell, outcome, fields: collect(make_record(*cell, *outcome, **fields)),
+            mode=PROBE_MODE,
+            addrs=addrs,
+        )
+    elif PROBE_ENGINE == "scan":
+        print(f"  Engine: scan  concurrency={NATIVE_CONCURRENCY}")
+        hello_scan.run(
+            [(host, tls_label, ip_label) for host, tls_label, _, ip_label, _ in tasks],
+            TIMEOUT_SECS, NATIVE_CONCURRENCY,
+            lambda cell, outcome, fields: collect(make_record(*cell, *outcome, Runner="tls-scan", **fields)),
+            addrs=addrs,
+        )
+    elif PROBE_ENGINE == "batch":
+        print(f"  Engine: batch  {len(TLS_VERSIONS) * len(IP_VERSIONS)} curl processes  "
+              f"parallel-max={CURL_PARALLEL_MAX}")
+        mode_flags, timer = PROBE_MODES[PROBE_MODE]
+        curl_batch.run(
+            TARGETS, TLS_VERSIONS, IP_VERSIONS, TIMEOUT_SECS, CURL_PARALLEL_MAX,
+            lambda cell, outcome, fields: collect(make_record(*cell, *outcome, **fields)),
+            addrs=addrs, mode_flags=mode_flags, timer=timer,
+            ok_codes=(FIRSTBYTE_ABORT,) if PROBE_MODE == "firstbyte" else (),
+        )
+    else:
+        # One work item per (host, IP family) so the circuit breaker can see
+        # each TLS version's outcome before launching the next.
+        groups = {}
+        for t in tasks:
+            groups.setdefault((t[0], t[3]), []).append(t)
+        print(f"  Engine: curl  workers={MAX_WORKERS}  groups={len(groups)}  "
+              f"circuit-breaker={'on' if CIRCUIT_BREAKER else 'off'}")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+            futs = [ex.submit(probe_group, group, addrs[key]) for key, group in groups.items()]
+            for fut in as_completed(futs):
+                for r in fut.result():
+                    collect(r)
+
+    print(f"  Probes complete. Flushing {counts['done']} records...")
+    sink.close()
+    law.close()
+
+    print(f"\n  Summary: {counts['done']} probes, {counts['unexpected']} unexpected failures, "
+          f"{counts['skipped']} skipped by circuit breaker")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""
+curl-runner/test_circuit_breaker.py
+probe_group()'s circuit breaker against scripted curl outcomes; no curl or
+network needed.
+
+  cd runners/curl-runner && python3 -m unittest test_circuit_breaker
+"""
+
+import os, sys, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import run                                             # noqa: E402
+
+HOST = "reset.bench.test"
+
+
+def scripted(outcomes: dict):
+    """TLS label → (exit code, curl's time_connect in ms or None); records the labels probed."""
+    probed = []
+
+    def probe(host, tls_label, tls_flags, ip_label, ip_flag, addr=None):
+        probed.append(tls_label)
+        exit_code, connect_ms = outcomes[tls_label]
+        phases = run.timing.phase_fields(1.0, connect_ms or 0)
+        return run.make_record(host, tls_label, ip_label, 0, exit_code, "", 0, **phases), connect_ms
+
+    return probe, probed
+
+
+def group() -> list:
+    return [(HOST, label, flags, "IPv4", "-4") for label, flags in run.TLS_VERSIONS.items()]
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def outcome(self, outcomes: dict) -> tuple:
+        probe, probed = scripted(outcomes)
+        with mock.patch.object(run, "probe", probe), mock.patch.object(run, "CIRCUIT_BREAKER", True):
+            records = {r["TlsVersion"]: r for r in run.probe_group(group(), "127.0.0.1")}
+        return records, probed
+
+    def test_unreachable_host_skips_remaining_versions(self):
+        records, probed = self.outcome({v: (7, 0.0) for v in run.TLS_VERSIONS})
+        self.assertEqual(probed, ["TLS1.2"])
+        for label in ("TLS1.3", "TLS1.1", "TLS1.0"):
+            self.assertTrue(records[label]["Skipped"])
+            self.assertEqual(records[label]["CurlExitCode"], 7)
+
+    def test_connect_failure_after_a_connected_version_does_not_trip(self):
+        # The bench reset endpoint: 1.2 and 1.3 connect (handshake refused),
+        # then 1.1 fails to connect. 1.0 must still be probed.
+        records, probed = self.outcome({"TLS1.2": (35, 0.4), "TLS1.3": (35, 0.3),
+                                        "TLS1.1": (7, 0.0), "TLS1.0": (35, 0.3)})
+        self.assertEqual(probed, run.BREAKER_ORDER)
+        self.assertFalse(any(r["Skipped"] for r in records.values()))
+        self.assertEqual(records["TLS1.1"]["CurlExitCode"], 7)
+        self.assertEqual(records["TLS1.0"]["CurlExitCode"], 35)
+
+    def test_timeout_without_curl_timings_does_not_trip(self):
+        # curl killed by the subprocess timeout: it may have connected.
+        records, probed = self.outcome({v: (28, None) for v in run.TLS_VERSIONS})
+        self.assertEqual(probed, run.BREAKER_ORDER)
+        self.assertFalse(any(r["Skipped"] for r in records.values()))
+
+    def test_timeout_before_connect_trips(self):
+        records, probed = self.outcome({v: (28, 0.0) for v in run.TLS_VERSIONS})
+        self.assertEqual(probed, ["TLS1.2"])
+        self.assertTrue(records["TLS1.0"]["Skipped"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,6 @@
+"""
+shared/
+Code used by both curl-runner and chrome-runner. The runner images are
+built with runners/ as the Docker context and copy this package next to
+run.py; when running a runner locally, put runners/ on PYTHONPATH.
+"""
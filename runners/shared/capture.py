@@ -0,0 +1,60 @@
+"""
+shared/capture.py
+Runner registration with the capture VM. At startup a runner POSTs its own
+IPv4 / IPv6 addresses to capture-agent's /register, so the agent's demux
+routes both directions of this container's traffic into this runner's
+{run_id}-{runner}-{family}.pcap files before the first probe goes out.
+
+CAPTURE_AGENT_URL (e.g. http://10.10.2.4:9000, set by run-tests.sh) turns
+it on; without it, or if the agent cannot be reached, the runner carries on
+and run-tests.sh's own registration from the orchestrator side applies.
+"""
+
+import json, socket, urllib.parse, urllib.request
+
+# Never contacted: connecting a UDP socket only asks the kernel for the
+# route, whose source address is the one the probes will use.
+ROUTE_PROBES = {socket.AF_INET: ("192.0.2.1", 9), socket.AF_INET6: ("2001:db8::1", 9)}
+
+
+def local_addresses(agent_url: str = "") -> list:
+    """Source addresses this container uses, one per family that has a route."""
+    probes = dict(ROUTE_PROBES)
+    host   = urllib.parse.urlsplit(agent_url).hostname or ""
+    if host:                       # the agent's own family: the route towards it
+        probes[socket.AF_INET6 if ":" in host else socket.AF_INET] = (host, 9)
+    addrs = []
+    for family, probe in probes.items():
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as s:
+                s.connect(probe)
+                addr = s.getsockname()[0]
+        except OSError:
+            continue               # no route in this family
+        if not addr.startswith(("127.", "::1", "fe80:")):
+            addrs.append(addr.split("%")[0])
+    return addrs
+
+
+def register(agent_url: str, runner: str, timeout: float = 5) -> list:
+    """POST {runner, ips} to {agent_url}/register → the addresses sent, [] if that failed."""
+    if not agent_url:
+        return []
+    ips = local_addresses(agent_url)
+    if not ips:
+        print("  ✗ capture registration skipped: no routable local address")
+        return []
+    req = urllib.request.Request(
+        agent_url.rstrip("/") + "/register",
+        data    = json.dumps({"runner": runner, "ips": ips}).encode(),
+        headers = {"Content-Type": "application/json"},
+        method  = "POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout):
+            pass
+    except OSError as e:
+        print(f"  ✗ capture registration failed ({agent_url}): {e}")
+        return []
+    print(f"  → Registered with capture-agent as {runner}: {', '.join(ips)}")
+    return ips
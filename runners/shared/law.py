@@ -0,0 +1,209 @@
+"""
+shared/law.py
+Background Log Analytics ingestion (HTTP Data Collector API → TLSTestResults_CL).
+
+Probe threads call submit() and move on; one daemon thread drains the queue,
+packs records into batches bounded by payload bytes (not record count),
+gzips them and POSTs over a single persistent connection. Throttling (429)
+and 5xx answers are retried with jittered exponential backoff. A batch is
+flushed when it is full or `flush_secs` after its first record, so the
+dashboards fill in while the run is still going.
+
+The queue holds at most `max_queue` records; past that submit() drops the
+record (counted in `overflow_records`) rather than growing without bound
+while ingestion is down. A record or batch that fails for any other reason
+is counted as dropped and the thread carries on.
+
+LAW_ENDPOINT overrides the ingestion URL, e.g. http://127.0.0.1:8088 for
+the offline stub in shared/law_stub.py.
+"""
+
+import base64, datetime, gzip, hashlib, hmac, http.client, json, queue, random
+import threading, time, urllib.parse
+
+LOG_TYPE        = "TLSTestResults"
+API_PATH        = "/api/logs?api-version=2016-04-01"
+MAX_POST_BYTES  = 30 * 1024 * 1024     # Data Collector API limit per POST
+RETRY_STATUSES  = {429, 500, 502, 503, 504}
+MAX_QUEUE       = 50_000
+_STOP           = object()
+
+
+def signature(workspace_id: str, shared_key: str, date: str, content_length: int) -> str:
+    sig_str = f"POST\n{content_length}\napplication/json\nx-ms-date:{date}\n/api/logs"
+    digest  = hmac.new(base64.b64decode(shared_key), sig_str.encode("utf-8"), hashlib.sha256).digest()
+    return f"SharedKey {workspace_id}:{base64.b64encode(digest).decode()}"
+
+
+class LawIngestor:
+    def __init__(self, workspace_id: str, shared_key: str, endpoint: str = "",
+                 log_type: str = LOG_TYPE, max_batch_bytes: int = MAX_POST_BYTES,
+                 flush_secs: float = 5.0, gzip_body: bool = True, max_retries: int = 6,
+                 max_queue: int = MAX_QUEUE):
+        self.enabled         = bool(workspace_id and shared_key)
+        self.workspace_id    = workspace_id
+        self.shared_key      = shared_key
+        self.log_type        = log_type
+        self.max_batch_bytes = min(max_batch_bytes, MAX_POST_BYTES)
+        self.flush_secs      = flush_secs
+        self.gzip_body       = gzip_body
+        self.max_retries     = max_retries
+
+        url             = urllib.parse.urlsplit(endpoint or f"https://{workspace_id}.ods.opinsights.azure.com")
+        self._scheme    = url.scheme
+        self._netloc    = url.netloc
+        self._conn      = None
+        self._queue     = queue.Queue(maxsize=max_queue)
+        self._thread    = threading.Thread(target=self._run, name="law-ingest", daemon=True)
+        self._lock      = threading.Lock()
+        self._latencies = []   # seconds from submit() to accepted POST, one per batch (oldest record)
+        self.counters   = {"sent_records": 0, "sent_batches": 0, "dropped_records": 0,
+                           "overflow_records": 0, "retries": 0, "sent_bytes": 0}
+
+    # ── producer side ────────────────────────────────────────
+    def start(self):
+        if self.enabled:
+            self._thread.start()
+        return self
+
+    def submit(self, record: dict):
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait((time.monotonic(), record))
+        except queue.Full:
+            with self._lock:
+                self.counters["overflow_records"] += 1
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self._latencies)
+            out = dict(self.counters, queue_depth=self.queue_depth)
+        if lat:
+            out["ingest_latency_p50_s"] = round(lat[len(lat) // 2], 3)
+            out["ingest_latency_max_s"] = round(lat[-1], 3)
+        return out
+
+    def close(self, timeout: float = 120):
+        """Flush everything queued so far and stop the background thread."""
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put((time.monotonic(), _STOP), timeout=timeout)
+        except queue.Full:
+            print("  ✗ LAW queue still full at close; not waiting for it to drain")
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        if self._conn:
+            self._conn.close()
+        print(f"  → Log Analytics: {self.stats()}")
+
+    # ── consumer side ────────────────────────────────────────
+    def _run(self):
+        batch, size, oldest, deadline = [], 2, None, None
+        while True:
+            try:
+                wait        = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ts, record  = self._queue.get(timeout=wait)
+            except queue.Empty:
+                self._flush(batch, oldest)
+                batch, size, oldest, deadline = [], 2, None, None
+                continue
+
+            if record is _STOP:
+                break
+            try:
+                data = json.dumps(record, separators=(",", ":")).encode("utf-8")
+            except Exception as e:
+                with self._lock:
+                    self.counters["dropped_records"] += 1
+                print(f"  ✗ LAW record not serialisable, dropped: {e!r}")
+                continue
+            if batch and size + len(data) + 1 > self.max_batch_bytes:
+                self._flush(batch, oldest)
+                batch, size, oldest, deadline = [], 2, None, None
+            if not batch:
+                oldest, deadline = ts, time.monotonic() + self.flush_secs
+            batch.append(data)
+            size += len(data) + 1
+
+        if batch:
+            self._flush(batch, oldest)
+
+    def _flush(self, batch: list, oldest: float):
+        """_send() that never takes the thread down: anything unexpected drops the batch."""
+        try:
+            self._send(batch, oldest)
+        except Exception as e:
+            with self._lock:
+                self.counters["dropped_records"] += len(batch)
+            print(f"  ✗ LAW ingest error: {e!r}; dropped {len(batch)} records")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            cls        = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(self._netloc, timeout=30)
+        return self._conn
+
+    def _post(self, body: bytes, gzipped: bool) -> tuple:
+        """One POST on the persistent connection → (status, retry_after_secs or None)."""
+        date    = datetime.datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
+        headers = {
+            "Content-Type":  "application/json",
+            "Authorization": signature(self.workspace_id, self.shared_key, date, len(body)),
+            "Log-Type":      self.log_type,
+            "x-ms-date":     date,
+        }
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        conn = self._connection()
+        try:
+            conn.request("POST", API_PATH, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        except Exception:
+            conn.close()
+            self._conn = None
+            raise
+        retry_after = resp.getheader("Retry-After")
+        return resp.status, float(retry_after) if retry_after and retry_after.isdigit() else None
+
+    def _send(self, batch: list, oldest: float):
+        if not batch:
+            return
+        raw = b"[" + b",".join(batch) + b"]"
+        for attempt in range(self.max_retries + 1):
+            gzipped = self.gzip_body
+            body    = gzip.compress(raw, compresslevel=6) if gzipped else raw
+            try:
+                status, retry_after = self._post(body, gzipped)
+            except (OSError, http.client.HTTPException) as e:
+                status, retry_after = None, None
+                print(f"  ✗ LAW connection error: {e}")
+
+            if status is not None and 200 <= status < 300:
+                with self._lock:
+                    self.counters["sent_records"] += len(batch)
+                    self.counters["sent_batches"] += 1
+                    self.counters["sent_bytes"]   += len(body)
+                    self._latencies.append(time.monotonic() - oldest)
+                return
+            if gzipped and status in (400, 415):
+                # Endpoint does not take compressed bodies; send plain from now on.
+                print(f"  ✗ LAW rejected gzip body (HTTP {status}); disabling compression")
+                self.gzip_body = False
+                continue
+            if status is not None and status not in RETRY_STATUSES:
+                break
+            if attempt < self.max_retries:
+                with self._lock:
+                    self.counters["retries"] += 1
+                time.sleep(retry_after or min(60.0, 2 ** attempt) * random.uniform(0.5, 1.5))
+
+        with self._lock:
+            self.counters["dropped_records"] += len(batch)
+        print(f"  ✗ LAW ingest failed (HTTP {status}); dropped {len(batch)} records")
@@ -0,0 +1,88 @@
+"""
+shared/law_stub.py
+Local stand-in for the Log Analytics Data Collector endpoint, so the
+ingestion path in shared/law.py can be exercised offline.
+
+  PYTHONPATH=runners python3 -m shared.law_stub --port 8088 --throttle-every 5
+  LAW_ENDPOINT=http://127.0.0.1:8088 LAW_WORKSPACE_ID=stub \
+  LAW_SHARED_KEY=$(echo -n stub | base64) PYTHONPATH=runners python3 runners/curl-runner/run.py
+
+Checks the SharedKey signature, accepts gzip or plain JSON arrays, and can
+inject 429 / 503 answers to exercise the retry path. Accepted records are
+optionally appended to an NDJSON file.
+"""
+
+import argparse, base64, gzip, json, random, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from shared.law import signature
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "law-stub"
+    protocol_version = "HTTP/1.1"    # keep-alive, like the real endpoint
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def reply(self, code: int, headers: dict = None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        cfg  = self.server.cfg
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with cfg["lock"]:
+            cfg["posts"] += 1
+            n = cfg["posts"]
+
+        if cfg["throttle_every"] and n % cfg["throttle_every"] == 0:
+            return self.reply(429, {"Retry-After": "1"})
+        if random.random() < cfg["fail_rate"]:
+            return self.reply(503)
+
+        expected = signature(cfg["workspace_id"], cfg["shared_key"],
+                             self.headers.get("x-ms-date", ""), len(body))
+        if self.headers.get("Authorization") != expected:
+            return self.reply(403)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        try:
+            records = json.loads(body)
+        except ValueError:
+            return self.reply(400)
+
+        with cfg["lock"]:
+            cfg["records"] += len(records)
+            if cfg["out"]:
+                with open(cfg["out"], "a") as f:
+                    f.writelines(json.dumps(r) + "\n" for r in records)
+        print(f"[law-stub] POST #{n}: {len(records)} records  "
+              f"({len(body) // 1024}KB, {self.headers.get('Content-Encoding', 'identity')})  "
+              f"total={cfg['records']}")
+        self.reply(200)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8088)
+    ap.add_argument("--workspace-id", default="stub")
+    ap.add_argument("--shared-key", default=base64.b64encode(b"stub").decode())
+    ap.add_argument("--throttle-every", type=int, default=0, help="answer every Nth POST with 429")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of POSTs answered with 503")
+    ap.add_argument("--out", default="", help="append accepted records to this NDJSON file")
+    args = ap.parse_args()
+
+    srv     = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    srv.cfg = {"workspace_id": args.workspace_id, "shared_key": args.shared_key,
+               "throttle_every": args.throttle_every, "fail_rate": args.fail_rate,
+               "out": args.out, "posts": 0, "records": 0, "lock": threading.Lock()}
+    print(f"[law-stub] listening on http://127.0.0.1:{args.port}")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+shared/resolve.py
+Per-run DNS pre-resolution. Runs once before the probe fan-out: A and AAAA
+for every target are looked up concurrently on a bounded resolver pool and
+cached for the rest of the run. Probes are then pinned to the cached
+address (curl --resolve, Chrome --host-resolver-rules), so no measured
+duration includes DNS, and cells whose family has no address are recorded
+as "no address" without being probed.
+
+Targets may carry a port ("host:8443"); lookups use the bare host name.
+`overrides` (RESOLVE_OVERRIDES in the runners, JSON {"host": ["addr", ...]})
+answers those names without DNS, which is how the bench/ farm maps its
+synthetic names onto loopback.
+"""
+
+import asyncio, socket, time
+from concurrent.futures import ThreadPoolExecutor
+
+FAMILIES = {
+    "IPv4": socket.AF_INET,
+    "IPv6": socket.AF_INET6,
+}
+NO_ADDRESS_EXIT = 6     # curl: "Could not resolve host"
+
+
+def split_target(target: str) -> tuple:
+    """'example.com' → ('example.com', 443), 'example.com:8443' → ('example.com', 8443)"""
+    host, sep, port = target.rpartition(":")
+    return (host, int(port)) if sep and port.isdigit() else (target, 443)
+
+
+class ResolutionCache:
+    """Answers for one run: (host, ip_label) → ordered, de-duplicated addresses."""
+
+    def __init__(self):
+        self.answers = {}   # (host, ip_label) → [addr, ...]
+        self.errors  = {}   # (host, ip_label) → reason when answers is empty
+        self.millis  = {}   # (host, ip_label) → lookup time
+
+    def addresses(self, host: str, ip_label: str) -> list:
+        return self.answers.get((host, ip_label), [])
+
+    def address(self, host: str, ip_label: str):
+        addrs = self.addresses(host, ip_label)
+        return addrs[0] if addrs else None
+
+    def pinned(self) -> dict:
+        """(host, ip_label) → first address, for every cell that can be probed."""
+        return {key: addrs[0] for key, addrs in self.answers.items() if addrs}
+
+    def no_address_error(self, host: str, ip_label: str) -> str:
+        return f"no address: {self.errors.get((host, ip_label), 'not resolved')}"
+
+    def summary(self) -> str:
+        parts = []
+        for ip_label in FAMILIES:
+            keys = [k for k in self.answers if k[1] == ip_label]
+            ok   = sum(1 for k in keys if self.answers[k])
+            parts.append(f"{ip_label} {ok}/{len(keys)}")
+        return "  ".join(parts)
+
+
+def _override(host: str, ip_label: str, addrs: list, cache: ResolutionCache):
+    fam = [a for a in addrs if (":" in a) == (ip_label == "IPv6")]
+    cache.answers[(host, ip_label)] = fam
+    cache.millis[(host, ip_label)]  = 0.0
+    if not fam:
+        cache.errors[(host, ip_label)] = f"no {'AAAA' if ip_label == 'IPv6' else 'A'} record (override)"
+
+
+async def _lookup(host: str, ip_label: str, cache: ResolutionCache, sem: asyncio.Semaphore):
+    loop = asyncio.get_running_loop()
+    async with sem:
+        t0 = time.monotonic()          # after the pool slot: DnsMs is the lookup alone
+        try:
+            infos = await loop.getaddrinfo(split_target(host)[0], None,
+                                           family=FAMILIES[ip_label], type=socket.SOCK_STREAM)
+            addrs = list(dict.fromkeys(info[4][0] for info in infos))
+        except socket.gaierror as e:
+            addrs = []
+            cache.errors[(host, ip_label)] = (
+                f"no {'AAAA' if ip_label == 'IPv6' else 'A'} record"
+                if e.errno in (socket.EAI_NODATA, socket.EAI_ADDRFAMILY)
+                else e.strerror or str(e)
+            )
+        except (OSError, ValueError) as e:     # UnicodeError: malformed name (IDNA label too long)
+            addrs = []
+            cache.errors[(host, ip_label)] = f"lookup failed: {e}"
+    cache.answers[(host, ip_label)] = addrs
+    cache.millis[(host, ip_label)]  = (time.monotonic() - t0) * 1000
+
+
+async def _resolve_all(hosts: list, workers: int, overrides: dict) -> ResolutionCache:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolver"))
+    cache   = ResolutionCache()
+    sem     = asyncio.Semaphore(workers)
+    lookups = []
+    for host in dict.fromkeys(hosts):
+        for ip_label in FAMILIES:
+            if split_target(host)[0] in overrides:
+                _override(host, ip_label, overrides[split_target(host)[0]], cache)
+            else:
+                lookups.append(_lookup(host, ip_label, cache, sem))
+    await asyncio.gather(*lookups)
+    return cache
+
+
+def resolve_all(hosts: list, workers: int = 32, overrides: dict = None) -> ResolutionCache:
+    """Resolve A + AAAA for every host, `workers` getaddrinfo() calls at a time."""
+    return asyncio.run(_resolve_all(hosts, workers, overrides or {}))
+
+
+def curl_resolve(target: str, addr: str) -> str:
+    """Value for curl --resolve; the port comes from the target (default 443)."""
+    host, port = split_target(target)
+    return f"{host}:{port}:[{addr}]" if ":" in addr else f"{host}:{port}:{addr}"
+
+
+def chrome_rule(target: str, addr: str) -> str:
+    """One entry for Chrome --host-resolver-rules (host only; Chrome keeps the URL's port)."""
+    host = split_target(target)[0]
+    return f"MAP {host} [{addr}]" if ":" in addr else f"MAP {host} {addr}"
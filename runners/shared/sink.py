@@ -0,0 +1,100 @@
+"""
+shared/sink.py
+Streaming result sink. Records are serialised as compact NDJSON as soon as
+a probe finishes and appended to an append blob in fixed-size chunks, so
+memory stays flat and a container that dies mid-run still leaves every
+chunk flushed so far in test-results/{run_id}/{ts}-{runner}.ndjson.
+
+write() only buffers; a background thread does the append_block calls, so
+a slow or retrying blob endpoint never stalls the probe threads (or the
+asyncio loop of the native / scan engines). It flushes once `chunk_bytes`
+are buffered or every `flush_secs`; close() waits for the final flush.
+
+With `local_dir` (RESULTS_DIR in the runners) every record is also written
+to {local_dir}/{run_id}/{ts}-{runner}.ndjson, with or without a storage
+account; bench/ reads its numbers from there.
+"""
+
+import datetime, json, os, threading
+
+RESULTS_CONTAINER = "test-results"
+MAX_APPEND_BLOCK  = 4 * 1024 * 1024    # Append Block size limit
+
+
+class ResultSink:
+    def __init__(self, conn_str: str, run_id: str, runner: str,
+                 chunk_bytes: int = 1024 * 1024, flush_secs: float = 30, local_dir: str = ""):
+        ts               = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        self.blob_name   = f"{run_id}/{ts}-{runner}.ndjson"
+        self.chunk_bytes = min(chunk_bytes, MAX_APPEND_BLOCK)
+        self.flush_secs  = flush_secs
+        self.records     = 0
+        self.bytes_sent  = 0
+        self._buf        = bytearray()    # written, not yet taken by the flusher
+        self._pending    = bytearray()    # flusher's own: taken, not yet appended
+        self._lock       = threading.Lock()
+        self._wake       = threading.Event()
+        self._closing    = False
+        self._thread     = None
+        self._blob       = None
+        self._file       = None
+        if local_dir:
+            self.local_path = os.path.join(local_dir, self.blob_name)
+            os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+            self._file = open(self.local_path, "ab")
+        if conn_str:
+            from azure.storage.blob import BlobServiceClient
+            client     = BlobServiceClient.from_connection_string(conn_str)
+            self._blob = client.get_blob_client(container=RESULTS_CONTAINER, blob=self.blob_name)
+            self._blob.create_append_blob()
+            self._thread = threading.Thread(target=self._run, name="sink-flush", daemon=True)
+            self._thread.start()
+            print(f"  → Streaming results to blob: {RESULTS_CONTAINER}/{self.blob_name}")
+
+    def write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            self.records += 1
+            if self._file:
+                self._file.write(line)
+            if self._blob:
+                self._buf += line
+                if len(self._buf) >= self.chunk_bytes:
+                    self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_secs)
+            self._wake.clear()
+            closing = self._closing
+            self._flush()
+            if closing:
+                return
+
+    def _flush(self):
+        with self._lock:
+            self._pending += self._buf
+            self._buf.clear()
+        while self._pending:
+            block = bytes(self._pending[:MAX_APPEND_BLOCK])
+            try:
+                self._blob.append_block(block)
+            except Exception as e:
+                # Keep the data; the next flush (or close) retries it.
+                print(f"  ✗ Blob append failed ({len(self._pending)} bytes pending): {e}")
+                return
+            del self._pending[:len(block)]
+            self.bytes_sent += len(block)
+
+    def close(self):
+        if self._thread:
+            self._closing = True
+            self._wake.set()
+            self._thread.join()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                print(f"  → Wrote {self.records} records to {self.local_path}")
+        if self._blob:
+            print(f"  → Streamed {self.records} records ({self.bytes_sent // 1024}KB) "
+                  f"to blob: {RESULTS_CONTAINER}/{self.blob_name}")
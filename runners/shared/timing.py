@@ -0,0 +1,31 @@
+"""
+shared/timing.py
+Phase breakdown of a probe: how its time splits into DNS, TCP connect,
+TLS handshake and time to first byte, reported as the numeric columns
+DnsMs, TcpMs, TlsMs and TtfbMs.
+
+Engines capture cumulative offsets from the start of the probe, like
+curl's time_namelookup / time_connect / time_appconnect /
+time_starttransfer, and phase_fields() turns them into per-phase deltas.
+A phase that was never reached (offset 0) is reported as 0.
+
+Probes are pinned to pre-resolved addresses (shared/resolve.py), so the
+runners overwrite DnsMs with the lookup time from the resolution stage.
+"""
+
+PHASES = ("DnsMs", "TcpMs", "TlsMs", "TtfbMs")
+
+
+def phase_fields(namelookup: float = 0, connect: float = 0, appconnect: float = 0,
+                 starttransfer: float = 0) -> dict:
+    """Cumulative offsets in ms → {DnsMs, TcpMs, TlsMs, TtfbMs}."""
+    fields, prev = {}, 0.0
+    for name, mark in zip(PHASES, (namelookup, connect, appconnect, starttransfer)):
+        fields[name] = round(max(0.0, float(mark - prev)), 2) if mark else 0.0
+        prev         = mark or prev
+    return fields
+
+
+def from_marks(t0: float, marks: dict) -> dict:
+    """time.monotonic() stamps keyed by curl timer name (without "time_") → phase_fields()."""
+    return phase_fields(**{name: (ts - t0) * 1000 for name, ts in marks.items()})
@@ -11,12 +11,21 @@
 #   1.  Start (allocate) capture VM
 #   2.  Inject env → start capture-agent service
 #   3.  Signal capture-agent START
-#   3b. Create ACI containers → discover NIC IDs → attach TAP
+#   3b. Create ACI containers → register their IPs with capture-agent
+#       → discover NIC IDs → attach TAP
 #   4.  Wait for ACI runners to complete
 #   5.  Signal capture-agent STOP
 #   6.  Poll until VM phase=done (upload + webhook complete)
 #   6b. Detach TAP from NICs
 #   7.  Deallocate VM + delete ACI containers
+#
+# --netlog: chrome-runner records Chrome NetLog TLS summaries
+# (CHROME_NETLOG=1). With --runner chrome that replaces packet
+# capture, so steps 1–3, 5, 6 and the TAP attach/detach are skipped.
+#
+# --handshake-only: capture-agent keeps each TCP direction only up to
+# the first TLS application-data record; later packets are cut to
+# their headers (capture_mode "handshake").
 # ============================================================
 set -euo pipefail
 
@@ -37,18 +46,26 @@ set -euo pipefail
 
 RUNNER="both"
 TARGETS_FILE="targets.json"
+NETLOG=0
+CAPTURE_MODE="full"
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
     --targets) TARGETS_FILE="$2"; shift 2 ;;
     --runner)  RUNNER="$2";       shift 2 ;;
+    --netlog)  NETLOG=1;          shift ;;
+    --handshake-only) CAPTURE_MODE="handshake"; shift ;;
     *) echo "Unknown: $1"; exit 1 ;;
   esac
 done
 
 TARGETS_JSON=$(cat "$TARGETS_FILE")
+CAPTURE=1
+[[ "$NETLOG" == 1 && "$RUNNER" == "chrome" ]] && CAPTURE=0
 RUN_ID=$(python3 -c "import uuid; print(str(uuid.uuid4())[:8])")
 CAPTURE_AGENT_URL="http://${CAPTURE_VM_PUBLIC_IP}:9000"
+# Runners reach the agent inside the VNet and register themselves at startup
+RUNNER_CAPTURE_URL="http://${CAPTURE_VM_PRIVATE_IP:-10.10.2.4}:9000"
 ATTACHED_NICS=()   # track TAP-attached NIC IDs for cleanup
 
 log()     { echo "$(date -u +%H:%M:%SZ) $*"; }
@@ -82,6 +99,19 @@ detach_tap_from_nics() {
   done
 }
 
+# capture-agent routes both directions of a container's traffic by its IP
+register_runner() {
+  local name=$1 runner=$2 ip
+  ip=$(az container show -g "$RESOURCE_GROUP" -n "$name" --query "ipAddress.ip" -o tsv 2>/dev/null || true)
+  if [[ -z "$ip" ]]; then
+    log "  WARN: no IP for $name yet, relying on the runner's own registration"
+    return 0
+  fi
+  http_post "${CAPTURE_AGENT_URL}/register" "{\"runner\":\"${runner}\",\"ips\":[\"${ip}\"]}" >/dev/null \
+    && log "  [capture] registered $runner → $ip" \
+    || log "  WARN: capture-agent /register failed for $runner"
+}
+
 get_aci_nic_id() {
   # ACI containers in a VNet get a NIC in the runner subnet.
   # We find it by filtering NICs in the RG that have the container group name tag.
@@ -100,8 +130,10 @@ teardown() {
   for suffix in "curl-${RUN_ID}" "chrome-${RUN_ID}"; do
     az container delete -g "$RESOURCE_GROUP" -n "aci-${suffix}" --yes --output none 2>/dev/null || true
   done
-  log "[teardown] Deallocating VM..."
-  az vm deallocate -g "$RESOURCE_GROUP" -n "$CAPTURE_VM_NAME" --no-wait 2>/dev/null || true
+  if [[ "$CAPTURE" == 1 ]]; then
+    log "[teardown] Deallocating VM..."
+    az vm deallocate -g "$RESOURCE_GROUP" -n "$CAPTURE_VM_NAME" --no-wait 2>/dev/null || true
+  fi
 }
 trap teardown ERR
 
@@ -116,6 +148,7 @@ create_aci() {
     "LAW_WORKSPACE_ID=${LAW_WORKSPACE_ID}"
     "LAW_SHARED_KEY=${LAW_SHARED_KEY}"
   )
+  [[ "$CAPTURE" == 1 ]] && base_envs+=("CAPTURE_AGENT_URL=${RUNNER_CAPTURE_URL}")
   local all_envs=("${base_envs[@]}" "${extra_envs[@]}")
   local env_args=""
   for e in "${all_envs[@]}"; do env_args+=" --environment-variables $e"; done
@@ -146,8 +179,10 @@ wait_aci() {
 log "══════════════════════════════════════════════════"
 log "  TLS Regression Run    RUN_ID=${RUN_ID}"
 log "  Runner: ${RUNNER}"
+[[ "$CAPTURE" == 0 ]] && log "  Capture: Chrome NetLog only (capture VM not started)"
 log "══════════════════════════════════════════════════"
 
+if [[ "$CAPTURE" == 1 ]]; then
 # ── 1. Start capture VM ───────────────────────────────────────
 log "[1/7] Starting capture VM: $CAPTURE_VM_NAME"
 az vm start -g "$RESOURCE_GROUP" -n "$CAPTURE_VM_NAME"
@@ -166,6 +201,10 @@ STORAGE_ACCOUNT_NAME=${STORAGE_ACCOUNT_NAME}
 OFFSITE_WEBHOOK_URL=${OFFSITE_WEBHOOK_URL}
 RUNNER_SUBNET=10.10.1.0/24
 CAPTURE_IFACE=vxlan0
+CAPTURE_COMPRESSION=${CAPTURE_COMPRESSION:-gzip}
+CAPTURE_COMPRESSION_LEVEL=${CAPTURE_COMPRESSION_LEVEL:-}
+CAPTURE_SEGMENT_MB=${CAPTURE_SEGMENT_MB:-256}
+CAPTURE_SEGMENT_SECS=${CAPTURE_SEGMENT_SECS:-300}
 ENVEOF
     chmod 600 /opt/capture/capture-agent.env
     systemctl restart capture-agent
@@ -179,8 +218,9 @@ RUNNERS_ARG='["curl","chrome"]'
 [[ "$RUNNER" == "curl"   ]] && RUNNERS_ARG='["curl"]'
 [[ "$RUNNER" == "chrome" ]] && RUNNERS_ARG='["chrome"]'
 http_post "${CAPTURE_AGENT_URL}/start" \
-  "{\"run_id\":\"${RUN_ID}\",\"runners\":${RUNNERS_ARG}}" \
+  "{\"run_id\":\"${RUN_ID}\",\"runners\":${RUNNERS_ARG},\"capture_mode\":\"${CAPTURE_MODE}\"}" \
   || die "capture-agent unreachable"
+fi
 
 # ── 3b. Create ACI containers + attach TAP ───────────────────
 log "[3b/7] Creating ACI containers and attaching VNet TAP"
@@ -188,19 +228,26 @@ log "[3b/7] Creating ACI containers and attaching VNet TAP"
 if [[ "$RUNNER" == "curl" || "$RUNNER" == "both" ]]; then
   create_aci "aci-curl-${RUN_ID}" \
     "${ACR_LOGIN_SERVER}/curl-runner:latest" 2 4
+  register_runner "aci-curl-${RUN_ID}" curl
   # TAP must be attached after NIC is created (NIC exists once container starts)
   sleep 15
   NIC_ID=$(get_aci_nic_id "aci-curl-${RUN_ID}")
   [[ -n "$NIC_ID" ]] && attach_tap_to_nic "$NIC_ID" || log "  WARN: could not find NIC for curl runner"
 fi
 
+CHROME_ENVS=("CHROME_WORKERS=4" "CHROME_WORKERS_MAX=12")
+[[ "$NETLOG" == 1 ]] && CHROME_ENVS+=("CHROME_NETLOG=1")
+
 if [[ "$RUNNER" == "chrome" || "$RUNNER" == "both" ]]; then
   create_aci "aci-chrome-${RUN_ID}" \
     "${ACR_LOGIN_SERVER}/chrome-runner:latest" 4 8 \
-    "CHROME_WORKERS=4"
-  sleep 15
-  NIC_ID=$(get_aci_nic_id "aci-chrome-${RUN_ID}")
-  [[ -n "$NIC_ID" ]] && attach_tap_to_nic "$NIC_ID" || log "  WARN: could not find NIC for chrome runner"
+    "${CHROME_ENVS[@]}"
+  if [[ "$CAPTURE" == 1 ]]; then
+    register_runner "aci-chrome-${RUN_ID}" chrome
+    sleep 15
+    NIC_ID=$(get_aci_nic_id "aci-chrome-${RUN_ID}")
+    [[ -n "$NIC_ID" ]] && attach_tap_to_nic "$NIC_ID" || log "  WARN: could not find NIC for chrome runner"
+  fi
 fi
 
 # ── 4. Wait for ACI runners ───────────────────────────────────
@@ -209,6 +256,7 @@ log "[4/7] Waiting for ACI runners to complete"
 [[ "$RUNNER" == "chrome" || "$RUNNER" == "both" ]] && wait_aci "aci-chrome-${RUN_ID}" &
 wait
 
+if [[ "$CAPTURE" == 1 ]]; then
 # ── 5. Stop capture ───────────────────────────────────────────
 log "[5/7] Stopping packet capture"
 http_post "${CAPTURE_AGENT_URL}/stop" "{\"run_id\":\"${RUN_ID}\"}" \
@@ -229,6 +277,7 @@ done
 # ── 6b. Detach TAP from all NICs ─────────────────────────────
 log "[6b/7] Detaching VNet TAP from runner NICs"
 detach_tap_from_nics
+fi
 
 # ── 7. Cleanup ────────────────────────────────────────────────
 log "[7/7] Cleaning up resources"
@@ -236,13 +285,17 @@ for suffix in "curl-${RUN_ID}" "chrome-${RUN_ID}"; do
   az container delete -g "$RESOURCE_GROUP" -n "aci-${suffix}" \
     --yes --output none 2>/dev/null || true
 done
-az vm deallocate -g "$RESOURCE_GROUP" -n "$CAPTURE_VM_NAME" --no-wait
+[[ "$CAPTURE" == 1 ]] && az vm deallocate -g "$RESOURCE_GROUP" -n "$CAPTURE_VM_NAME" --no-wait
 
 log ""
 log "══════════════════════════════════════════════════"
 log "  Run complete"
 log "  RUN_ID  : $RUN_ID"
-log "  PCAPs   : pcap-staging/${RUN_ID}/ (24h TTL)"
-log "  Webhook : $OFFSITE_WEBHOOK_URL notified"
+if [[ "$CAPTURE" == 1 ]]; then
+  log "  PCAPs   : pcap-staging/${RUN_ID}/ (24h TTL)"
+  log "  Webhook : $OFFSITE_WEBHOOK_URL notified"
+else
+  log "  NetLog  : test-results/${RUN_ID}/*-chrome-netlog.ndjson"
+fi
 log "  Cost    : VM + ACI now deallocating"
 log "══════════════════════════════════════════════════"
\ No newline at end of file